@@ -0,0 +1,166 @@
+"""Full-text search over the annotations of the whole dataset (Ctrl+F).
+
+Questions, queries, answers and bbox labels live in the FTS5 table of the
+dataset index (see :mod:`dataset_index`), which the UI refreshes whenever a
+file is saved, so a search is one indexed query instead of a scan of every
+JSON file.  Queries run on the reviewer's worker threads with their own
+SQLite connection; results open directly at the matching annotation.
+"""
+from __future__ import annotations
+
+import tkinter as tk
+from pathlib import Path
+from tkinter import ttk
+from typing import Any, List, Optional, Tuple
+
+from dataset_index import DatasetIndex, QueueItem
+
+SEARCH_DELAY_MS = 200  # 停止输入后再查询
+SEARCH_LIMIT = 200
+
+
+class AnnotationSearch:
+    """Toplevel window with a search box and a result list; Return / double-click opens a result."""
+
+    def __init__(self, reviewer: Any, index_path: Path, output_root: Path) -> None:
+        self.reviewer = reviewer
+        self.index_path = Path(index_path)
+        self.output_root = Path(output_root)
+        self.results: List[Tuple[QueueItem, Optional[str], str]] = []
+        self.ready = False  # 索引更新完成前不查询
+        self.generation = 0
+        self.after_id = None
+
+        self.window = tk.Toplevel(reviewer.root)
+        self.window.title("Search Annotations")
+        self.window.geometry("1000x600")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        top = ttk.Frame(self.window)
+        top.pack(fill=tk.X, padx=10, pady=8)
+        self.entry = ttk.Entry(top, font=('Arial', 14))
+        self.entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.entry.bind("<KeyRelease>", self.schedule_search)
+        self.entry.bind("<Return>", lambda e: self.open_selected())
+        self.entry.bind("<Down>", lambda e: self.move_selection(1))
+        self.entry.bind("<Up>", lambda e: self.move_selection(-1))
+        self.status_label = ttk.Label(top, text="Updating index...", font=('Arial', 12))
+        self.status_label.pack(side=tk.LEFT, padx=10)
+
+        body = ttk.Frame(self.window)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        self.listbox = tk.Listbox(body, font=('Arial', 12), activestyle='dotbox', exportselection=False)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.listbox.yview)
+        self.listbox.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.listbox.bind("<Double-Button-1>", lambda e: self.open_selected())
+        self.listbox.bind("<Return>", lambda e: self.open_selected())
+        ttk.Label(self.window, text='多个词需同时出现；"引号内" 按短语匹配；最后一个词按前缀匹配',
+                  font=('Arial', 11)).pack(pady=(0, 8))
+
+        self.entry.focus_set()
+        self.reviewer.run_in_background(self.update_index, on_done=self.index_updated)
+
+    def update_index(self) -> None:
+        """后台线程：等待排队的写入落盘后增量更新索引"""
+        self.reviewer.save_queue.flush()
+        index = DatasetIndex(self.index_path)
+        try:
+            if not index.has_text:
+                raise RuntimeError("SQLite 不支持 FTS5，无法全文搜索")
+            index.build(self.output_root)
+        finally:
+            index.close()
+
+    def index_updated(self, future: Any) -> None:
+        if not self.window.winfo_exists():
+            return
+        try:
+            future.result()
+        except Exception as exc:
+            self.status_label.config(text=f"Index error: {exc}")
+            return
+        self.ready = True
+        self.status_label.config(text="")
+        self.search()
+
+    def focus(self) -> None:
+        self.window.deiconify()
+        self.window.lift()
+        self.entry.focus_set()
+        self.entry.select_range(0, tk.END)
+
+    def schedule_search(self, event: Any = None) -> None:
+        if event is not None and event.keysym in ("Return", "Up", "Down"):
+            return
+        if self.after_id:
+            self.window.after_cancel(self.after_id)
+        self.after_id = self.window.after(SEARCH_DELAY_MS, self.search)
+
+    def search(self) -> None:
+        self.after_id = None
+        if not self.ready:
+            return
+        text = self.entry.get()
+        self.generation += 1
+        generation = self.generation
+        if not text.strip():
+            self.show_results([], "")
+            return
+
+        def done(future: Any) -> None:
+            # 只显示最近一次输入的结果
+            if generation != self.generation or not self.window.winfo_exists():
+                return
+            try:
+                results = future.result()
+            except Exception as exc:
+                self.show_results([], f"Search error: {exc}")
+                return
+            more = "+" if len(results) >= SEARCH_LIMIT else ""
+            self.show_results(results, f"{len(results)}{more} matches")
+
+        self.reviewer.run_in_background(self.query, text, on_done=done)
+
+    def query(self, text: str) -> List[Tuple[QueueItem, Optional[str], str]]:
+        """后台线程：SQLite连接不跨线程，每次查询使用独立连接"""
+        index = DatasetIndex(self.index_path)
+        try:
+            return index.search(text, SEARCH_LIMIT)
+        finally:
+            index.close()
+
+    def show_results(self, results: List[Tuple[QueueItem, Optional[str], str]], status: str) -> None:
+        self.results = results
+        self.listbox.delete(0, tk.END)
+        for ((sport, event, data_type, media_id), idx), task, snippet in results:
+            snippet = " ".join(snippet.split())
+            self.listbox.insert(tk.END, f"{sport}/{event}/{data_type}/{media_id} #{idx + 1}  [{task or '-'}]  {snippet}")
+        if results:
+            self.listbox.selection_set(0)
+        self.status_label.config(text=status)
+
+    def move_selection(self, step: int) -> str:
+        if not self.results:
+            return "break"
+        selection = self.listbox.curselection()
+        pos = min(max((selection[0] + step) if selection else 0, 0), len(self.results) - 1)
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(pos)
+        self.listbox.see(pos)
+        return "break"
+
+    def open_selected(self) -> None:
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        target, index = self.results[selection[0]][0]
+        self.reviewer.open_annotation(target, index)
+
+    def close(self) -> None:
+        if self.after_id:
+            self.window.after_cancel(self.after_id)
+            self.after_id = None
+        self.generation += 1
+        self.window.destroy()
@@ -0,0 +1,216 @@
+"""Pure helpers shared by the review UI and the batch tools (no Tk / OpenCV imports)."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def build_old_lookup(old_annotations: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Group reviewed old annotations by task_L2 for repeated matching.
+
+    Each task entry keeps the candidates in file order plus first-occurrence
+    maps by annotation_id and stripped question, mirroring the linear scan
+    the T key used to perform.
+    """
+    lookup: Dict[str, Dict[str, Any]] = {}
+    for ann in old_annotations:
+        if not isinstance(ann, dict) or not ann.get("reviewed", False):
+            continue
+        task = ann.get("task_L2")
+        if not task:
+            continue
+        entry = lookup.setdefault(task, {"first": ann, "by_id": {}, "by_question": {}})
+        ann_id = ann.get("annotation_id")
+        if ann_id is not None:
+            entry["by_id"].setdefault(ann_id, ann)
+        question = str(ann.get("question", "")).strip()
+        if question:
+            entry["by_question"].setdefault(question, ann)
+    return lookup
+
+
+def match_old_annotation(
+    annotation: Dict[str, Any],
+    lookup: Dict[str, Dict[str, Any]],
+    fallback: bool = True,
+) -> Optional[Dict[str, Any]]:
+    """Return the old annotation for ``annotation``: same task, then id, then question, then first.
+
+    ``fallback=False`` skips the last step, for callers that need a real
+    counterpart rather than the T key's best guess.
+    """
+    entry = lookup.get(annotation.get("task_L2"))
+    if not entry:
+        return None
+    target_id = annotation.get("annotation_id")
+    if target_id is not None and target_id in entry["by_id"]:
+        return entry["by_id"][target_id]
+    target_question = str(annotation.get("question", "")).strip()
+    if target_question and target_question in entry["by_question"]:
+        return entry["by_question"][target_question]
+    return entry["first"] if fallback else None
+
+
+def match_old_annotations(
+    annotations: List[Dict[str, Any]],
+    old_annotations: Optional[List[Dict[str, Any]]] = None,
+    lookup: Optional[Dict[str, Dict[str, Any]]] = None,
+    fallback: bool = True,
+) -> Dict[int, Dict[str, Any]]:
+    """Match every annotation of a file against its old counterpart, keyed by index.
+
+    Pass ``lookup`` (from :func:`build_old_lookup`) instead of
+    ``old_annotations`` when it is already built; ``fallback`` is passed to
+    :func:`match_old_annotation`.
+    """
+    if lookup is None:
+        lookup = build_old_lookup(old_annotations) if old_annotations else {}
+    if not annotations or not lookup:
+        return {}
+    matches: Dict[int, Dict[str, Any]] = {}
+    for idx, ann in enumerate(annotations):
+        match = match_old_annotation(ann, lookup, fallback)
+        if match is not None:
+            matches[idx] = match
+    return matches
+
+
+def parse_window(window: Any) -> Optional[Tuple[int, int]]:
+    """Parse one A_window_frame entry (``"start-end"`` string or single frame number)."""
+    if isinstance(window, str) and "-" in window:
+        start, end = window.split("-", 1)
+        return int(start), int(end)
+    if isinstance(window, (int, float)) and not isinstance(window, bool):
+        return int(window), int(window)
+    return None
+
+
+def annotation_window_start(annotation: Dict[str, Any]) -> int:
+    """Frame where review playback of ``annotation`` starts: Q window, else the first A window."""
+    if "Q_window_frame" in annotation:
+        return int(annotation["Q_window_frame"][0])
+    a_windows = annotation.get("A_window_frame")
+    if isinstance(a_windows, list) and a_windows:
+        window = parse_window(a_windows[0])
+        if window is not None:
+            return window[0]
+    return 0
+
+
+def window_frames(annotation: Dict[str, Any]) -> List[Tuple[int, str]]:
+    """Key frames of the Q/A windows in W-key order: ``[(frame, "Q_BEGIN"), (frame, "A1_END"), ...]``.
+
+    Raises ``ValueError``/``TypeError`` on a malformed window; batch tools
+    report those per annotation.
+    """
+    frames: List[Tuple[int, str]] = []
+    if "Q_window_frame" in annotation:
+        start, end = annotation["Q_window_frame"]
+        frames.append((start, "Q_BEGIN"))
+        if start != end:
+            frames.append((end, "Q_END"))
+    a_windows = annotation.get("A_window_frame")
+    if isinstance(a_windows, list):
+        for i, window in enumerate(a_windows):
+            parsed = parse_window(window)
+            if parsed is None:
+                continue
+            start, end = parsed
+            if isinstance(window, str):
+                frames.append((start, f"A{i+1}_BEGIN"))
+                if start != end:
+                    frames.append((end, f"A{i+1}_END"))
+            else:
+                frames.append((start, f"A{i+1}_POINT"))
+    return frames
+
+
+def mot_file_of(annotation: Dict[str, Any]) -> Optional[str]:
+    tracking = annotation.get("tracking_bboxes")
+    if isinstance(tracking, dict) and tracking.get("mot_file"):
+        return str(tracking["mot_file"])
+    return None
+
+
+def parse_mot_file(path: Path) -> Dict[int, List[Tuple[str, int, int, int, int]]]:
+    """Parse a MOTChallenge file into ``{0-based frame: [(track_id, x1, y1, x2, y2), ...]}``."""
+    boxes: Dict[int, List[Tuple[str, int, int, int, int]]] = {}
+    with Path(path).open("r") as handle:
+        for line in handle:
+            parts = line.strip().split(",")
+            if len(parts) < 6:
+                continue
+            frame_id = int(parts[0]) - 1  # MOT frames start at 1
+            x, y, w, h = map(float, parts[2:6])
+            boxes.setdefault(frame_id, []).append((parts[1], int(x), int(y), int(x + w), int(y + h)))
+    return boxes
+
+
+def load_annotation_list(path: Path) -> List[Any]:
+    """``annotations`` of one output JSON file; ``ValueError`` when the file does not hold an annotation object."""
+    with Path(path).open("r", encoding="utf-8") as handle:
+        data = json.load(handle)
+    if not isinstance(data, dict):
+        raise ValueError("top-level JSON value is not an object")
+    annotations = data.get("annotations", [])
+    if not isinstance(annotations, list):
+        raise ValueError("'annotations' is not a list")
+    return annotations
+
+
+def find_media_file(dataset_path: Path, sport: str, event: str, data_type: str, media_id: str) -> Optional[Path]:
+    """Probe ``Dataset/{sport}/{event}/{clips|frames}/{id}.*`` for a supported extension."""
+    extensions = VIDEO_EXTENSIONS if data_type == "clips" else IMAGE_EXTENSIONS
+    for ext in extensions:
+        candidate = Path(dataset_path) / sport / event / data_type / f"{media_id}{ext}"
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def find_clip_files(output_root: Path) -> List[Path]:
+    """``{sport}/{event}/clips/{id}.json`` under ``output_root``, skipping dot directories."""
+    files = [
+        path for path in Path(output_root).glob("*/*/clips/*.json")
+        if not any(part.startswith(".") for part in path.relative_to(output_root).parts)
+    ]
+    return sorted(files)
+
+
+def find_annotation_files(output_root: Path) -> List[Path]:
+    """``{sport}/{event}/{clips|frames}/{id}.json`` under ``output_root``, skipping dot directories."""
+    files = [
+        path
+        for data_type in ("clips", "frames")
+        for path in Path(output_root).glob(f"*/*/{data_type}/*.json")
+        if not any(part.startswith(".") for part in path.relative_to(output_root).parts)
+    ]
+    return sorted(files)
+
+
+def is_box(value: Any) -> bool:
+    return (
+        isinstance(value, (list, tuple))
+        and len(value) == 4
+        and all(isinstance(coord, (int, float)) and not isinstance(coord, bool) for coord in value)
+    )
+
+
+def annotation_boxes(annotation: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """``(field label, box)`` of every static box, in the shapes ``overlays.draw_static_boxes`` accepts."""
+    boxes: List[Tuple[str, Any]] = []
+    if "bounding_box" in annotation:
+        value = annotation["bounding_box"]
+        if is_box(value) or not isinstance(value, list):
+            boxes.append(("bounding_box", value))
+        else:
+            for i, box_info in enumerate(value):
+                box = box_info.get("box") if isinstance(box_info, dict) else box_info
+                boxes.append((f"bounding_box[{i}]", box))
+    if "first_bounding_box" in annotation:
+        boxes.append(("first_bounding_box", annotation["first_bounding_box"]))
+    return boxes
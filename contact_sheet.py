@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""Pre-render one contact sheet per clip annotation for triage before opening the player.
+
+Each sheet tiles the annotation's key frames: the Q/A window BEGIN/END/POINT
+frames (the W-key sequence), the ``first_bounding_box`` frame and a sample of
+its MOT frames, drawn with the same overlays as the player.  Every clip is
+decoded in one forward pass that serves all of its annotations; clips are
+rendered in parallel worker processes.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from annotation_utils import (
+    annotation_window_start,
+    find_clip_files,
+    find_media_file,
+    load_annotation_list,
+    mot_file_of,
+    window_frames,
+)
+from media_loader import load_mot_files
+from overlays import draw_annotation
+from persistence import atomic_write_bytes
+
+SEEK_GAP = 300  # 相邻关键帧相距更远时向前seek，否则顺序grab
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Render contact sheets of clip annotations")
+    parser.add_argument("--output-root", default=Path("../output"), type=Path, help="Root of the annotation output")
+    parser.add_argument("--dataset-root", default=Path("../Dataset"), type=Path, help="Root of the source videos")
+    parser.add_argument(
+        "--sheet-root",
+        default=None,
+        type=Path,
+        help="Where to write the sheets (default: <output-root>/.contact_sheets)",
+    )
+    parser.add_argument("--jobs", default=os.cpu_count() or 1, type=int, help="Clips rendered in parallel")
+    parser.add_argument("--mot-samples", default=4, type=int, help="MOT frames sampled per annotation")
+    parser.add_argument("--tile-width", default=480, type=int, help="Width of one frame tile in pixels")
+    parser.add_argument("--columns", default=4, type=int, help="Tiles per sheet row")
+    parser.add_argument("--force", action="store_true", help="Re-render sheets that are already up to date")
+    return parser.parse_args()
+
+
+def sample_evenly(values: List[int], count: int) -> List[int]:
+    if count <= 0 or not values:
+        return []
+    if len(values) <= count:
+        return list(values)
+    step = (len(values) - 1) / (count - 1) if count > 1 else 0
+    return sorted({values[round(i * step)] for i in range(count)})
+
+
+def key_frames(annotation: Dict[str, Any], mot: Dict[int, Any], mot_samples: int) -> List[Tuple[int, str, bool]]:
+    """``(frame, caption, is_window_marker)`` for one annotation, in display order."""
+    frames = [(frame, label, True) for frame, label in window_frames(annotation)]
+    if "first_bounding_box" in annotation:
+        frames.append((annotation_window_start(annotation), "FIRST_BOX", False))
+    frames.extend((frame, f"MOT {frame}", False) for frame in sample_evenly(sorted(mot), mot_samples))
+    return frames
+
+
+def sheet_path(sheet_root: Path, rel: Path, index: int) -> Path:
+    return sheet_root / rel.parent / f"{rel.stem}_{index:03d}.jpg"
+
+
+def make_tile(frame: Any, annotation: Dict[str, Any], frame_index: int, caption: str, marker: Optional[str],
+              mot_boxes: Any, tile_width: int) -> Any:
+    tile = frame.copy()
+    draw_annotation(tile, annotation, frame_index, mot_boxes, marker)
+    scale = tile_width / tile.shape[1]
+    tile = cv2.resize(tile, (tile_width, max(1, int(tile.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+    cv2.rectangle(tile, (0, tile.shape[0] - 28), (tile_width, tile.shape[0]), (0, 0, 0), -1)
+    cv2.putText(tile, f"{caption} @ {frame_index}", (8, tile.shape[0] - 8),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+    return tile
+
+
+def compose_sheet(tiles: List[Any], header: str, columns: int, tile_width: int) -> Any:
+    tile_height = max(tile.shape[0] for tile in tiles)
+    rows = (len(tiles) + columns - 1) // columns
+    header_height = 40
+    sheet = np.zeros((header_height + rows * tile_height, columns * tile_width, 3), dtype=np.uint8)
+    cv2.putText(sheet, header, (10, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    for pos, tile in enumerate(tiles):
+        y = header_height + (pos // columns) * tile_height
+        x = (pos % columns) * tile_width
+        sheet[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+    return sheet
+
+
+def render_clip(
+    json_path: Path,
+    output_root: Path,
+    dataset_root: Path,
+    sheet_root: Path,
+    mot_samples: int = 4,
+    tile_width: int = 480,
+    columns: int = 4,
+    force: bool = False,
+) -> Tuple[str, int, List[str]]:
+    """Render the sheets of one clip; returns ``(relative json path, sheets written, errors)``."""
+    rel = json_path.relative_to(output_root)
+    sport, event = rel.parts[0], rel.parts[1]
+    errors: List[str] = []
+    try:
+        annotations = load_annotation_list(json_path)
+    except (OSError, ValueError) as exc:
+        return rel.as_posix(), 0, [f"{rel}: {exc}"]
+    video_path = find_media_file(dataset_root, sport, event, "clips", json_path.stem)
+    if video_path is None:
+        return rel.as_posix(), 0, [f"{rel}: video not found"]
+
+    newest_input = max(json_path.stat().st_mtime, video_path.stat().st_mtime)
+    mot_data = load_mot_files(
+        path for path in (mot_file_of(ann) for ann in annotations if isinstance(ann, dict)) if path
+    )
+
+    # 每个需要的帧号 -> [(标注索引, 说明, 是否为窗口标记)]
+    wanted: Dict[int, List[Tuple[int, str, bool]]] = {}
+    plans: Dict[int, List[Tuple[int, str, bool]]] = {}
+    for idx, ann in enumerate(annotations):
+        if not isinstance(ann, dict):
+            errors.append(f"{rel} #{idx + 1}: annotation is not an object")
+            continue
+        target = sheet_path(sheet_root, rel, idx)
+        if not force and target.exists() and target.stat().st_mtime >= newest_input:
+            continue
+        mot = mot_data.get(mot_file_of(ann) or "", {})
+        try:
+            plan = [(int(frame), caption, is_marker) for frame, caption, is_marker in key_frames(ann, mot, mot_samples)]
+        except (TypeError, ValueError) as exc:  # 窗口格式错误只跳过该标注
+            errors.append(f"{rel} #{idx + 1}: bad window ({exc})")
+            continue
+        if not plan:
+            continue
+        plans[idx] = plan
+        for frame, caption, is_marker in plan:
+            wanted.setdefault(frame, []).append((idx, caption, is_marker))
+    if not plans:
+        return rel.as_posix(), 0, errors
+
+    # 单次顺序解码：跳过的帧只grab不解码，距离较远时向前seek
+    tiles: Dict[Tuple[int, int, str], Any] = {}
+    capture = cv2.VideoCapture(str(video_path))
+    try:
+        if not capture.isOpened():
+            return rel.as_posix(), 0, [f"{rel}: cannot open {video_path}"]
+        position = 0
+        for frame_index in sorted(frame for frame in wanted if frame >= 0):
+            if frame_index - position > SEEK_GAP:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+                position = frame_index
+            while position < frame_index and capture.grab():
+                position += 1
+            ret, frame = capture.read()
+            if not ret:
+                break
+            position = frame_index + 1
+            for idx, caption, is_marker in wanted[frame_index]:
+                ann = annotations[idx]
+                mot_boxes = mot_data.get(mot_file_of(ann) or "", {}).get(frame_index, [])
+                tiles[(idx, frame_index, caption)] = make_tile(
+                    frame, ann, frame_index, caption, caption if is_marker else None, mot_boxes, tile_width,
+                )
+    finally:
+        capture.release()
+
+    written = 0
+    for idx, plan in plans.items():
+        sheet_tiles = [tiles[(idx, int(frame), caption)] for frame, caption, _ in plan if (idx, int(frame), caption) in tiles]
+        if not sheet_tiles:
+            errors.append(f"{rel} #{idx + 1}: no frames decoded")
+            continue
+        ann = annotations[idx]
+        header = f"{rel.stem} #{idx + 1}/{len(annotations)}  {ann.get('task_L2', 'N/A')}  id={ann.get('annotation_id', 'N/A')}"
+        sheet = compose_sheet(sheet_tiles, header, min(columns, len(sheet_tiles)), tile_width)
+        ok, encoded = cv2.imencode(".jpg", sheet, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            errors.append(f"{rel} #{idx + 1}: cannot encode sheet")
+            continue
+        target = sheet_path(sheet_root, rel, idx)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(target, encoded.tobytes())
+        written += 1
+    return rel.as_posix(), written, errors
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sheet_root = args.sheet_root or args.output_root / ".contact_sheets"
+    clip_files = find_clip_files(args.output_root)
+    total_sheets = 0
+    all_errors: List[str] = []
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            pool.submit(
+                render_clip, path, args.output_root, args.dataset_root, sheet_root,
+                args.mot_samples, args.tile_width, args.columns, args.force,
+            ): path
+            for path in clip_files
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                rel, written, errors = future.result()
+            except Exception as exc:  # 单个文件出错不影响其余文件
+                rel, written, errors = futures[future].relative_to(args.output_root).as_posix(), 0, []
+                errors.append(f"{rel}: {exc}")
+            total_sheets += written
+            all_errors.extend(errors)
+            print(f"[{done}/{len(futures)}] {rel}: {written} sheets")
+    print(f"Done. Wrote {total_sheets} contact sheets for {len(clip_files)} clips into {sheet_root}.")
+    for error in all_errors:
+        print(f" ! {error}")
@@ -0,0 +1,595 @@
+#!/usr/bin/env python3
+"""SQLite index of every annotation under the output root, with old-vs-new change scores.
+
+``build`` records one row per annotation (location, task, review flag),
+re-reading only files whose size or mtime changed.  ``diff`` pairs each
+annotation with its old counterpart by annotation_id or question, like the
+T key (``annotation_utils.match_old_annotations``) but without its fallback
+to the task's first old annotation, and scores how much its
+geometry moved: bbox IoU and Q/A window overlap are computed with NumPy over
+all pairs of the dataset at once.  ``change_score`` is ``1 - mean
+similarity`` (0 = same geometry, 1 = nothing overlaps); annotations without
+an old match get no score.  ``matches_reviewed`` marks annotations identical
+to their reviewed old counterpart, which reviewers can skip.
+
+The ``question``, ``query``, ``answer`` and bbox ``label`` texts are kept in
+an FTS5 table; ``search`` (and the UI's search window) finds annotations by
+words or quoted phrases.
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import json
+import re
+import sqlite3
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from annotation_utils import annotation_boxes, find_annotation_files, is_box, match_old_annotations, parse_window
+from review_state import annotation_key
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS annotations (
+    path TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    ann_key TEXT NOT NULL,
+    sport TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data_type TEXT NOT NULL,
+    media_id TEXT NOT NULL,
+    task_L1 TEXT,
+    task_L2 TEXT,
+    annotation_id TEXT,
+    reviewed INTEGER NOT NULL,
+    PRIMARY KEY (path, idx)
+);
+CREATE INDEX IF NOT EXISTS annotations_by_task ON annotations (task_L1, task_L2);
+CREATE TABLE IF NOT EXISTS change_scores (
+    path TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    bbox_iou REAL,
+    window_overlap REAL,
+    change_score REAL,
+    matches_reviewed INTEGER NOT NULL,
+    PRIMARY KEY (path, idx)
+);
+CREATE TABLE IF NOT EXISTS diff_state (
+    path TEXT PRIMARY KEY,
+    new_size INTEGER NOT NULL,
+    new_mtime_ns INTEGER NOT NULL,
+    old_size INTEGER NOT NULL,
+    old_mtime_ns INTEGER NOT NULL
+);
+"""
+
+# Bump when the rows gain columns or tables or the scoring rules change; older indexes re-read
+# (and re-score) every file on the next build.
+INDEX_VERSION = 2
+
+TEXT_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS annotation_text USING fts5(
+    question, query, answer, labels, path UNINDEXED, idx UNINDEXED, tokenize = 'unicode61'
+);
+"""
+
+# Fields ignored when deciding whether an annotation still matches its old reviewed version.
+REVIEW_ONLY_FIELDS = ("reviewed", "retrack", "_debug")
+# Columns a review queue can be filtered on.
+QUEUE_FILTER_FIELDS = ("task_L1", "task_L2", "sport", "event", "data_type")
+
+# (sport, event, data_type, media_id) of a file and the annotation index inside it
+QueueItem = Tuple[Tuple[str, str, str, str], int]
+
+
+def default_index_path(output_root: Path) -> Path:
+    return Path(output_root) / ".dataset_index.sqlite"
+
+
+def flatten_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return " ".join(flatten_text(item) for item in value)
+    if isinstance(value, dict):
+        return " ".join(flatten_text(item) for item in value.values())
+    return str(value)
+
+
+def annotation_text(annotation: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    """``(question, query, answer, bbox labels)`` as plain text for the full-text index."""
+    boxes = annotation.get("bounding_box")
+    labels = [
+        str(box_info["label"]) for box_info in (boxes if isinstance(boxes, list) else [])
+        if isinstance(box_info, dict) and box_info.get("label")
+    ]
+    return (
+        flatten_text(annotation.get("question")),
+        flatten_text(annotation.get("query")),
+        flatten_text(annotation.get("answer")),
+        " ".join(labels),
+    )
+
+
+def fts_query(text: str) -> str:
+    """Search box input -> FTS5 query.
+
+    Every word must appear (``"quoted text"`` must appear as a phrase), and
+    the last word also matches as a prefix while it is still being typed.
+    FTS5 operators in the input are treated as plain words.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"?|(\S+)', text):
+        value = (phrase or word).replace('"', '""').strip()
+        if value:
+            terms.append((f'"{value}"', bool(word)))
+    if not terms:
+        return ""
+    if terms[-1][1] and not text[-1:].isspace():
+        terms[-1] = (terms[-1][0] + "*", True)
+    return " ".join(term for term, _is_word in terms)
+
+
+def annotation_windows(annotation: Dict[str, Any]) -> List[Tuple[int, int]]:
+    """``(start, end)`` of the Q window followed by the A windows; malformed entries are skipped."""
+    windows: List[Tuple[int, int]] = []
+    q_window = annotation.get("Q_window_frame")
+    if isinstance(q_window, list) and len(q_window) == 2:
+        try:
+            windows.append((int(q_window[0]), int(q_window[1])))
+        except (TypeError, ValueError):
+            pass
+    a_windows = annotation.get("A_window_frame")
+    for window in a_windows if isinstance(a_windows, list) else []:
+        try:
+            parsed = parse_window(window)
+        except ValueError:
+            parsed = None
+        if parsed is not None:
+            windows.append(parsed)
+    return windows
+
+
+def box_iou(new_boxes: np.ndarray, old_boxes: np.ndarray) -> np.ndarray:
+    """Row-wise IoU of two ``(K, 4)`` arrays of ``[x1, y1, x2, y2]`` boxes."""
+    x1 = np.maximum(new_boxes[:, 0], old_boxes[:, 0])
+    y1 = np.maximum(new_boxes[:, 1], old_boxes[:, 1])
+    x2 = np.minimum(new_boxes[:, 2], old_boxes[:, 2])
+    y2 = np.minimum(new_boxes[:, 3], old_boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_new = np.clip(new_boxes[:, 2] - new_boxes[:, 0], 0, None) * np.clip(new_boxes[:, 3] - new_boxes[:, 1], 0, None)
+    area_old = np.clip(old_boxes[:, 2] - old_boxes[:, 0], 0, None) * np.clip(old_boxes[:, 3] - old_boxes[:, 1], 0, None)
+    union = area_new + area_old - inter
+    same = np.all(new_boxes == old_boxes, axis=1)
+    return np.where(union > 0, inter / np.where(union > 0, union, 1), same.astype(float))
+
+
+def window_overlap(new_windows: np.ndarray, old_windows: np.ndarray) -> np.ndarray:
+    """Row-wise temporal IoU of two ``(K, 2)`` arrays of inclusive ``[start, end]`` frame ranges."""
+    inter = np.clip(np.minimum(new_windows[:, 1], old_windows[:, 1]) - np.maximum(new_windows[:, 0], old_windows[:, 0]) + 1, 0, None)
+    union = (new_windows[:, 1] - new_windows[:, 0] + 1) + (old_windows[:, 1] - old_windows[:, 0] + 1) - inter
+    return np.where(union > 0, inter / np.where(union > 0, union, 1), 0.0)
+
+
+class PairBatch:
+    """Geometry pairs of many annotations, flattened for one vectorised pass.
+
+    Each pair remembers its owner (row in ``owners``); elements present on
+    only one side count as similarity 0 for their owner.
+    """
+
+    def __init__(self) -> None:
+        self.owners: List[Tuple[str, int, bool]] = []  # (path, idx, identical to reviewed old)
+        self.box_owner: List[int] = []
+        self.new_boxes: List[List[float]] = []
+        self.old_boxes: List[List[float]] = []
+        self.window_owner: List[int] = []
+        self.new_windows: List[Tuple[int, int]] = []
+        self.old_windows: List[Tuple[int, int]] = []
+        self.box_unpaired: List[int] = []
+        self.window_unpaired: List[int] = []
+
+    def add(self, path: str, idx: int, annotation: Dict[str, Any], old: Dict[str, Any]) -> None:
+        owner = len(self.owners)
+        identical = {k: v for k, v in annotation.items() if k not in REVIEW_ONLY_FIELDS} == {
+            k: v for k, v in old.items() if k not in REVIEW_ONLY_FIELDS
+        }
+        self.owners.append((path, idx, identical))
+        new_boxes = [box for _label, box in annotation_boxes(annotation) if is_box(box)]
+        old_boxes = [box for _label, box in annotation_boxes(old) if is_box(box)]
+        for new_box, old_box in zip(new_boxes, old_boxes):
+            self.box_owner.append(owner)
+            self.new_boxes.append(list(new_box))
+            self.old_boxes.append(list(old_box))
+        self.box_unpaired.append(abs(len(new_boxes) - len(old_boxes)))
+        new_windows, old_windows = annotation_windows(annotation), annotation_windows(old)
+        for new_window, old_window in zip(new_windows, old_windows):
+            self.window_owner.append(owner)
+            self.new_windows.append(new_window)
+            self.old_windows.append(old_window)
+        self.window_unpaired.append(abs(len(new_windows) - len(old_windows)))
+
+    def _mean_similarity(self, owner: List[int], similarity: np.ndarray, unpaired: List[int]) -> np.ndarray:
+        """Per-owner mean similarity (unpaired elements count as 0); NaN for owners with no elements."""
+        count = len(self.owners)
+        owner_index = np.asarray(owner, dtype=np.int64)
+        totals = np.bincount(owner_index, weights=similarity, minlength=count)
+        counts = np.bincount(owner_index, minlength=count) + np.asarray(unpaired, dtype=np.int64)
+        return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+    def scores(self) -> List[Tuple[str, int, Optional[float], Optional[float], Optional[float], int]]:
+        """``(path, idx, bbox_iou, window_overlap, change_score, matches_reviewed)`` per owner."""
+        if not self.owners:
+            return []
+        ious = box_iou(
+            np.asarray(self.new_boxes, dtype=float).reshape(-1, 4),
+            np.asarray(self.old_boxes, dtype=float).reshape(-1, 4),
+        )
+        overlaps = window_overlap(
+            np.asarray(self.new_windows, dtype=float).reshape(-1, 2),
+            np.asarray(self.old_windows, dtype=float).reshape(-1, 2),
+        )
+        bbox = self._mean_similarity(self.box_owner, ious, self.box_unpaired)
+        windows = self._mean_similarity(self.window_owner, overlaps, self.window_unpaired)
+        stacked = np.vstack([bbox, windows])
+        valid = ~np.isnan(stacked)
+        present = valid.sum(axis=0)
+        similarity = np.where(present > 0, np.where(valid, stacked, 0).sum(axis=0) / np.maximum(present, 1), np.nan)
+        results = []
+        for pos, (path, idx, identical) in enumerate(self.owners):
+            # 没有可比较的几何信息时，内容相同记0，否则记1
+            change = 0.0 if identical else (1.0 - similarity[pos] if not np.isnan(similarity[pos]) else 1.0)
+            results.append((
+                path,
+                idx,
+                None if np.isnan(bbox[pos]) else float(bbox[pos]),
+                None if np.isnan(windows[pos]) else float(windows[pos]),
+                float(change),
+                int(identical),
+            ))
+        return results
+
+
+def load_annotations(path: Path) -> Optional[List[Dict[str, Any]]]:
+    try:
+        with Path(path).open("r", encoding="utf-8") as handle:
+            data = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    annotations = data.get("annotations") if isinstance(data, dict) else None
+    return annotations if isinstance(annotations, list) else None
+
+
+class DatasetIndex:
+    """Annotation rows keyed by (relative json path, index) plus their change scores."""
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.executescript(SCHEMA)
+        try:
+            self.conn.executescript(TEXT_SCHEMA)
+            self.has_text = True
+        except sqlite3.OperationalError:  # SQLite built without FTS5
+            self.has_text = False
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+            # 旧版本的索引：下次 build 时重新读取全部文件
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def index_file(self, rel: str, annotations: Iterable[Dict[str, Any]], size: int, mtime_ns: int) -> None:
+        """Replace the rows of one file (no commit)."""
+        sport, event, data_type, name = rel.split("/")
+        annotations = [(idx, ann) for idx, ann in enumerate(annotations) if isinstance(ann, dict)]
+        self.conn.execute("DELETE FROM annotations WHERE path = ?", (rel,))
+        # 分数随文件内容失效；同时删除 diff_state，下次 diff 才会重新计算该文件
+        self.conn.execute("DELETE FROM change_scores WHERE path = ?", (rel,))
+        self.conn.execute("DELETE FROM diff_state WHERE path = ?", (rel,))
+        if self.has_text:
+            self.conn.execute("DELETE FROM annotation_text WHERE path = ?", (rel,))
+            self.conn.executemany(
+                "INSERT INTO annotation_text (question, query, answer, labels, path, idx) VALUES (?, ?, ?, ?, ?, ?)",
+                [annotation_text(ann) + (rel, idx) for idx, ann in annotations],
+            )
+        self.conn.executemany(
+            """
+            INSERT INTO annotations
+                (path, idx, ann_key, sport, event, data_type, media_id, task_L1, task_L2, annotation_id, reviewed)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    rel, idx, annotation_key(ann, idx), sport, event, data_type, Path(name).stem,
+                    ann.get("task_L1"), ann.get("task_L2"),
+                    None if ann.get("annotation_id") is None else str(ann.get("annotation_id")),
+                    int(bool(ann.get("reviewed", False))),
+                )
+                for idx, ann in annotations
+            ],
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files (path, size, mtime_ns) VALUES (?, ?, ?)", (rel, size, mtime_ns)
+        )
+
+    def forget_file(self, rel: str) -> None:
+        for table in ("files", "annotations", "change_scores", "diff_state"):
+            self.conn.execute(f"DELETE FROM {table} WHERE path = ?", (rel,))
+        if self.has_text:
+            self.conn.execute("DELETE FROM annotation_text WHERE path = ?", (rel,))
+
+    def build(self, output_root: Path, full: bool = False) -> Tuple[int, int, List[str]]:
+        """Bring the index in line with ``output_root``; returns ``(files indexed, files removed, errors)``."""
+        known = dict(
+            (path, (size, mtime_ns))
+            for path, size, mtime_ns in self.conn.execute("SELECT path, size, mtime_ns FROM files")
+        )
+        indexed = 0
+        errors: List[str] = []
+        present = set()
+        for json_path in find_annotation_files(output_root):
+            rel = json_path.relative_to(output_root).as_posix()
+            present.add(rel)
+            stat = json_path.stat()
+            if not full and known.get(rel) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            annotations = load_annotations(json_path)
+            if annotations is None:
+                errors.append(f"{rel}: cannot read annotations")
+                continue
+            self.index_file(rel, annotations, stat.st_size, stat.st_mtime_ns)
+            indexed += 1
+        removed = [rel for rel in known if rel not in present]
+        for rel in removed:
+            self.forget_file(rel)
+        self.conn.commit()
+        return indexed, len(removed), errors
+
+    def refresh_file(self, output_root: Path, rel: str) -> None:
+        """Re-index one file right after it was saved (the UI calls this)."""
+        path = Path(output_root) / rel
+        # 先取 size/mtime 再读取：读取期间又被写入时，记录的是旧值，下次 build 会重新读取
+        stat = path.stat()
+        annotations = load_annotations(path)
+        if annotations is None:
+            return
+        self.index_file(rel, annotations, stat.st_size, stat.st_mtime_ns)
+        self.conn.commit()
+
+    def diff(self, output_root: Path, old_root: Path, full: bool = False) -> Tuple[int, int]:
+        """Score every indexed file that has an old counterpart; returns ``(files, annotations scored)``.
+
+        Pairs whose new and old files are unchanged since the last diff keep their scores.
+        """
+        previous = {
+            path: (new_size, new_mtime, old_size, old_mtime)
+            for path, new_size, new_mtime, old_size, old_mtime in self.conn.execute(
+                "SELECT path, new_size, new_mtime_ns, old_size, old_mtime_ns FROM diff_state"
+            )
+        }
+        batch = PairBatch()
+        states: Dict[str, Tuple[int, int, int, int]] = {}
+        for (rel,) in self.conn.execute("SELECT path FROM files ORDER BY path").fetchall():
+            new_path, old_path = Path(output_root) / rel, Path(old_root) / rel
+            try:
+                new_stat, old_stat = new_path.stat(), old_path.stat()
+            except OSError:
+                if rel in previous:  # 旧文件已不存在，丢弃过期的分数
+                    self.conn.execute("DELETE FROM change_scores WHERE path = ?", (rel,))
+                    self.conn.execute("DELETE FROM diff_state WHERE path = ?", (rel,))
+                continue
+            state = (new_stat.st_size, new_stat.st_mtime_ns, old_stat.st_size, old_stat.st_mtime_ns)
+            if not full and previous.get(rel) == state:
+                continue
+            annotations, old_annotations = load_annotations(new_path), load_annotations(old_path)
+            if annotations is None or old_annotations is None:
+                continue
+            states[rel] = state
+            # 跳过非对象条目，但分数仍记在原始下标上
+            valid = [(idx, ann) for idx, ann in enumerate(annotations) if isinstance(ann, dict)]
+            old_valid = [old for old in old_annotations if isinstance(old, dict)]
+            # 只对按 id 或问题匹配到的标注评分；同任务第一条的兜底匹配与本标注无关
+            matches = match_old_annotations([ann for _idx, ann in valid], old_valid, fallback=False)
+            for pos, old in matches.items():
+                idx, ann = valid[pos]
+                batch.add(rel, idx, ann, old)
+        for rel in states:
+            self.conn.execute("DELETE FROM change_scores WHERE path = ?", (rel,))
+        scores = batch.scores()
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO change_scores
+                (path, idx, bbox_iou, window_overlap, change_score, matches_reviewed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            scores,
+        )
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO diff_state (path, new_size, new_mtime_ns, old_size, old_mtime_ns)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [(rel,) + state for rel, state in states.items()],
+        )
+        self.conn.commit()
+        return len(states), len(scores)
+
+    def most_changed(self, limit: int = 20) -> List[Tuple[str, int, Optional[str], float, Optional[float], Optional[float]]]:
+        """``(path, idx, task_L2, change_score, bbox_iou, window_overlap)``, most changed first."""
+        return self.conn.execute(
+            """
+            SELECT a.path, a.idx, a.task_L2, c.change_score, c.bbox_iou, c.window_overlap
+            FROM change_scores c JOIN annotations a ON a.path = c.path AND a.idx = c.idx
+            WHERE c.change_score > 0
+            ORDER BY c.change_score DESC, a.path, a.idx
+            LIMIT ?
+            """,
+            (limit,),
+        ).fetchall()
+
+    def search(self, text: str, limit: int = 200) -> List[Tuple[QueueItem, Optional[str], str]]:
+        """``(queue item, task_L2, snippet)`` of annotations whose texts match ``text``, best match first."""
+        if not self.has_text:
+            raise RuntimeError("this SQLite build has no FTS5; text search is unavailable")
+        query = fts_query(text)
+        if not query:
+            return []
+        rows = self.conn.execute(
+            """
+            SELECT a.sport, a.event, a.data_type, a.media_id, a.idx, a.task_L2,
+                   snippet(annotation_text, -1, '[', ']', '...', 12)
+            FROM annotation_text
+            JOIN annotations a ON a.path = annotation_text.path AND a.idx = annotation_text.idx
+            WHERE annotation_text MATCH ?
+            ORDER BY bm25(annotation_text)
+            LIMIT ?
+            """,
+            (query, limit),
+        )
+        return [
+            (((sport, event, data_type, media_id), idx), task, snippet)
+            for sport, event, data_type, media_id, idx, task, snippet in rows
+        ]
+
+    def distinct_values(self) -> Dict[str, List[str]]:
+        """Values present in each ``QUEUE_FILTER_FIELDS`` column, for filter pickers."""
+        return {
+            field: [
+                row[0] for row in self.conn.execute(
+                    f"SELECT DISTINCT {field} FROM annotations WHERE {field} IS NOT NULL ORDER BY {field}"
+                )
+            ]
+            for field in QUEUE_FILTER_FIELDS
+        }
+
+    def unreviewed(
+        self,
+        filters: Optional[Mapping[str, Collection[str]]] = None,
+        overrides: Optional[Mapping[Tuple[str, str], bool]] = None,
+    ) -> List[QueueItem]:
+        """Unreviewed annotations matching ``filters`` (field -> allowed values; empty means any).
+
+        ``overrides`` maps ``(path, ann_key)`` to a reviewed flag that wins
+        over the JSON value (the review-state store's flags).
+        """
+        clauses, params = [], []
+        for field, values in (filters or {}).items():
+            if field not in QUEUE_FILTER_FIELDS:
+                raise ValueError(f"cannot filter on {field!r}")
+            if values:
+                clauses.append(f"{field} IN ({', '.join('?' * len(values))})")
+                params.extend(sorted(values))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        overrides = overrides or {}
+        items: List[QueueItem] = []
+        for path, idx, key, sport, event, data_type, media_id, reviewed in self.conn.execute(
+            f"SELECT path, idx, ann_key, sport, event, data_type, media_id, reviewed FROM annotations {where}",
+            params,
+        ):
+            if not overrides.get((path, key), bool(reviewed)):
+                items.append(((sport, event, data_type, media_id), idx))
+        return items
+
+
+def queue_key(item: QueueItem) -> Tuple[Any, ...]:
+    """Sort key in review order: sport, event, type, numeric IDs before others, annotation index."""
+    (sport, event, data_type, media_id), idx = item
+    id_key = (0, int(media_id), "") if media_id.isdigit() else (1, 0, media_id)
+    return (sport, event, data_type, id_key, media_id, idx)
+
+
+class ReviewQueue:
+    """Unreviewed annotations across all files in review order.
+
+    ``next_after``/``prev_before`` find the neighbour of any position with a
+    binary search (wrapping around at the ends); the position does not have
+    to be in the queue itself.  Items found reviewed on arrival are dropped
+    with ``discard``.
+    """
+
+    def __init__(self, items: Iterable[QueueItem]) -> None:
+        self.keys = sorted(queue_key(item) for item in items)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def item_of(key: Tuple[Any, ...]) -> QueueItem:
+        sport, event, data_type, _id_key, media_id, idx = key
+        return (sport, event, data_type, media_id), idx
+
+    def next_after(self, position: Optional[QueueItem]) -> Optional[QueueItem]:
+        if not self.keys:
+            return None
+        pos = 0 if position is None else bisect.bisect_right(self.keys, queue_key(position))
+        return self.item_of(self.keys[pos % len(self.keys)])
+
+    def prev_before(self, position: Optional[QueueItem]) -> Optional[QueueItem]:
+        if not self.keys:
+            return None
+        pos = len(self.keys) if position is None else bisect.bisect_left(self.keys, queue_key(position))
+        return self.item_of(self.keys[(pos - 1) % len(self.keys)])
+
+    def discard(self, item: QueueItem) -> None:
+        key = queue_key(item)
+        pos = bisect.bisect_left(self.keys, key)
+        if pos < len(self.keys) and self.keys[pos] == key:
+            del self.keys[pos]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Maintain the SQLite index of the annotation output")
+    parser.add_argument(
+        "command",
+        choices=("build", "diff", "search"),
+        help="build: index annotations; diff: score changes vs old data; search: find annotations by text",
+    )
+    parser.add_argument("terms", nargs="*", help="Words to search for (search)")
+    parser.add_argument("--output-root", default=Path("../output"), type=Path, help="Root of the annotation output")
+    parser.add_argument("--old-root", default=Path("../../data/output"), type=Path, help="Root of the old output (diff)")
+    parser.add_argument(
+        "--index",
+        default=None,
+        type=Path,
+        help="Path of the SQLite index (default: <output-root>/.dataset_index.sqlite)",
+    )
+    parser.add_argument("--full", action="store_true", help="Re-read every file instead of only changed ones")
+    parser.add_argument("--top", default=20, type=int, help="Most changed annotations listed after diff")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    index = DatasetIndex(args.index or default_index_path(args.output_root))
+    try:
+        indexed, removed, errors = index.build(args.output_root, args.full)
+        print(f"Indexed {indexed} files ({removed} removed).")
+        for error in errors:
+            print(f" ! {error}")
+        if args.command == "diff":
+            files, scored = index.diff(args.output_root, args.old_root, args.full)
+            print(f"Done. Scored {scored} annotations in {files} changed file pairs.")
+            for path, idx, task, score, iou, overlap in index.most_changed(args.top):
+                iou_text = "-" if iou is None else f"{iou:.2f}"
+                overlap_text = "-" if overlap is None else f"{overlap:.2f}"
+                print(f" {score:.3f}  {path} #{idx + 1}  {task}  bbox IoU {iou_text}  window overlap {overlap_text}")
+        elif args.command == "search":
+            results = index.search(" ".join(args.terms))
+            for ((sport, event, data_type, media_id), idx), task, snippet in results:
+                print(f" {sport}/{event}/{data_type}/{media_id}.json #{idx + 1}  {task}  {snippet}")
+            print(f"{len(results)} matches.")
+    finally:
+        index.close()
@@ -0,0 +1,122 @@
+"""Multi-level undo/redo for in-memory annotation edits.
+
+Every user action is stored as a short list of patches instead of a deep copy
+of the annotation: a field patch keeps references to the value it replaced
+and the value it wrote, a replace patch keeps the two annotation objects, and
+a delete patch keeps the removed annotation.  Replaced objects are never
+mutated afterwards, so old and new states share everything they have in
+common and memory stays proportional to what was actually edited.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+MISSING = object()  # marks a field that did not exist before/after a patch
+
+
+class EditAction:
+    """One undoable user action (bbox drag, label swap, T transfer, delete, ...)."""
+
+    def __init__(self, label: str, index: int) -> None:
+        self.label = label
+        self.index = index
+        self.patches: List[Tuple[Any, ...]] = []
+
+    @property
+    def structural(self) -> bool:
+        """True when the action changes the number of annotations."""
+        return any(patch[0] == "delete" for patch in self.patches)
+
+    def set_field(self, annotation: Dict[str, Any], path: Sequence[Any], value: Any) -> None:
+        """Write ``value`` at ``path`` inside ``annotation`` and remember the previous value."""
+        container = _resolve(annotation, path[:-1])
+        key = path[-1]
+        old = _read(container, key)
+        _write(container, key, value)
+        self.patches.append(("set", self.index, tuple(path), old, value))
+
+    def replace(self, annotations: List[Dict[str, Any]], new_annotation: Dict[str, Any]) -> None:
+        old = annotations[self.index]
+        annotations[self.index] = new_annotation
+        self.patches.append(("replace", self.index, old, new_annotation))
+
+    def delete(self, annotations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        removed = annotations.pop(self.index)
+        self.patches.append(("delete", self.index, removed))
+        return removed
+
+
+def _resolve(annotation: Dict[str, Any], path: Sequence[Any]) -> Any:
+    node: Any = annotation
+    for key in path:
+        node = node[key]
+    return node
+
+
+def _read(container: Any, key: Any) -> Any:
+    if isinstance(container, dict):
+        return container.get(key, MISSING)
+    return container[key]
+
+
+def _write(container: Any, key: Any, value: Any) -> None:
+    if value is MISSING:
+        if isinstance(container, dict):
+            container.pop(key, None)
+        return
+    container[key] = value
+
+
+def _apply(annotations: List[Dict[str, Any]], patch: Tuple[Any, ...], forward: bool) -> None:
+    kind, index = patch[0], patch[1]
+    if kind == "set":
+        _path, old, new = patch[2], patch[3], patch[4]
+        container = _resolve(annotations[index], _path[:-1])
+        _write(container, _path[-1], new if forward else old)
+    elif kind == "replace":
+        old, new = patch[2], patch[3]
+        annotations[index] = new if forward else old
+    elif kind == "delete":
+        if forward:
+            annotations.pop(index)
+        else:
+            annotations.insert(index, patch[2])
+
+
+class EditHistory:
+    """Bounded undo/redo stacks of :class:`EditAction` for the file being reviewed."""
+
+    def __init__(self, limit: int = 200) -> None:
+        self._undo: Deque[EditAction] = deque(maxlen=limit)
+        self._redo: List[EditAction] = []
+
+    def clear(self) -> None:
+        self._undo.clear()
+        self._redo.clear()
+
+    def record(self, action: EditAction) -> None:
+        if action.patches:
+            self._undo.append(action)
+            self._redo.clear()
+
+    def last(self) -> Optional[EditAction]:
+        return self._undo[-1] if self._undo else None
+
+    def undo(self, annotations: List[Dict[str, Any]]) -> Optional[EditAction]:
+        if not self._undo:
+            return None
+        action = self._undo.pop()
+        for patch in reversed(action.patches):
+            _apply(annotations, patch, forward=False)
+        self._redo.append(action)
+        return action
+
+    def redo(self, annotations: List[Dict[str, Any]]) -> Optional[EditAction]:
+        if not self._redo:
+            return None
+        action = self._redo.pop()
+        for patch in action.patches:
+            _apply(annotations, patch, forward=True)
+        self._undo.append(action)
+        return action
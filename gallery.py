@@ -0,0 +1,267 @@
+"""Thumbnail gallery for bulk review of frames annotations (G key).
+
+Thumbnails are rendered with the same box overlays as the player by a
+process pool and cached as JPEG files keyed by image path, image size/mtime
+and the drawn boxes, so reopening a gallery only renders what changed.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import tkinter as tk
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tkinter import messagebox, ttk
+from typing import Any, Callable, Dict, List, Optional
+
+import cv2
+
+from media_loader import debug_frame_path, find_media_file, read_image
+from overlays import draw_static_boxes
+from persistence import atomic_write_bytes
+
+GALLERY_TASKS = ("Objects_Spatial_Relationships",)
+THUMBNAIL_SIZE = 256
+GALLERY_COLUMNS = 5
+
+
+class GalleryItem:
+    """One annotation shown as a tile."""
+
+    def __init__(self, json_path: Path, media_id: str, index: int, annotation: Dict[str, Any], image_path: Optional[Path]) -> None:
+        self.json_path = json_path
+        self.media_id = media_id
+        self.index = index
+        self.annotation = annotation
+        self.image_path = image_path
+
+    @property
+    def reviewed(self) -> bool:
+        return bool(self.annotation.get("reviewed", False))
+
+
+def collect_gallery_items(
+    output_path: Path,
+    dataset_path: Path,
+    sport: str,
+    event: str,
+    read_bytes: Callable[[Path], bytes],
+    tasks=GALLERY_TASKS,
+    overlay: Optional[Callable[[Path, List[Dict[str, Any]]], Any]] = None,
+) -> List[GalleryItem]:
+    """Every frames annotation of ``sport/event`` whose task_L2 is in ``tasks``, in ID order.
+
+    ``overlay`` is called with each file's annotations before they are
+    filtered, so the review-state store can apply its flags.
+    """
+    type_path = Path(output_path) / sport / event / "frames"
+    if not type_path.is_dir():
+        return []
+    ids = [json_file.stem for json_file in type_path.glob("*.json")]
+    ids.sort(key=lambda x: (0, int(x)) if x.isdigit() else (1, x))
+
+    items: List[GalleryItem] = []
+    for media_id in ids:
+        json_path = type_path / f"{media_id}.json"
+        try:
+            annotations = json.loads(read_bytes(json_path).decode("utf-8")).get("annotations", [])
+        except (OSError, ValueError) as exc:
+            print(f"Skipping {json_path}: {exc}")
+            continue
+        if overlay:
+            overlay(json_path, annotations)
+        image_path = find_media_file(dataset_path, sport, event, "frames", media_id)
+        for idx, ann in enumerate(annotations):
+            if ann.get("task_L2") not in tasks:
+                continue
+            items.append(GalleryItem(json_path, media_id, idx, ann, image_path or debug_frame_path(annotations, idx)))
+    return items
+
+
+def thumbnail_path(cache_dir: Path, image_path: Path, annotation: Dict[str, Any], size: int = THUMBNAIL_SIZE) -> Path:
+    """Cache file of one tile; changes whenever the image or the drawn boxes change."""
+    stat = Path(image_path).stat()
+    boxes = {key: annotation.get(key) for key in ("bounding_box", "first_bounding_box")}
+    key = "|".join([
+        str(image_path), str(stat.st_size), str(stat.st_mtime_ns), str(size),
+        json.dumps(boxes, sort_keys=True, ensure_ascii=False),
+    ])
+    return Path(cache_dir) / f"{hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()}.jpg"
+
+
+def render_thumbnail(image_path: str, boxes: Dict[str, Any], cache_path: str, size: int = THUMBNAIL_SIZE) -> str:
+    """Process-pool worker: decode at reduced scale, fit into ``size``, draw boxes, write the JPEG."""
+    if Path(cache_path).exists():
+        return cache_path
+    image, source_size = read_image(Path(image_path), (size, size))
+    if image is None:
+        raise ValueError(f"Cannot load image: {image_path}")
+    scale = size / max(image.shape[:2])
+    if scale < 1:
+        image = cv2.resize(image, (int(image.shape[1] * scale), int(image.shape[0] * scale)), interpolation=cv2.INTER_AREA)
+    draw_static_boxes(image, boxes, image.shape[1] / source_size[0])
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    if not ok:
+        raise ValueError(f"Cannot encode thumbnail for {image_path}")
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+    atomic_write_bytes(Path(cache_path), encoded.tobytes())
+    return cache_path
+
+
+class ThumbnailGallery:
+    """Toplevel window tiling gallery items; click selects, double-click opens the annotation."""
+
+    def __init__(self, reviewer: Any, title: str, items: List[GalleryItem], cache_dir: Path, workers: Optional[int] = None) -> None:
+        self.reviewer = reviewer
+        self.items = items
+        self.cache_dir = Path(cache_dir)
+        self.selected = set()
+        self.tiles: List[tk.Label] = []
+        self.photos: Dict[int, Any] = {}  # 保持 PhotoImage 引用
+        self.pending = {}  # Future -> item index
+        self.poll_id = None
+
+        self.window = tk.Toplevel(reviewer.root)
+        self.window.title(f"Gallery - {title} ({len(items)} annotations)")
+        self.window.geometry("1400x900")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        toolbar = ttk.Frame(self.window)
+        toolbar.pack(fill=tk.X, padx=10, pady=8)
+        tk.Button(toolbar, text="✓ Mark Selected Reviewed", command=self.mark_selected_reviewed,
+                  font=('Arial', 12, 'bold'), bg='#FF9800', fg='white').pack(side=tk.LEFT, padx=5)
+        tk.Button(toolbar, text="Select Unreviewed", command=self.select_unreviewed,
+                  font=('Arial', 12)).pack(side=tk.LEFT, padx=5)
+        tk.Button(toolbar, text="Clear Selection", command=self.clear_selection,
+                  font=('Arial', 12)).pack(side=tk.LEFT, padx=5)
+        self.status_label = ttk.Label(toolbar, text="", font=('Arial', 12))
+        self.status_label.pack(side=tk.LEFT, padx=15)
+
+        body = ttk.Frame(self.window)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.canvas = tk.Canvas(body, bg='#303030', highlightthickness=0)
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.grid_frame = tk.Frame(self.canvas, bg='#303030')
+        self.canvas.create_window((0, 0), window=self.grid_frame, anchor=tk.NW)
+        self.grid_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
+        self.window.bind("<MouseWheel>", lambda e: self.canvas.yview_scroll(int(-e.delta / 120), "units"))
+        self.window.bind("<Button-4>", lambda e: self.canvas.yview_scroll(-3, "units"))
+        self.window.bind("<Button-5>", lambda e: self.canvas.yview_scroll(3, "units"))
+
+        for pos, item in enumerate(items):
+            tile = tk.Label(self.grid_frame, text="Loading...", compound=tk.TOP, bg='#202020', fg='white', font=('Arial', 10), bd=0,
+                            highlightthickness=4, highlightbackground='#202020', wraplength=THUMBNAIL_SIZE)
+            tile.grid(row=pos // GALLERY_COLUMNS, column=pos % GALLERY_COLUMNS, padx=4, pady=4)
+            tile.bind("<Button-1>", lambda e, p=pos: self.toggle(p))
+            tile.bind("<Double-Button-1>", lambda e, p=pos: self.open_item(p))
+            self.tiles.append(tile)
+            self.update_tile(pos)
+
+        # spawn：不在带Tk与线程的进程里fork
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        for pos, item in enumerate(items):
+            if item.image_path is None:
+                self.tiles[pos].config(text=self.tile_caption(item) + "\n(image not found)")
+                continue
+            try:
+                cache_path = thumbnail_path(self.cache_dir, item.image_path, item.annotation)
+            except OSError:
+                continue
+            boxes = {key: item.annotation[key] for key in ("bounding_box", "first_bounding_box") if key in item.annotation}
+            future = self.pool.submit(render_thumbnail, str(item.image_path), boxes, str(cache_path))
+            self.pending[future] = pos
+        self.update_status()
+        self.poll()
+
+    def tile_caption(self, item: GalleryItem) -> str:
+        state = "✓ reviewed" if item.reviewed else "○ unreviewed"
+        question = str(item.annotation.get("question") or item.annotation.get("query") or "")
+        if len(question) > 60:
+            question = question[:57] + "..."
+        return f"{item.media_id} #{item.index + 1}  {state}\n{question}"
+
+    def update_tile(self, pos: int) -> None:
+        item = self.items[pos]
+        if pos in self.selected:
+            border = '#2196F3'
+        else:
+            border = '#4CAF50' if item.reviewed else '#202020'
+        self.tiles[pos].config(text=self.tile_caption(item), highlightbackground=border, highlightcolor=border)
+
+    def update_status(self) -> None:
+        reviewed = sum(1 for item in self.items if item.reviewed)
+        rendering = f" | rendering {len(self.pending)}" if self.pending else ""
+        self.status_label.config(
+            text=f"Reviewed {reviewed}/{len(self.items)} | Selected {len(self.selected)}{rendering}"
+        )
+
+    def poll(self) -> None:
+        """把已完成的缩略图放到对应的格子上"""
+        from PIL import Image, ImageTk
+
+        for future in [future for future in self.pending if future.done()]:
+            pos = self.pending.pop(future)
+            try:
+                path = future.result()
+                with Image.open(path) as image:
+                    self.photos[pos] = ImageTk.PhotoImage(image.copy())
+                self.tiles[pos].config(image=self.photos[pos])
+            except Exception as exc:
+                self.tiles[pos].config(text=self.tile_caption(self.items[pos]) + f"\n({exc})")
+        self.update_status()
+        self.poll_id = self.window.after(100, self.poll) if self.pending else None
+
+    def toggle(self, pos: int) -> None:
+        if pos in self.selected:
+            self.selected.discard(pos)
+        else:
+            self.selected.add(pos)
+        self.update_tile(pos)
+        self.update_status()
+
+    def select_unreviewed(self) -> None:
+        self.selected = {pos for pos, item in enumerate(self.items) if not item.reviewed}
+        for pos in range(len(self.items)):
+            self.update_tile(pos)
+        self.update_status()
+
+    def clear_selection(self) -> None:
+        selected, self.selected = self.selected, set()
+        for pos in selected:
+            self.update_tile(pos)
+        self.update_status()
+
+    def mark_selected_reviewed(self) -> None:
+        if not self.selected:
+            messagebox.showinfo("Info", "No tiles selected", parent=self.window)
+            return
+        selection: Dict[Path, List[int]] = {}
+        for pos in sorted(self.selected):
+            item = self.items[pos]
+            selection.setdefault(item.json_path, []).append(item.index)
+        marked, failed = self.reviewer.mark_reviewed_bulk(selection)
+        for pos in sorted(self.selected):
+            if self.items[pos].json_path not in failed:
+                self.items[pos].annotation["reviewed"] = True
+        self.clear_selection()
+        if failed:
+            errors = [f"{path}: {error}" for path, error in failed.items()]
+            messagebox.showerror("Error", "Failed to mark some files:\n" + "\n".join(errors), parent=self.window)
+        else:
+            messagebox.showinfo("Info", f"Marked {marked} annotations as reviewed", parent=self.window)
+
+    def open_item(self, pos: int) -> None:
+        item = self.items[pos]
+        sport, event = item.json_path.parent.parent.parent.name, item.json_path.parent.parent.name
+        self.reviewer.open_annotation((sport, event, "frames", item.media_id), item.index)
+
+    def close(self) -> None:
+        if self.poll_id:
+            self.window.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.window.destroy()
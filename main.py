@@ -7,16 +7,45 @@ AI标注审查程序
 import os
 import json
 import copy
+import argparse
 import cv2
 import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 import numpy as np
 
+from annotation_utils import (
+    annotation_window_start,
+    build_old_lookup,
+    match_old_annotation,
+    match_old_annotations,
+    mot_file_of,
+    window_frames,
+)
+from persistence import (
+    EditJournal,
+    WriteBehindQueue,
+    content_digest,
+    read_journal,
+    replay_journal,
+    serialize_json,
+    stale_journals,
+)
+from review_state import ReviewStateStore, annotation_key
+from edit_history import EditAction, EditHistory
+from media_loader import LoadCancelled, decode_frame_image, load_annotation_file, load_mot_files
+from overlays import draw_annotation, draw_static_boxes
+from gallery import ThumbnailGallery, collect_gallery_items
+from proxy_clips import ProxyCapture, choose_proxy
+from dataset_index import QUEUE_FILTER_FIELDS, DatasetIndex, ReviewQueue, default_index_path
+from annotation_search import AnnotationSearch
+
 class AnnotationReviewer:
-    def __init__(self, root):
+    def __init__(self, root, review_store=None):
         self.root = root
         self.root.title("AI Annotation Review System")
         self.root.geometry("1200x800")
@@ -26,9 +55,21 @@ class AnnotationReviewer:
         self.dataset_path = Path("../Dataset")
         self.old_output_path = Path("../../data/output")
         self.old_cache = {}
+        self.old_lookup_cache = {}
         self.current_json_path = None
+        self.current_data = None   # 当前文件完整JSON（保存时不再重新读盘）
+        self.dirty_paths = set()   # 有未保存修改的文件
+        self.saved_digests = {}    # 文件路径 -> 磁盘上（或已排队写入）内容的哈希
+        self.save_queue = WriteBehindQueue()  # 后台写入线程，按文件合并写请求
+        self.save_poll_id = None
+        self.journal = EditJournal(self.output_path / ".review_journal")  # 本次会话的编辑日志
+        self.journal_compact_delay = 5.0  # 停止编辑多少秒后自动写回JSON
+        self.last_edit_time = 0.0
+        self.recovering_journals = {}  # 崩溃遗留日志 -> 尚未写完的 (文件, 哈希)
+        self.review_store = review_store  # 可选：独立的审核状态库（reviewed/retrack不写入JSON）
         self.current_old_annotation = None
-        self.last_transfer = None
+        self.old_matches = {}  # 当前文件: annotation索引 -> 旧数据中匹配的annotation
+        self.history = EditHistory()  # 当前文件的撤销/重做历史
         
         # 当前状态
         self.current_sport = None
@@ -45,6 +86,9 @@ class AnnotationReviewer:
         self.total_frames = 0
         self.fps = 30
         self.play_after_id = None  # 存储定时器ID
+        self.proxy_root = self.output_path / ".proxies"  # proxy_clips.py 生成的窗口代理片段
+        self.clip_proxies = []     # 当前视频可用的代理片段
+        self.current_video_path = None
         self.bbox_paused = False   # B键暂停状态
         self.bbox_frames = []      # 包含bbox的帧列表
         self.current_bbox_index = 0  # 当前bbox帧索引
@@ -63,10 +107,41 @@ class AnnotationReviewer:
         self.active_edit_target = None
         
         # 图像显示相关
-        self.current_image = None
+        self.current_image = None       # 可能是按画布大小缩小解码的图片
+        self.current_image_size = None  # 原图 (宽, 高)，标注坐标以此为准
+        self.current_image_path = None
+
+        # 后台加载相关
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.mot_cache = {}         # MOT文件路径 -> {帧索引: [(track_id, x1, y1, x2, y2)]}
+        self.last_raw_frame = None  # 最近解码的 (帧号, 原始帧)，重绘时无需重新解码
+        self.cap_pos = None         # VideoCapture 下一次 read() 返回的帧号
+        self.load_generation = 0    # 每次 load_data 递增，过期的加载结果直接丢弃
+        self.load_future = None
+        self.render_generation = 0  # 每次刷新/跳帧请求递增，只绘制最新的请求
+        self.frame_cache = {}       # 预取时已解码的帧 {帧号: 原始帧}
+        self.prefetch_cache = OrderedDict()  # (sport, event, type, id) -> (LoadedFile, (大小, 修改时间))
+        self.prefetch_limit = 2
+        self.prefetch_frame_budget = 64 * 1024 * 1024  # 每个预取文件最多缓存的解码帧字节数
+        self.prefetch_generation = 0
+        self.prefetched_next = None  # (起点文件, 过滤条件, 下一个未审核文件)
+        self.image_executor = ThreadPoolExecutor(max_workers=2)  # frames模式相邻ID图片的解码线程
+        self.image_cache = OrderedDict()  # (sport, event, id) -> Future[(图片路径, 解码后的图片)]
+        self.image_prefetch_ahead = 3
+        self.image_keep_behind = 2
+
+        # 全局审核队列（Shift+U / Ctrl+U），数据来自 dataset_index 的索引
+        self.index_path = default_index_path(self.output_path)
+        self.queue_filters = {"task_L2": {"Spatial_Temporal_Grounding", "Continuous_Actions_Caption"}}
+        self.review_queue = None
+        self.queue_generation = 0
+        self.search_window = None  # Ctrl+F 全文搜索窗口（同一时间只开一个）
         
         self.setup_ui()
         self.load_events()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.recover_journals()
+        self.poll_save_queue()
         
     def setup_ui(self):
         """设置用户界面"""
@@ -109,6 +184,8 @@ class AnnotationReviewer:
                                     state="readonly", width=35, font=default_font)
         self.id_combo.pack(pady=8)
         self.id_combo.bind("<<ComboboxSelected>>", self.on_id_selected)
+        self.file_info_label = ttk.Label(control_frame, text="", font=default_font)
+        self.file_info_label.pack(pady=(0, 8))
         
         # Load button
         load_btn = tk.Button(control_frame, text="Load Data (L)", command=self.load_data,
@@ -121,6 +198,24 @@ class AnnotationReviewer:
                               font=button_font, bg='#2196F3', fg='white', 
                               relief='raised', bd=3, height=2, width=14)
         reload_btn.pack(pady=5)
+
+        # Gallery button
+        gallery_btn = tk.Button(control_frame, text="🖼 Gallery (G)", command=self.open_gallery,
+                               font=button_font, bg='#795548', fg='white',
+                               relief='raised', bd=3, height=2, width=14)
+        gallery_btn.pack(pady=5)
+
+        # Review queue filter button
+        queue_btn = tk.Button(control_frame, text="🔎 Queue Filter", command=self.open_queue_filter,
+                             font=button_font, bg='#3F51B5', fg='white',
+                             relief='raised', bd=3, height=2, width=14)
+        queue_btn.pack(pady=5)
+
+        # Full-text search button
+        search_btn = tk.Button(control_frame, text="🔍 Search (Ctrl+F)", command=self.open_search,
+                              font=button_font, bg='#009688', fg='white',
+                              relief='raised', bd=3, height=2, width=14)
+        search_btn.pack(pady=5)
         
         # Annotation info display
         ttk.Label(control_frame, text="Current Annotation:", font=('Arial', 14, 'bold')).pack(pady=(25, 8))
@@ -159,6 +254,10 @@ class AnnotationReviewer:
                          font=button_font, bg='#E91E63', fg='white',
                          relief='raised', bd=2, height=2, width=18)
         next_unreviewed_btn.pack(side=tk.LEFT, padx=5)
+        self.save_status_label = tk.Label(control_frame, text="", font=('Arial', 11), fg='#666666')
+        self.save_status_label.pack(pady=(0, 8))
+        self.queue_status_label = tk.Label(control_frame, text="", font=('Arial', 11), fg='#666666')
+        self.queue_status_label.pack(pady=(0, 8))
         
         # 右侧视频显示区域
         video_frame = ttk.Frame(main_frame)
@@ -198,8 +297,9 @@ class AnnotationReviewer:
         self.root.bind('<KeyPress-B>', self.on_b_key)
         self.root.bind('<KeyPress-w>', self.on_w_key)
         self.root.bind('<KeyPress-W>', self.on_w_key)  # 大写W也支持
-        self.root.bind('<KeyPress-u>', self.on_u_key)  # U键跳到下一个未审核文件（Shift+U 过滤特定任务）
+        self.root.bind('<KeyPress-u>', self.on_u_key)  # U键跳到下一个未审核文件（Shift+U 全局队列中的下一个标注）
         self.root.bind('<KeyPress-U>', self.on_u_key)
+        self.root.bind('<Control-u>', self.on_queue_prev_key)  # Ctrl+U 全局队列中的上一个标注
         self.root.bind('<F5>', self.on_f5_key)  # F5键重新加载数据
         self.root.bind('<KeyPress-e>', self.on_e_key)  # E键切换bbox编辑模式
         self.root.bind('<KeyPress-E>', self.on_e_key)
@@ -217,10 +317,16 @@ class AnnotationReviewer:
         self.root.bind('<KeyPress-S>', self.on_s_key)
         self.root.bind('<KeyPress-x>', self.on_swap_bbox_labels)  # X键交换bbox标签
         self.root.bind('<KeyPress-X>', self.on_swap_bbox_labels)
+        self.root.bind('<KeyPress-g>', self.on_g_key)  # G键打开缩略图画廊
+        self.root.bind('<KeyPress-G>', self.on_g_key)
+        self.root.bind('<Control-f>', self.on_search_key)  # Ctrl+F 全文搜索问题/答案/bbox标签
         self.root.bind('<KeyPress-t>', self.on_t_key)  # T键同步旧数据
         self.root.bind('<KeyPress-T>', self.on_t_key)
         self.root.bind('<Return>', self.on_enter_key)  # Enter键播放/暂停
-        self.root.bind('<Delete>', self.on_delete_key)  # Delete键删除当前标注并重新加载
+        self.root.bind('<Delete>', self.on_delete_key)  # Delete键删除当前标注
+        self.root.bind('<Control-z>', self.on_undo_key)  # Ctrl+Z 撤销
+        self.root.bind('<Control-Z>', self.on_redo_key)  # Ctrl+Shift+Z 重做
+        self.root.bind('<Control-y>', self.on_redo_key)  # Ctrl+Y 重做
         self.root.focus_set()
         
         # 进度条
@@ -243,7 +349,7 @@ class AnnotationReviewer:
         events = []
         if self.output_path.exists():
             for sport_dir in self.output_path.iterdir():
-                if sport_dir.is_dir():
+                if sport_dir.is_dir() and not sport_dir.name.startswith('.'):
                     for event_dir in sport_dir.iterdir():
                         if event_dir.is_dir():
                             events.append(f"{sport_dir.name}/{event_dir.name}")
@@ -346,7 +452,9 @@ class AnnotationReviewer:
             self.temp_bbox = None
             return
 
-        annotation = self.current_annotations[self.current_annotation_index]
+        index = self.current_annotation_index
+        annotation = self.current_annotations[index]
+        action = EditAction('bbox edit', index)
         target_entry = None
         if self.bbox_edit_mode and self.active_edit_target:
             target_entry = self.active_edit_target
@@ -355,34 +463,36 @@ class AnnotationReviewer:
         if target_entry:
             target_type, idx, label = target_entry
             if target_type == 'first':
-                annotation['first_bounding_box'] = new_bbox
+                action.set_field(annotation, ('first_bounding_box',), new_bbox)
             elif target_type == 'bbox_scalar':
-                annotation['bounding_box'] = new_bbox
+                action.set_field(annotation, ('bounding_box',), new_bbox)
             elif target_type == 'bbox_dict':
                 boxes = annotation.get('bounding_box')
                 if isinstance(boxes, list) and idx is not None and idx < len(boxes):
-                    boxes[idx]['box'] = new_bbox
+                    action.set_field(annotation, ('bounding_box', idx, 'box'), new_bbox)
             elif target_type == 'bbox_list':
                 boxes = annotation.get('bounding_box')
                 if isinstance(boxes, list) and idx is not None and idx < len(boxes):
-                    boxes[idx] = new_bbox
+                    action.set_field(annotation, ('bounding_box', idx), new_bbox)
             updated_label = label
-            annotation['retrack'] = True
         else:
             if 'first_bounding_box' in annotation:
-                annotation['first_bounding_box'] = new_bbox
+                action.set_field(annotation, ('first_bounding_box',), new_bbox)
                 updated_label = 'first_bounding_box'
             elif 'bounding_box' in annotation and annotation['bounding_box']:
                 boxes = annotation['bounding_box']
                 if isinstance(boxes[0], dict):
-                    boxes[0]['box'] = new_bbox
+                    action.set_field(annotation, ('bounding_box', 0, 'box'), new_bbox)
                 else:
-                    boxes[0] = new_bbox
+                    action.set_field(annotation, ('bounding_box', 0), new_bbox)
                 updated_label = 'bounding_box[0]'
             else:
-                annotation['first_bounding_box'] = new_bbox
+                action.set_field(annotation, ('first_bounding_box',), new_bbox)
                 updated_label = 'first_bounding_box'
-            annotation['retrack'] = True
+        action.set_field(annotation, ('retrack',), True)
+        self.history.record(action)
+        self.record_mutation('set', index)
+        self.store_review_flags(index, retrack=True)
 
         self.bbox_start_point = None
         self.temp_bbox = None
@@ -414,6 +524,8 @@ class AnnotationReviewer:
         if not self.bbox_edit_mode or annotation_key != self.edit_annotation_key:
             # 进入编辑模式或重新定位到当前标注
             self.stop_playback()
+            if self.current_type == "frames":
+                self.ensure_full_resolution_image()
             self.bbox_edit_mode = True
             self.video_canvas.config(cursor="crosshair")
             self.editable_bboxes = entries
@@ -482,36 +594,35 @@ class AnnotationReviewer:
         video_y = int((relative_y / display_height) * frame_height)
         
         return video_x, video_y
-        """重新加载当前文件的最新数据"""
-        if not all([self.current_sport, self.current_event, self.current_id, self.current_type]):
-            messagebox.showwarning("Warning", "No file currently loaded to reload")
-            return
-            
-        # 保存当前标注索引
-        current_index = self.current_annotation_index
-        
-        try:
-            # 重新加载数据
-            self.load_data()
-            
-            # 恢复到之前的标注索引（如果可能）
-            if current_index < len(self.current_annotations):
-                self.current_annotation_index = current_index
-                self.display_current_annotation()
             
-            print(f"Reloaded: {self.current_sport}/{self.current_event}/{self.current_type}/{self.current_id}.json")
-            messagebox.showinfo("Success", f"Data reloaded successfully!\nFile: {self.current_sport}/{self.current_event}/{self.current_type}/{self.current_id}.json")
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to reload data: {str(e)}")
-            
-    def load_data(self):
-        """加载标注数据"""
+    def load_data(self, on_loaded=None):
+        """加载标注数据（JSON解析、媒体打开、首帧解码、MOT解析在后台线程完成）"""
         if not all([self.current_sport, self.current_event, self.current_id]):
             messagebox.showwarning("Warning", "Please select event and ID first")
             return
             
         self.current_type = self.type_var.get()
+        json_path = (self.output_path / self.current_sport / 
+                    self.current_event / self.current_type / f"{self.current_id}.json")
+
+        # 切换到其他文件前先写回当前文件的修改
+        if self.current_json_path in self.dirty_paths and self.current_json_path != json_path:
+            self.save_data(silent=True)
+        elif json_path in self.dirty_paths:
+            # 重新加载同一文件会丢弃内存中的修改：先取消未保存标记并在日志中作废，
+            # 否则加载期间（标注已清空）的保存会把空列表写进文件
+            self.journal.append({'op': 'base', 'path': self.journal_path_key(json_path),
+                                 'digest': self.saved_digests.get(json_path)})
+            self.dirty_paths.discard(json_path)
+
+        # 新的加载请求使之前尚未完成的加载与绘制全部作废
+        self.load_generation += 1
+        generation = self.load_generation
+        self.render_generation += 1
+        self.prefetch_generation += 1  # 正在进行的预取让位于本次加载
+        if self.load_future is not None:
+            self.load_future.cancel()
+            self.load_future = None
 
         # 切换文件前确保停止播放并释放资源
         self.stop_playback()
@@ -519,96 +630,195 @@ class AnnotationReviewer:
             self.video_cap.release()
             self.video_cap = None
         self.current_image = None
-        
-        # 加载JSON标注数据
-        json_path = (self.output_path / self.current_sport / 
-                    self.current_event / self.current_type / f"{self.current_id}.json")
+        self.current_image_size = None
+        self.current_image_path = None
+        self.clip_proxies = []
+        self.current_video_path = None
+        self.last_raw_frame = None
+        self.cap_pos = None
+        self.frame_cache = {}
+        
+        # 加载期间清空当前标注，避免按键操作旧文件的数据
         self.current_json_path = json_path
-        
+        self.current_annotations = []
+        self.current_annotation_index = 0
+
+        prefetched = self.take_prefetched(
+            (self.current_sport, self.current_event, self.current_type, self.current_id), json_path)
+        if prefetched is not None:
+            if self.current_type == "frames" and prefetched.image is not None:
+                decoded = Future()
+                decoded.set_result((prefetched.media_path, prefetched.image, prefetched.image_size))
+                self.image_cache[(self.current_sport, self.current_event, self.current_id)] = decoded
+                self.prefetch_adjacent_images()
+            future = Future()
+            future.set_result(prefetched)
+            self.apply_loaded_file(future, generation, on_loaded)
+            return
+
+        self.show_loading_state(json_path)
+
+        old_json_path = self.get_old_json_path()
+        if old_json_path in self.old_cache:
+            old_json_path = None
+        media_dir = (self.dataset_path, self.current_sport, self.current_event, self.current_id)
+        image_future = self.prefetch_adjacent_images() if self.current_type == "frames" else None
+        self.load_future = self.run_in_background(
+            load_annotation_file, json_path, self.current_type, media_dir,
+            self.read_json_bytes, old_json_path, list(self.mot_cache),
+            should_continue=lambda: generation == self.load_generation,
+            image_future=image_future, image_target_size=self.canvas_size(), proxy_root=self.proxy_root,
+            on_done=lambda future: self.apply_loaded_file(future, generation, on_loaded),
+        )
+
+    def request_frame_image(self, sport, event, media_id):
+        """返回该ID图片的解码Future（已缓存或正在解码时直接复用）"""
+        key = (sport, event, media_id)
+        future = self.image_cache.get(key)
+        if future is None or future.cancelled():
+            future = self.image_executor.submit(
+                decode_frame_image, self.dataset_path, sport, event, media_id, self.canvas_size())
+            self.image_cache[key] = future
+        self.image_cache.move_to_end(key)
+        return future
+
+    def prefetch_adjacent_images(self):
+        """解码当前ID及其后若干ID的图片，保留之前的少量ID，其余移出缓存
+
+        返回当前ID图片的Future，供加载线程等待。
+        """
+        ids = list(self.id_combo['values'] or ())
+        current = self.request_frame_image(self.current_sport, self.current_event, self.current_id)
+        if self.current_id not in ids:
+            return current
+        pos = ids.index(self.current_id)
+        ahead = ids[pos + 1:pos + 1 + self.image_prefetch_ahead]
+        behind = ids[max(0, pos - self.image_keep_behind):pos]
+        wanted = {(self.current_sport, self.current_event, media_id)
+                  for media_id in [self.current_id] + ahead + behind}
+        for media_id in ahead:
+            self.request_frame_image(self.current_sport, self.current_event, media_id)
+        for key in [key for key in self.image_cache if key not in wanted]:
+            self.image_cache.pop(key).cancel()
+        return current
+
+    def canvas_size(self):
+        """画布当前尺寸，尚未布局时返回 None（此时按原图分辨率解码）"""
+        width, height = self.video_canvas.winfo_width(), self.video_canvas.winfo_height()
+        if width <= 1 or height <= 1:
+            return None
+        return width, height
+
+    def ensure_full_resolution_image(self):
+        """frames模式下把缩小解码的图片换成原图（编辑bbox时需要精确像素）"""
+        if self.current_image is None or not self.current_image_size or not self.current_image_path:
+            return
+        if self.current_image.shape[1] >= self.current_image_size[0]:
+            return
+        image = cv2.imread(str(self.current_image_path))
+        if image is None:
+            return
+        self.current_image = image
+        decoded = Future()
+        decoded.set_result((self.current_image_path, image, self.current_image_size))
+        self.image_cache[(self.current_sport, self.current_event, self.current_id)] = decoded
+
+    def run_in_background(self, fn, *args, on_done=None, **kwargs):
+        """在线程池中执行任务，完成后通过 root.after 在主线程回调"""
+        future = self.executor.submit(fn, *args, **kwargs)
+
+        def check():
+            if not future.done():
+                self.root.after(15, check)
+            elif on_done:
+                on_done(future)
+
+        self.root.after(15, check)
+        return future
+
+    def show_loading_state(self, json_path):
+        """加载过程中的界面提示"""
+        self.annotation_text.delete(1.0, tk.END)
+        self.annotation_text.insert(1.0, f"Loading {self.journal_path_key(json_path)} ...")
+        self.file_info_label.config(text="Loading...")
+        self.video_canvas.delete("all")
+        self.video_canvas.create_text(
+            max(self.video_canvas.winfo_width() // 2, 1), max(self.video_canvas.winfo_height() // 2, 1),
+            text="Loading...", fill='white', font=('Arial', 20, 'bold'),
+        )
+
+    def apply_loaded_file(self, future, generation, on_loaded=None):
+        """在主线程应用后台加载结果（已被新请求取代的结果直接丢弃）"""
+        if future.cancelled():
+            return
         try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.current_annotations = data.get('annotations', [])
-                self.current_annotation_index = 0
-                
-            # 加载对应的媒体文件
-            if self.current_type == "clips":
-                self.load_video()
-            else:
-                self.load_frame()
-                
-            self.display_current_annotation()
-            self.find_bbox_frames()  # 查找包含bbox的帧
-            self.find_window_frames()  # 查找窗口帧
-            
+            result = future.result()
+        except LoadCancelled:
+            return
         except Exception as e:
+            if generation != self.load_generation:
+                return
+            self.load_future = None
+            self.annotation_text.delete(1.0, tk.END)
+            self.annotation_text.insert(1.0, "Failed to load data")
+            self.file_info_label.config(text="")
             messagebox.showerror("Error", f"Failed to load data: {str(e)}")
-            
-    def load_video(self):
-        """加载视频文件"""
-        video_path = None
-        
-        # 尝试不同的视频格式
-        for ext in ['.mp4', '.avi', '.mov', '.mkv']:
-            candidate_path = (self.dataset_path / self.current_sport / 
-                            self.current_event / "clips" / f"{self.current_id}{ext}")
-            if candidate_path.exists():
-                video_path = candidate_path
-                break
-                
-        if not video_path:
-            messagebox.showerror("Error", f"Video file not found: {self.current_sport}/{self.current_event}/clips/{self.current_id}")
             return
-            
-        if self.video_cap:
-            self.video_cap.release()
-            
-        self.video_cap = cv2.VideoCapture(str(video_path))
-        if not self.video_cap.isOpened():
-            messagebox.showerror("Error", f"Cannot open video file: {video_path}")
+        if generation != self.load_generation:
+            # 加载期间已发起了新的加载
+            result.release()
             return
-            
-        self.total_frames = int(self.video_cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.fps = self.video_cap.get(cv2.CAP_PROP_FPS) or 30
-        self.current_frame = 0
-        
-        self.update_frame_display()
-        
-    def load_frame(self):
-        """加载单帧图片"""
-        frame_path = None
-        
-        # 尝试不同的图片格式
-        for ext in ['.jpg', '.jpeg', '.png', '.bmp']:
-            candidate_path = (self.dataset_path / self.current_sport / 
-                            self.current_event / "frames" / f"{self.current_id}{ext}")
-            if candidate_path.exists():
-                frame_path = candidate_path
-                break
-                
-        # 如果默认路径不存在，尝试从标注中的 _debug.frame_path 读取
-        if not frame_path and self.current_annotations:
-            try:
-                current_annotation = self.current_annotations[self.current_annotation_index]
-                debug_info = current_annotation.get('_debug', {})
-                debug_path_str = debug_info.get('frame_path')
-                if debug_path_str:
-                    debug_path = Path(debug_path_str).expanduser()
-                    if debug_path.is_file():
-                        frame_path = debug_path
-            except Exception as e:
-                print(f"Failed to use debug frame path: {e}")
+        self.load_future = None
+        json_path = result.json_path
+
+        data = result.data
+        self.current_data = data
+        # 每次加载都清空撤销历史：重新加载（F5）可能读到外部修改，按索引/路径记录的补丁已不再对应
+        self.history.clear()
+        self.current_annotations = data.get('annotations', [])
+        self.current_annotation_index = 0
+        if self.review_store:
+            self.review_store.apply_to(self.journal_path_key(json_path), self.current_annotations)
+        self.saved_digests[json_path] = content_digest(result.raw)
+        if result.old_loaded:
+            self.old_cache[self.get_old_json_path()] = result.old_data
+        self.mot_cache.update(result.mot)
+        self.build_old_matches()
+
+        # 应用对应的媒体文件
+        if self.current_type == "clips":
+            self.load_video(result)
+        else:
+            self.load_frame(result)
+
+        self.display_current_annotation()
+        if on_loaded:
+            on_loaded()
 
-        if not frame_path:
-            messagebox.showerror("Error", f"Image file not found: {self.current_sport}/{self.current_event}/frames/{self.current_id}")
+    def load_video(self, result):
+        """应用后台打开的视频（首帧已解码）"""
+        if result.media_error:
+            messagebox.showerror("Error", result.media_error)
             return
-            
-        self.current_image = cv2.imread(str(frame_path))
-        if self.current_image is None:
-            messagebox.showerror("Error", f"Cannot load image: {frame_path}")
+        self.video_cap = result.capture
+        self.clip_proxies = result.proxies
+        self.current_video_path = result.media_path
+        self.total_frames = result.total_frames
+        self.fps = result.fps
+        self.current_frame = result.first_frame_index
+        self.cap_pos = result.next_frame_index
+        self.frame_cache = result.frames
+        if result.first_frame is not None:
+            self.last_raw_frame = (result.first_frame_index, result.first_frame)
+        
+    def load_frame(self, result):
+        """应用后台读取的单帧图片"""
+        if result.media_error:
+            messagebox.showerror("Error", result.media_error)
             return
-            
-        self.display_frame_with_annotations()
+        self.current_image = result.image
+        self.current_image_size = result.image_size
+        self.current_image_path = result.media_path
 
     def get_old_json_path(self):
         """构造旧数据集中对应文件的路径"""
@@ -633,35 +843,53 @@ class AnnotationReviewer:
             self.old_cache[old_json_path] = None
             return None
 
+    def get_old_lookup(self):
+        """获取旧数据按任务分组的匹配表（与旧数据一起缓存）"""
+        old_json_path = self.get_old_json_path()
+        if old_json_path is None:
+            return None
+        if old_json_path not in self.old_lookup_cache:
+            old_data = self.load_old_annotations()
+            annotations = old_data.get('annotations', []) if old_data else []
+            self.old_lookup_cache[old_json_path] = build_old_lookup(annotations) if annotations else None
+        return self.old_lookup_cache[old_json_path]
+
     def find_old_annotation(self, annotation):
         """在旧数据中查找同任务且已审核的annotation"""
-        old_data = self.load_old_annotations()
-        if not old_data:
-            return None
-        annotations = old_data.get('annotations', [])
-        target_task = annotation.get('task_L2')
-        if not target_task:
+        lookup = self.get_old_lookup()
+        if not lookup:
             return None
-        candidates = [
-            ann for ann in annotations
-            if ann.get('task_L2') == target_task and ann.get('reviewed', False)
-        ]
-        if not candidates:
-            return None
-
-        target_id = annotation.get('annotation_id')
-        if target_id is not None:
-            for ann in candidates:
-                if ann.get('annotation_id') == target_id:
-                    return ann
-
-        target_question = str(annotation.get('question', '')).strip()
-        if target_question:
-            for ann in candidates:
-                if str(ann.get('question', '')).strip() == target_question:
-                    return ann
-
-        return candidates[0]
+        return match_old_annotation(annotation, lookup)
+
+    def build_old_matches(self):
+        """加载文件时一次性计算当前annotations与旧数据的对应关系"""
+        self.old_matches = match_old_annotations(self.current_annotations, lookup=self.get_old_lookup())
+        self.update_file_info()
+
+    def reindex_old_matches(self, index, removed):
+        """删除或插入标注后平移旧数据匹配表，不重新计算其它标注"""
+        if removed:
+            self.old_matches = {
+                (i - 1 if i > index else i): match
+                for i, match in self.old_matches.items() if i != index
+            }
+        else:
+            self.old_matches = {
+                (i + 1 if i >= index else i): match
+                for i, match in self.old_matches.items()
+            }
+            match = self.find_old_annotation(self.current_annotations[index])
+            if match is not None:
+                self.old_matches[index] = match
+        self.update_file_info()
+
+    def update_file_info(self):
+        """在文件列表下方显示当前文件的标注数量与旧数据匹配数"""
+        total = len(self.current_annotations)
+        if not total:
+            self.file_info_label.config(text="")
+            return
+        self.file_info_label.config(text=f"Annotations: {total} | With old: {len(self.old_matches)}/{total}")
         
     def display_current_annotation(self, refresh_media=True):
         """显示当前标注信息"""
@@ -680,10 +908,7 @@ class AnnotationReviewer:
         if not self.bbox_edit_mode:
             self.edit_annotation_key = None
             self.active_edit_target = None
-        self.current_old_annotation = self.find_old_annotation(annotation)
-        current_key = (self.current_json_path, self.current_annotation_index)
-        if self.last_transfer and self.last_transfer.get('key') != current_key:
-            self.last_transfer = None
+        self.current_old_annotation = self.old_matches.get(self.current_annotation_index)
         
         # Display annotation info
         info_text = f"Annotation {self.current_annotation_index + 1}/{len(self.current_annotations)}\n\n"
@@ -724,13 +949,24 @@ class AnnotationReviewer:
         self.annotation_text.insert(1.0, info_text)
         
         if refresh_media:
-            # 更新可视化
+            # 更新可视化（解码与绘制合并到空闲时执行，连按 N/P 时只绘制最后一个标注）
             if self.current_type == "clips":
                 self.find_bbox_frames()  # 重新查找bbox帧
                 self.find_window_frames()  # 重新查找窗口帧
-                self.update_video_display()
+                self.schedule_render(self.update_video_display)
             else:
-                self.display_frame_with_annotations()
+                self.schedule_render(self.display_frame_with_annotations)
+
+    def schedule_render(self, render):
+        """在Tk空闲时执行绘制；之后又有新请求时本次请求作废"""
+        self.render_generation += 1
+        generation = self.render_generation
+
+        def run():
+            if generation == self.render_generation:
+                render()
+
+        self.root.after_idle(run)
 
     def toggle_old_transfer(self):
         """切换是否应用旧数据中的annotation内容"""
@@ -741,70 +977,72 @@ class AnnotationReviewer:
         idx = self.current_annotation_index
         current_annotation = self.current_annotations[idx]
 
-        current_key = (self.current_json_path, idx)
-
-        # 若已经应用过旧数据，则撤销到原始内容
-        if self.last_transfer and self.last_transfer.get('key') == current_key and self.last_transfer.get('applied'):
-            self.current_annotations[idx] = copy.deepcopy(self.last_transfer['original'])
-            self.last_transfer['applied'] = False
+        # 若刚刚对当前标注应用过旧数据，则撤销到原始内容
+        last_action = self.history.last()
+        if last_action and last_action.label == 'transfer' and last_action.index == idx:
+            self.undo_edit()
             messagebox.showinfo("Undo", "已撤销本次一键替换")
-            self.display_current_annotation()
             return
 
-        old_annotation = self.current_old_annotation or self.find_old_annotation(current_annotation)
+        old_annotation = self.old_matches.get(idx)
         if not old_annotation:
             messagebox.showinfo("Info", "旧数据不存在同任务且已审核的标注")
             return
 
-        self.last_transfer = {
-            'key': current_key,
-            'annotation_idx': idx,
-            'original': copy.deepcopy(current_annotation),
-            'applied': False,
-        }
-
+        # 旧数据缓存需保持不变，替换内容使用其副本
         new_annotation = copy.deepcopy(old_annotation)
         new_annotation['reviewed'] = current_annotation.get('reviewed', False)
-        self.current_annotations[idx] = new_annotation
-        self.last_transfer['applied'] = True
+        before = list(self.current_annotations)
+        action = EditAction('transfer', idx)
+        action.replace(self.current_annotations, new_annotation)
+        self.history.record(action)
+        self.record_mutation('set', idx)
+        self.resync_review_store(before)
         messagebox.showinfo("Success", "已应用旧数据内容（按 T 再次撤销）")
         self.display_current_annotation()
             
     def update_video_display(self):
         """更新视频显示with标注"""
-        if not self.video_cap:
+        if not self.video_cap or not self.current_annotations:
             return
             
         annotation = self.current_annotations[self.current_annotation_index]
+        self.use_proxy_for(annotation)
         
-        # 获取窗口帧范围
-        window_start, window_end = 0, self.total_frames - 1
-        if 'Q_window_frame' in annotation:
-            window_start, window_end = annotation['Q_window_frame']
-        elif 'A_window_frame' in annotation and isinstance(annotation['A_window_frame'], list):
-            if len(annotation['A_window_frame']) > 0:
-                first_window = annotation['A_window_frame'][0]
-                if isinstance(first_window, str) and '-' in first_window:
-                    window_start = int(first_window.split('-')[0])
-                elif isinstance(first_window, (int, float)):
-                    window_start = int(first_window)
-                    
         # 设置视频到窗口开始帧
-        self.current_frame = window_start
-        self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
+        self.current_frame = annotation_window_start(annotation)
         
         # 开始播放
         if not self.is_playing:
             self.is_playing = True
             self.play_video_with_annotations()
             
+    def use_proxy_for(self, annotation):
+        """有覆盖该标注窗口的代理片段时改用代理播放（帧号与bbox坐标仍为原视频的）"""
+        proxy = choose_proxy(self.clip_proxies, annotation) if self.clip_proxies else None
+        cap = self.video_cap
+        if proxy is None or (isinstance(cap, ProxyCapture) and cap.proxy_path == proxy['proxy_path']):
+            return
+        proxy_cap = ProxyCapture(proxy, self.current_video_path)
+        if not proxy_cap.isOpened():
+            proxy_cap.release()
+            return
+        # 已打开的原视频交给新的代理继续用于窗口外的帧
+        if isinstance(cap, ProxyCapture):
+            proxy_cap.source = cap.detach_source()
+            cap.release()
+        else:
+            proxy_cap.source = cap
+        self.video_cap = proxy_cap
+        self.cap_pos = None
+
     def play_video_with_annotations(self):
         """播放视频并显示标注"""
         if not self.is_playing or not self.video_cap:
             return
             
-        ret, frame = self.video_cap.read()
-        if not ret or self.current_frame >= self.total_frames:
+        frame = self.read_video_frame(self.current_frame)
+        if frame is None or self.current_frame >= self.total_frames:
             if self.is_playing:  # 只有在播放状态下才循环播放
                 self.replay()  # 循环播放
             return
@@ -883,21 +1121,30 @@ class AnnotationReviewer:
         if not self.video_cap:
             return
             
-        # 保存当前位置
-        current_pos = self.video_cap.get(cv2.CAP_PROP_POS_FRAMES)
-        
-        # 回到当前帧位置并读取
-        self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-        ret, frame = self.video_cap.read()
-        
-        if ret:
+        frame = self.read_video_frame(self.current_frame)
+        if frame is not None:
             # 绘制标注
             annotated_frame = self.draw_annotations_on_frame(frame)
             # 显示帧
             self.display_frame_on_canvas(annotated_frame)
-        
-        # 恢复位置
-        self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, current_pos)
+
+    def read_video_frame(self, frame_index):
+        """读取指定帧：重复读取同一帧直接复用，顺序读取时不重新seek"""
+        if not self.video_cap:
+            return None
+        if self.last_raw_frame and self.last_raw_frame[0] == frame_index:
+            return self.last_raw_frame[1]
+        if frame_index in self.frame_cache:
+            return self.frame_cache[frame_index]
+        if self.cap_pos != frame_index:
+            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        ret, frame = self.video_cap.read()
+        if not ret:
+            self.cap_pos = None
+            return None
+        self.cap_pos = frame_index + 1
+        self.last_raw_frame = (frame_index, frame)
+        return frame
         
     def draw_annotations_on_frame(self, frame):
         """在帧上绘制标注"""
@@ -908,144 +1155,37 @@ class AnnotationReviewer:
             
         annotation = self.current_annotations[self.current_annotation_index]
         
-        # 绘制窗口标记
-        self.draw_window_markers(annotated_frame, annotation)
-        
-        # 绘制bounding boxes
-        self.draw_bounding_boxes(annotated_frame, annotation)
+        # W键导航模式下显示当前导航的标签，否则显示常规的Q窗口标记
+        marker = self.current_w_label if self.w_paused and getattr(self, 'current_w_label', None) else None
+        mot_file = mot_file_of(annotation)
+        mot_boxes = self.get_mot_boxes(mot_file).get(self.current_frame, []) if mot_file else ()
+        draw_annotation(annotated_frame, annotation, self.current_frame, mot_boxes, marker)
         
         return annotated_frame
-        
-    def draw_window_markers(self, frame, annotation):
-        """绘制窗口开始和结束标记"""
-        # 如果在W键导航模式，显示当前导航的标签
-        if self.w_paused and hasattr(self, 'current_w_label') and self.current_w_label:
-            # 显示当前W键导航要显示的标签
-            display_text = self.current_w_label.replace("_", " ")
-            print(f"Drawing marker: frame={self.current_frame}, label={display_text}")
-            
-            if "BEGIN" in self.current_w_label or "POINT" in self.current_w_label:
-                # 绿色开始标记
-                cv2.rectangle(frame, (15, 15), (400, 120), (0, 255, 0), -1)
-                cv2.rectangle(frame, (10, 10), (405, 125), (0, 200, 0), 8)
-                cv2.putText(frame, display_text, (25, 75), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 2.2, (0, 0, 0), 4)
-                # 闪烁效果
-                if (self.current_frame // 2) % 2 == 0:
-                    cv2.rectangle(frame, (12, 12), (403, 123), (255, 255, 255), 3)
-            elif "END" in self.current_w_label:
-                # 红色结束标记
-                cv2.rectangle(frame, (15, 15), (350, 120), (0, 0, 255), -1)
-                cv2.rectangle(frame, (10, 10), (355, 125), (0, 0, 200), 8)
-                cv2.putText(frame, display_text, (25, 75), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 2.2, (255, 255, 255), 4)
-                # 闪烁效果
-                if (self.current_frame // 2) % 2 == 0:
-                    cv2.rectangle(frame, (12, 12), (353, 123), (255, 255, 255), 3)
-        else:
-            # 非W键导航模式：显示常规的窗口标记
-            if 'Q_window_frame' in annotation:
-                start, end = annotation['Q_window_frame']
-                if self.current_frame == start:
-                    cv2.rectangle(frame, (15, 15), (350, 120), (0, 255, 0), -1)
-                    cv2.rectangle(frame, (10, 10), (355, 125), (0, 200, 0), 8)
-                    cv2.putText(frame, "Q BEGIN", (25, 75), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 2.2, (0, 0, 0), 4)
-                elif self.current_frame == end:
-                    cv2.rectangle(frame, (15, 15), (320, 120), (0, 0, 255), -1)
-                    cv2.rectangle(frame, (10, 10), (325, 125), (0, 0, 200), 8)
-                    cv2.putText(frame, "Q END", (25, 75), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 2.2, (255, 255, 255), 4)
-                           
-    def draw_bounding_boxes(self, frame, annotation):
-        """绘制边界框"""
-        # 静态边界框
-        if 'bounding_box' in annotation:
-            boxes = annotation['bounding_box']
-            if (
-                isinstance(boxes, list)
-                and len(boxes) == 4
-                and all(isinstance(coord, (int, float)) for coord in boxes)
-            ):
-                self.draw_single_bbox(frame, boxes, 'Object 1', (0, 255, 255))
-            else:
-                for i, box_info in enumerate(boxes):
-                    if isinstance(box_info, dict) and 'box' in box_info:
-                        box = box_info['box']
-                        label = box_info.get('label', f'Object {i+1}')
-                        self.draw_single_bbox(frame, box, label, (0, 255, 255))
-                    elif isinstance(box_info, list) and len(box_info) == 4:
-                        self.draw_single_bbox(frame, box_info, f'Object {i+1}', (0, 255, 255))
-                    
-        # 第一帧边界框
-        if 'first_bounding_box' in annotation:
-            box = annotation['first_bounding_box']
-            self.draw_single_bbox(frame, box, 'Tracked Object', (255, 0, 0))
-            
-        # MOT追踪框
-        if 'tracking_bboxes' in annotation and 'mot_file' in annotation['tracking_bboxes']:
-            self.draw_mot_boxes(frame, annotation['tracking_bboxes']['mot_file'])
-            
-    def draw_single_bbox(self, frame, box, label, color):
-        """绘制单个边界框"""
-        x1, y1, x2, y2 = map(int, box)
-        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-        cv2.putText(frame, label, (x1, y1 - 10), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
                    
-    def draw_mot_boxes(self, frame, mot_file):
-        """绘制MOT追踪框"""
-        mot_path = Path(mot_file)
-        if mot_path.exists():
-            try:
-                with open(mot_path, 'r') as f:
-                    for line in f:
-                        parts = line.strip().split(',')
-                        if len(parts) >= 6:
-                            frame_id = int(parts[0])
-                            if frame_id == self.current_frame + 1:  # MOT格式帧从1开始
-                                x, y, w, h = map(float, parts[2:6])
-                                x1, y1, x2, y2 = int(x), int(y), int(x + w), int(y + h)
-                                cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 255, 0), 2)
-                                cv2.putText(frame, f"ID:{parts[1]}", (x1, y1 - 10),
-                                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            except Exception as e:
-                print(f"读取MOT文件失败: {e}")
-                
+    def get_mot_boxes(self, mot_file):
+        """获取解析后的MOT数据（按帧索引），未缓存时同步解析"""
+        if mot_file not in self.mot_cache:
+            self.mot_cache.update(load_mot_files([mot_file]))
+        return self.mot_cache[mot_file]
+
     def display_frame_with_annotations(self):
         """显示带标注的单帧图片"""
         if self.current_image is None:
             return
             
         annotated_frame = self.current_image.copy()
+        source_size = self.current_image_size or (annotated_frame.shape[1], annotated_frame.shape[0])
         
         if self.current_annotations:
+            # 绘制边界框（标注坐标为原图像素，缩小解码时按比例绘制）
             annotation = self.current_annotations[self.current_annotation_index]
-            
-            # 绘制边界框
-            if 'bounding_box' in annotation:
-                boxes = annotation['bounding_box']
-                if (
-                    isinstance(boxes, list)
-                    and len(boxes) == 4
-                    and all(isinstance(coord, (int, float)) for coord in boxes)
-                ):
-                    self.draw_single_bbox(annotated_frame, boxes, 'Object 1', (0, 255, 255))
-                else:
-                    for i, box_info in enumerate(boxes):
-                        if isinstance(box_info, dict) and 'box' in box_info:
-                            box = box_info['box']
-                            label = box_info.get('label', f'Object {i+1}')
-                            self.draw_single_bbox(annotated_frame, box, label, (0, 255, 255))
-                        elif isinstance(box_info, list) and len(box_info) == 4:
-                            self.draw_single_bbox(annotated_frame, box_info, f'Object {i+1}', (0, 255, 255))
-            if 'first_bounding_box' in annotation:
-                self.draw_single_bbox(annotated_frame, annotation['first_bounding_box'], 'Tracked Object', (255, 0, 0))
+            draw_static_boxes(annotated_frame, annotation, annotated_frame.shape[1] / source_size[0])
                         
-        self.display_frame_on_canvas(annotated_frame)
+        self.display_frame_on_canvas(annotated_frame, source_size=source_size)
         
-    def display_frame_on_canvas(self, frame):
-        """在画布上显示帧"""
+    def display_frame_on_canvas(self, frame, source_size=None):
+        """在画布上显示帧（source_size 为原图尺寸，frame 可能是缩小解码的）"""
         # 获取画布尺寸
         canvas_width = self.video_canvas.winfo_width()
         canvas_height = self.video_canvas.winfo_height()
@@ -1059,16 +1199,18 @@ class AnnotationReviewer:
         
         new_width = int(frame_width * scale)
         new_height = int(frame_height * scale)
+        source_width, source_height = source_size or (frame_width, frame_height)
+        source_scale = new_width / source_width
         
         resized_frame = cv2.resize(frame, (new_width, new_height))
         
-        # 在编辑模式下绘制临时bbox
+        # 在编辑模式下绘制临时bbox（temp_bbox 为原图坐标）
         if self.bbox_edit_mode and self.temp_bbox:
             temp_bbox_scaled = [
-                int(self.temp_bbox[0] * scale),
-                int(self.temp_bbox[1] * scale),
-                int(self.temp_bbox[2] * scale),
-                int(self.temp_bbox[3] * scale)
+                int(self.temp_bbox[0] * source_scale),
+                int(self.temp_bbox[1] * source_scale),
+                int(self.temp_bbox[2] * source_scale),
+                int(self.temp_bbox[3] * source_scale)
             ]
             cv2.rectangle(resized_frame, (temp_bbox_scaled[0], temp_bbox_scaled[1]), 
                          (temp_bbox_scaled[2], temp_bbox_scaled[3]), (255, 255, 0), 3)
@@ -1089,10 +1231,10 @@ class AnnotationReviewer:
         self.video_canvas.create_image(x, y, anchor=tk.NW, image=photo)
         self.video_canvas.image = photo  # 保持引用
         
-        # 保存帧信息用于坐标转换
+        # 保存帧信息用于坐标转换（宽高为原图尺寸，点击坐标换算回原图像素）
         self.last_frame_info = {
-            'width': frame_width,
-            'height': frame_height,
+            'width': source_width,
+            'height': source_height,
             'x': x,
             'y': y,
             'display_width': new_width,
@@ -1114,7 +1256,6 @@ class AnnotationReviewer:
                 window_start = annotation['Q_window_frame'][0]
                 
             self.current_frame = window_start
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
             # 只有当前已经在播放状态时才继续播放
             if self.is_playing:
                 self.play_video_with_annotations()
@@ -1125,11 +1266,10 @@ class AnnotationReviewer:
             progress = self.progress_var.get()
             new_frame = int((progress / 100) * self.total_frames)
             self.current_frame = new_frame
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
             # 暂停播放以便用户查看当前帧
             if self.is_playing:
                 self.is_playing = False
-            self.update_frame_display()
+            self.schedule_render(self.update_frame_display)
             
     def on_progress_change(self, event):
         """进度条变化回调"""
@@ -1137,14 +1277,13 @@ class AnnotationReviewer:
             progress = self.progress_var.get()
             new_frame = int((progress / 100) * self.total_frames)
             self.current_frame = new_frame
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-            self.update_frame_display()
+            self.schedule_render(self.update_frame_display)
             
     def update_frame_display(self):
         """更新帧显示"""
         if self.video_cap:
-            ret, frame = self.video_cap.read()
-            if ret:
+            frame = self.read_video_frame(self.current_frame)
+            if frame is not None:
                 annotated_frame = self.draw_annotations_on_frame(frame)
                 self.display_frame_on_canvas(annotated_frame)
                 
@@ -1167,30 +1306,145 @@ class AnnotationReviewer:
     def mark_reviewed(self):
         """标记当前标注为已审核"""
         if self.current_annotations and self.current_annotation_index < len(self.current_annotations):
-            self.current_annotations[self.current_annotation_index]['reviewed'] = True
+            self.record_reviewed(self.current_annotation_index)
+            if self.review_store:
+                # 审核状态只写入状态库，不需要重写JSON
+                self.store_review_flags(self.current_annotation_index, reviewed=True)
+            else:
+                self.record_mutation('set', self.current_annotation_index)
+            if self.review_queue is not None:
+                self.review_queue.discard(self.queue_position())
+                self.update_queue_status()
             self.display_current_annotation()
             messagebox.showinfo("Info", "Marked as reviewed")
             
+    def mark_reviewed_bulk(self, selection):
+        """批量标记已审核（画廊使用）：selection 为 {json文件: [annotation索引]}
+
+        当前打开的文件直接修改内存中的标注；其他文件启用状态库时写入状态库，
+        否则读取后修改并交给后台写入线程，同时记录编辑日志。
+        返回 (标记数量, {失败的文件: 错误信息})。
+        """
+        marked = 0
+        failed = {}
+        for json_path, indices in selection.items():
+            if json_path == self.current_json_path and self.current_data is not None:
+                for idx in indices:
+                    if idx >= len(self.current_annotations):
+                        continue
+                    self.record_reviewed(idx)
+                    if self.review_store:
+                        self.store_review_flags(idx, reviewed=True)
+                    else:
+                        self.record_mutation('set', idx)
+                    marked += 1
+                continue
+            try:
+                rel = self.journal_path_key(json_path)
+                raw = self.read_json_bytes(json_path)
+                data = json.loads(raw.decode('utf-8'))
+                annotations = data.get('annotations', [])
+                changed = [idx for idx in indices if idx < len(annotations)]
+                if self.review_store:
+                    for idx in changed:
+                        self.review_store.set_state(rel, annotation_key(annotations[idx], idx), reviewed=True)
+                    marked += len(changed)
+                    continue
+                changed = [idx for idx in changed if not annotations[idx].get('reviewed', False)]
+                if not changed:
+                    continue
+                self.journal.append({'op': 'base', 'path': rel, 'digest': content_digest(raw)})
+                for idx in changed:
+                    annotations[idx]['reviewed'] = True
+                    self.journal.append({'op': 'set', 'path': rel, 'index': idx, 'annotation': annotations[idx]})
+                payload = serialize_json(data)
+                digest = content_digest(payload)
+                self.save_queue.submit(json_path, payload, digest)
+                self.saved_digests[json_path] = digest
+                self.journal.append({'op': 'commit', 'path': rel, 'digest': digest})
+                marked += len(changed)
+            except Exception as e:
+                failed[json_path] = str(e)
+        self.update_save_status()
+        if self.current_json_path in selection:
+            self.display_current_annotation(refresh_media=False)
+        return marked, failed
+
+    def record_reviewed(self, index):
+        """通过撤销历史设置 reviewed：被替换/撤销的标注对象不能在历史之外被修改"""
+        action = EditAction('mark reviewed', index)
+        action.set_field(self.current_annotations[index], ('reviewed',), True)
+        self.history.record(action)
+
+    def store_review_flags(self, index, reviewed=None, retrack=None):
+        """将审核状态写入状态库（未启用时忽略）"""
+        if not self.review_store or self.current_json_path is None:
+            return
+        key = annotation_key(self.current_annotations[index], index)
+        self.review_store.set_state(self.journal_path_key(self.current_json_path), key,
+                                    reviewed=reviewed, retrack=retrack)
+
+    def resync_review_store(self, before):
+        """删除/恢复/替换标注或撤销后，让状态库中的行跟随标注移动（idx: 键会随索引变化）
+
+        before 为修改前的标注列表（浅拷贝）。
+        """
+        if not self.review_store or self.current_json_path is None:
+            return
+        self.review_store.rekey_file_states(self.journal_path_key(self.current_json_path),
+                                            before, self.current_annotations)
+
+    def journal_path_key(self, json_path):
+        """日志中使用相对于输出目录的路径"""
+        return json_path.relative_to(self.output_path).as_posix()
+
+    def record_mutation(self, op, index):
+        """记录当前文件的一次修改：追加到编辑日志并标记为未保存"""
+        json_path = self.current_json_path
+        if json_path is None:
+            return
+        rel = self.journal_path_key(json_path)
+        if json_path not in self.dirty_paths:
+            self.journal.append({'op': 'base', 'path': rel, 'digest': self.saved_digests.get(json_path)})
+        record = {'op': op, 'path': rel, 'index': index}
+        if op in ('set', 'insert'):
+            record['annotation'] = self.current_annotations[index]
+        self.journal.append(record)
+        self.dirty_paths.add(json_path)
+        self.last_edit_time = time.time()
+
     def save_data(self, silent=False):
-        """保存标注数据"""
+        """保存标注数据（仅写入有修改的文件，使用临时文件+原子重命名）"""
         if not all([self.current_sport, self.current_event, self.current_id, self.current_type]):
             messagebox.showwarning("Warning", "No data to save")
             return
             
-        json_path = (self.output_path / self.current_sport / 
-                    self.current_event / self.current_type / f"{self.current_id}.json")
+        if self.load_future is not None:
+            # 加载期间 current_annotations 已清空，写出会丢失标注
+            if not silent:
+                messagebox.showinfo("Info", "File is still loading")
+            return
+
+        json_path = self.current_json_path
+        if json_path is None or self.current_data is None or json_path not in self.dirty_paths:
+            if not silent:
+                messagebox.showinfo("Info", "No changes to save")
+            return
         
         try:
-            # Read original data
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
             # Update annotation data
+            data = dict(self.current_data)
             data['annotations'] = self.current_annotations
-            
-            # Save data
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            payload = serialize_json(data)
+            digest = content_digest(payload)
+
+            # 内容与磁盘一致时跳过写入，否则交给后台线程写入
+            if digest != self.saved_digests.get(json_path):
+                self.save_queue.submit(json_path, payload, digest)
+                self.saved_digests[json_path] = digest
+                self.journal.append({'op': 'commit', 'path': self.journal_path_key(json_path), 'digest': digest})
+                self.update_save_status()
+            self.dirty_paths.discard(json_path)
                 
             if not silent:
                 messagebox.showinfo("Success", "Data saved")
@@ -1198,25 +1452,191 @@ class AnnotationReviewer:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save data: {str(e)}")
 
+    def read_json_bytes(self, json_path):
+        """读取JSON文件内容，优先使用尚未写入磁盘的排队数据"""
+        pending = self.save_queue.latest_payload(json_path)
+        if pending is not None:
+            return pending
+        with open(json_path, 'rb') as f:
+            return f.read()
+
+    def poll_save_queue(self):
+        """定时检查后台写入结果，失败时恢复脏标记并提示；空闲时把编辑日志压缩进JSON"""
+        failures = []
+        for json_path, digest, error in self.save_queue.drain_results():
+            if error is None:
+                self.finish_journal_recovery(json_path, digest)
+                if self.index_path.exists():
+                    self.run_in_background(self.refresh_index_file, json_path)
+                continue
+            if self.saved_digests.get(json_path) == digest:
+                self.saved_digests.pop(json_path, None)
+                self.dirty_paths.add(json_path)
+            failures.append(f"{json_path}: {error}")
+        self.update_save_status(failures[-1] if failures else None)
+        if failures:
+            print("Background save failed:\n" + "\n".join(failures))
+            messagebox.showerror("Error", "Failed to save data:\n" + "\n".join(failures) + "\n\nPress S to retry.")
+        self.compact_journal()
+        self.save_poll_id = self.root.after(200, self.poll_save_queue)
+
+    def compact_journal(self):
+        """编辑停止一段时间后在后台写回JSON，全部落盘后清空编辑日志"""
+        if self.load_future is not None:
+            return
+        if (self.current_json_path in self.dirty_paths
+                and time.time() - self.last_edit_time >= self.journal_compact_delay):
+            self.save_data(silent=True)
+        if self.journal.record_count and not self.dirty_paths and not self.save_queue.pending_count():
+            self.journal.checkpoint()
+
+    def recover_journals(self):
+        """启动时重放上次异常退出遗留的编辑日志"""
+        recovered, skipped = [], []
+        for journal_path in stale_journals(self.journal.directory, self.journal.path):
+            try:
+                writes, missed = replay_journal(read_journal(journal_path), self.output_path)
+            except Exception as e:
+                print(f"Failed to replay journal {journal_path}: {e}")
+                continue
+            pending = set()
+            for json_path, payload, digest in writes:
+                self.save_queue.submit(json_path, payload, digest)
+                self.saved_digests[json_path] = digest
+                pending.add((json_path, digest))
+                recovered.append(str(json_path))
+            skipped.extend(str(path) for path in missed)
+            if missed:
+                journal_path.replace(journal_path.with_suffix('.orphaned'))
+            elif pending:
+                self.recovering_journals[journal_path] = pending
+            else:
+                journal_path.unlink()
+        if recovered or skipped:
+            message = f"Recovered unsaved edits in {len(recovered)} file(s) from the edit journal."
+            if skipped:
+                message += ("\n\nSkipped files changed since the crash (journal kept as *.orphaned):\n"
+                            + "\n".join(skipped))
+            messagebox.showinfo("Recovery", message)
+
+    def finish_journal_recovery(self, json_path, digest):
+        """恢复的文件写入成功后删除对应的旧日志"""
+        for journal_path, pending in list(self.recovering_journals.items()):
+            pending.discard((json_path, digest))
+            if not pending:
+                del self.recovering_journals[journal_path]
+                try:
+                    journal_path.unlink()
+                except OSError:
+                    pass
+
+    def update_save_status(self, error=None):
+        """更新保存状态提示"""
+        if error:
+            self.save_status_label.config(text=f"Save failed: {error}", fg='#F44336')
+            return
+        pending = self.save_queue.pending_count()
+        if pending:
+            self.save_status_label.config(text=f"Saving... ({pending} pending)", fg='#FF9800')
+        elif self.save_status_label.cget('fg') != '#F44336':
+            self.save_status_label.config(text="All changes written" if self.saved_digests else "", fg='#666666')
+
+    def on_close(self):
+        """关闭窗口前保存当前修改并等待后台写入完成"""
+        self.stop_playback()
+        if self.current_json_path in self.dirty_paths:
+            self.save_data(silent=True)
+        if self.save_poll_id:
+            self.root.after_cancel(self.save_poll_id)
+            self.save_poll_id = None
+        self.prefetch_generation += 1
+        self.executor.shutdown(wait=False)
+        for future in self.image_cache.values():
+            future.cancel()
+        self.image_cache.clear()
+        self.image_executor.shutdown(wait=False)
+        for result, _stat in self.prefetch_cache.values():
+            result.release()
+        self.prefetch_cache.clear()
+        self.save_queue.close()
+        failures = []
+        for json_path, digest, error in self.save_queue.drain_results():
+            if error is None:
+                self.finish_journal_recovery(json_path, digest)
+            else:
+                failures.append(f"{json_path}: {error}")
+        # 全部写入成功才删除日志，否则保留供下次启动恢复
+        self.journal.close(remove=not failures and not self.dirty_paths)
+        if failures:
+            messagebox.showerror("Error", "Failed to save data:\n" + "\n".join(failures)
+                                 + "\n\nThe edit journal was kept and will be replayed on next start.")
+        self.root.destroy()
+
+    def undo_edit(self):
+        """撤销上一步修改（不重新加载文件或视频）"""
+        before = list(self.current_annotations)
+        self.apply_history_step(self.history.undo(self.current_annotations), undo=True, before=before)
+
+    def redo_edit(self):
+        """重做上一步被撤销的修改"""
+        before = list(self.current_annotations)
+        self.apply_history_step(self.history.redo(self.current_annotations), undo=False, before=before)
+
+    def apply_history_step(self, action, undo, before):
+        """撤销/重做后同步日志、旧数据匹配和显示"""
+        if action is None:
+            print("Nothing to undo" if undo else "Nothing to redo")
+            return
+        if action.structural:
+            # 删除/恢复标注会改变索引
+            self.record_mutation('insert' if undo else 'delete', action.index)
+            self.reindex_old_matches(action.index, removed=not undo)
+        else:
+            self.record_mutation('set', action.index)
+        self.resync_review_store(before)
+        index_changed = False
+        if self.current_annotations:
+            target = min(action.index, len(self.current_annotations) - 1)
+            index_changed = target != self.current_annotation_index
+            self.current_annotation_index = target
+        print(f"{'Undo' if undo else 'Redo'}: {action.label} (annotation {action.index + 1})")
+        self.display_current_annotation(refresh_media=index_changed or action.structural)
+        if not (index_changed or action.structural):
+            self.refresh_visual()
+
     def delete_current_annotation(self):
-        """删除当前标注并重新加载当前文件"""
+        """删除当前标注：直接更新内存中的列表和索引，保留已打开的视频"""
         if not self.current_annotations:
             messagebox.showwarning("Warning", "No annotation to delete")
             return
 
         idx = self.current_annotation_index
         total = len(self.current_annotations)
-        self.current_annotations.pop(idx)
-
-        # 持久化更改但不弹出保存成功提示
+        if self.bbox_edit_mode:
+            self.exit_bbox_edit_mode(notify=False, refresh=False)
+        before = list(self.current_annotations)
+        action = EditAction('delete', idx)
+        action.delete(self.current_annotations)
+        self.history.record(action)
+        self.record_mutation('delete', idx)
+        self.reindex_old_matches(idx, removed=True)
+        self.resync_review_store(before)
+
+        # 通过常规保存路径（后台写入）持久化，不弹出保存成功提示
         self.save_data(silent=True)
 
-        # 重新加载数据，相当于按下L键
-        self.load_data()
+        if self.current_annotations:
+            self.current_annotation_index = min(idx, len(self.current_annotations) - 1)
+            self.display_current_annotation()
+        else:
+            self.current_annotation_index = 0
+            self.stop_playback()
+            self.display_current_annotation()
+            self.refresh_visual()
 
         messagebox.showinfo(
             "Deleted",
-            f"Deleted annotation {min(idx + 1, total)}/{total}. File reloaded.",
+            f"Deleted annotation {idx + 1}/{total}. Press Ctrl+Z to undo.",
         )
 
     def swap_bbox_labels(self):
@@ -1242,8 +1662,13 @@ class AnnotationReviewer:
             messagebox.showinfo("Swap Labels", "Both bounding boxes need label fields")
             return
 
-        first['label'], second['label'] = label_b, label_a
-        annotation['retrack'] = True
+        action = EditAction('swap labels', self.current_annotation_index)
+        action.set_field(annotation, ('bounding_box', 0, 'label'), label_b)
+        action.set_field(annotation, ('bounding_box', 1, 'label'), label_a)
+        action.set_field(annotation, ('retrack',), True)
+        self.history.record(action)
+        self.record_mutation('set', self.current_annotation_index)
+        self.store_review_flags(self.current_annotation_index, retrack=True)
         self.display_current_annotation(refresh_media=False)
         self.refresh_visual()
         messagebox.showinfo(
@@ -1263,40 +1688,15 @@ class AnnotationReviewer:
         
         # 检查first_bounding_box对应的第一帧
         if 'first_bounding_box' in annotation:
-            window_start = 0
-            # 优先使用Q_window_frame的开始帧
-            if 'Q_window_frame' in annotation:
-                window_start = annotation['Q_window_frame'][0]
-            # 如果没有Q_window_frame但有A_window_frame，使用A_window_frame的第一个窗口开始帧
-            elif 'A_window_frame' in annotation:
-                a_windows = annotation['A_window_frame']
-                if isinstance(a_windows, list) and len(a_windows) > 0:
-                    first_window = a_windows[0]
-                    if isinstance(first_window, str) and '-' in first_window:
-                        window_start = int(first_window.split('-')[0])
-                    elif isinstance(first_window, (int, float)):
-                        window_start = int(first_window)
-            self.bbox_frames.append(window_start)
-        
-        # 检查MOT文件中的帧
-        if 'tracking_bboxes' in annotation and 'mot_file' in annotation['tracking_bboxes']:
-            mot_path = Path(annotation['tracking_bboxes']['mot_file'])
-            if mot_path.exists():
-                try:
-                    with open(mot_path, 'r') as f:
-                        frames_with_bbox = set()
-                        for line in f:
-                            parts = line.strip().split(',')
-                            if len(parts) >= 6:
-                                frame_id = int(parts[0]) - 1  # MOT格式从1开始，转换为0开始
-                                frames_with_bbox.add(frame_id)
-                        
-                        # 添加到bbox_frames列表（去重并排序）
-                        for frame_id in sorted(frames_with_bbox):
-                            if frame_id not in self.bbox_frames:
-                                self.bbox_frames.append(frame_id)
-                except Exception as e:
-                    print(f"Failed to read MOT file: {e}")
+            # 优先使用Q_window_frame的开始帧，否则使用A_window_frame的第一个窗口开始帧
+            self.bbox_frames.append(annotation_window_start(annotation))
+        
+        # 检查MOT文件中的帧（使用已解析的缓存）
+        mot_file = mot_file_of(annotation)
+        if mot_file:
+            for frame_id in sorted(self.get_mot_boxes(mot_file)):
+                if frame_id not in self.bbox_frames:
+                    self.bbox_frames.append(frame_id)
         
         # Sort bbox frames
         self.bbox_frames.sort()
@@ -1312,26 +1712,7 @@ class AnnotationReviewer:
             
         annotation = self.current_annotations[self.current_annotation_index]
         
-        # 1. 检查Q窗口
-        if 'Q_window_frame' in annotation:
-            start, end = annotation['Q_window_frame']
-            self.window_frames.append((start, "Q_BEGIN"))
-            if start != end:
-                self.window_frames.append((end, "Q_END"))
-            
-        # 2. 检查A窗口
-        if 'A_window_frame' in annotation:
-            a_windows = annotation['A_window_frame']
-            if isinstance(a_windows, list):
-                for i, window in enumerate(a_windows):
-                    if isinstance(window, str) and '-' in window:
-                        start, end = map(int, window.split('-'))
-                        self.window_frames.append((start, f"A{i+1}_BEGIN"))
-                        if start != end:
-                            self.window_frames.append((end, f"A{i+1}_END"))
-                    elif isinstance(window, (int, float)):
-                        frame_num = int(window)
-                        self.window_frames.append((frame_num, f"A{i+1}_POINT"))
+        self.window_frames = window_frames(annotation)
         
         print(f"Window frames sequence: {self.window_frames}")
     
@@ -1361,8 +1742,7 @@ class AnnotationReviewer:
             if self.current_bbox_index < len(self.bbox_frames):
                 target_frame = self.bbox_frames[self.current_bbox_index]
                 self.current_frame = target_frame
-                self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-                self.update_frame_display()
+                self.schedule_render(self.update_frame_display)
                 
                 # Pause playback
                 self.is_playing = False
@@ -1390,19 +1770,18 @@ class AnnotationReviewer:
             # 跳转到当前索引对应的窗口帧
             target_frame, frame_label = self.window_frames[self.current_window_index]
             self.current_frame = target_frame
-            self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
             
             # 暂停播放
             self.is_playing = False
             self.w_paused = True
             
-            # 设置当前要显示的标签（供draw_window_markers使用）
+            # 设置当前要显示的标签（供draw_annotations_on_frame使用）
             self.current_w_label = frame_label
             
             print(f"W key: Jump to frame {target_frame} ({frame_label}) - step {self.current_window_index + 1}/{len(self.window_frames)}")
             
             # 更新显示
-            self.update_frame_display()
+            self.schedule_render(self.update_frame_display)
             
             # 移动到下一步
             self.current_window_index += 1
@@ -1424,9 +1803,19 @@ class AnnotationReviewer:
         self.on_f5()
     
     def on_f5(self, event=None):
-        """F5: 重新加载当前文件"""
-        print(f"Reloaded: {self.get_relative_path(self.json_path)}")
-        self.load_data(self.json_path)
+        """F5: 重新加载当前文件并尽量停留在原来的标注"""
+        if not all([self.current_sport, self.current_event, self.current_id, self.current_type]):
+            messagebox.showwarning("Warning", "No file currently loaded to reload")
+            return
+        current_index = self.current_annotation_index
+
+        def restore_index():
+            if current_index < len(self.current_annotations):
+                self.current_annotation_index = current_index
+                self.display_current_annotation()
+            print(f"Reloaded: {self.current_sport}/{self.current_event}/{self.current_type}/{self.current_id}.json")
+
+        self.load_data(on_loaded=restore_index)
         
     def on_p_key(self, event):
         """P键事件处理 - 上一个标注"""
@@ -1455,9 +1844,28 @@ class AnnotationReviewer:
         self.swap_bbox_labels()
 
     def on_delete_key(self, event):
-        """Delete键事件处理 - 删除当前标注并重新加载文件"""
+        """Delete键事件处理 - 删除当前标注"""
         self.delete_current_annotation()
 
+    def on_undo_key(self, event):
+        """Ctrl+Z事件处理 - 撤销"""
+        self.undo_edit()
+        return "break"
+
+    def on_redo_key(self, event):
+        """Ctrl+Y / Ctrl+Shift+Z事件处理 - 重做"""
+        self.redo_edit()
+        return "break"
+
+    def on_g_key(self, event):
+        """G键事件处理 - 打开缩略图画廊"""
+        self.open_gallery()
+
+    def on_search_key(self, event):
+        """Ctrl+F事件处理 - 打开全文搜索窗口"""
+        self.open_search()
+        return "break"
+
     def on_t_key(self, event):
         """T键事件处理 - 同步旧版annotation"""
         self.toggle_old_transfer()
@@ -1514,37 +1922,69 @@ class AnnotationReviewer:
             messagebox.showerror("Error", f"Failed to open VSCode: {str(e)}")
 
     def on_u_key(self, event):
-        """U键事件处理 - 跳转到下一个包含未审核标注的文件"""
+        """U键事件处理 - 跳转到下一个包含未审核标注的文件；Shift+U 跳到全局队列中的下一个未审核标注"""
         shift_pressed = bool(event.state & 0x1) if event else False
         if shift_pressed:
-            task_filter = {"Spatial_Temporal_Grounding", "Continuous_Actions_Caption"}
-            self.find_next_unreviewed_file(task_filter=task_filter)
+            self.step_review_queue(forward=True)
         else:
             self.find_next_unreviewed_file()
 
+    def on_queue_prev_key(self, event):
+        """Ctrl+U事件处理 - 全局队列中的上一个未审核标注"""
+        self.step_review_queue(forward=False)
+        return "break"
+
     def annotation_matches_filter(self, annotation, task_filter):
         if task_filter and annotation.get('task_L2') not in task_filter:
             return False
         return not annotation.get('reviewed', False)
 
-    def find_next_unreviewed_file(self, task_filter=None):
-        """查找并跳转到下一个未审核文件（支持 clips 与 frames 自动回退）
+    def file_has_unreviewed(self, json_path, task_filter=None, review_store=None):
+        """判断文件中是否存在符合过滤条件的未审核标注
 
-        - 优先使用当前选择的数据类型（`self.current_type` 或单选框）。
-        - 如果当前类型在某事件下没有文件，自动回退到另一类型。
-        - 载入目标文件时，先设置数据类型，再设置事件与ID，保证列表联动正常。
+        启用状态库时使用其中缓存的文件摘要（按大小/修改时间失效）与审核状态，
+        未改动的文件无需解析JSON。后台线程需传入自己的状态库连接（review_store）。
+        """
+        store = review_store or self.review_store
+        pending = self.save_queue.latest_payload(json_path)
+        if not store or pending is not None:
+            raw = pending if pending is not None else self.read_json_bytes(json_path)
+            annotations = json.loads(raw.decode('utf-8')).get('annotations', [])
+            if store:
+                store.apply_to(self.journal_path_key(json_path), annotations)
+            return any(self.annotation_matches_filter(ann, task_filter) for ann in annotations)
+
+        rel = self.journal_path_key(json_path)
+        stat = json_path.stat()
+        summary = store.file_summary(rel, stat.st_size, stat.st_mtime_ns)
+        if summary is None:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                annotations = json.load(f).get('annotations', [])
+            summary = store.update_file_summary(rel, stat.st_size, stat.st_mtime_ns, annotations)
+        states = store.states_for(rel)
+        for key, task, reviewed in summary:
+            if task_filter and task not in task_filter:
+                continue
+            state = states.get(key)
+            if state and state['reviewed'] is not None:
+                reviewed = bool(state['reviewed'])
+            if not reviewed:
+                return True
+        return False
+
+    def build_review_order(self):
+        """按U键的遍历顺序列出全部文件：(sport, event, data_type, id)
+
+        优先使用当前选择的数据类型（`self.current_type` 或单选框），
+        每个事件下再列出另一类型的文件。
         """
         events = list(self.event_combo['values']) if self.event_combo['values'] is not None else []
-        if not events:
-            messagebox.showinfo("Info", "没有可用事件")
-            return
 
         # 当前首选类型与备用类型
         preferred_type = (self.current_type or self.type_var.get() or 'clips')
         fallback_type = 'frames' if preferred_type == 'clips' else 'clips'
         types_order = [preferred_type, fallback_type]
 
-        # 构建有序文件列表：(sport, event, data_type, id)
         ordered_files = []
         for ev in events:
             try:
@@ -1563,77 +2003,435 @@ class AnnotationReviewer:
                 ids.sort(key=lambda x: (0, int(x)) if x.isdigit() else (1, x))
                 for _id in ids:
                     ordered_files.append((sport, event, data_type, _id))
+        return ordered_files
 
-        if not ordered_files:
-            messagebox.showinfo("Info", "在输出目录未找到任何文件")
-            return
-
-        # 确定当前位置（如果当前文件在列表中，则从其后一个开始）
-        try:
-            cur_tuple = (self.current_sport, self.current_event, (self.current_type or self.type_var.get()), self.current_id)
-        except Exception:
-            cur_tuple = None
+    def current_file_tuple(self):
+        return (self.current_sport, self.current_event, (self.current_type or self.type_var.get()), self.current_id)
 
+    def next_unreviewed_target(self, ordered_files, cur_tuple, task_filter=None, review_store=None):
+        """从 cur_tuple 之后循环查找下一个含未审核标注的文件，找不到返回 None"""
         start_index = 0
         if cur_tuple and cur_tuple in ordered_files:
             start_index = ordered_files.index(cur_tuple) + 1
 
         n = len(ordered_files)
-        found = False
-        target = None
-
-        # 从当前位置循环查找未审核文件
         for i in range(n):
-            idx = (start_index + i) % n
-            sport, event, data_type, _id = ordered_files[idx]
+            sport, event, data_type, _id = ordered_files[(start_index + i) % n]
             json_path = self.output_path / sport / event / data_type / f"{_id}.json"
             try:
-                with open(json_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    annotations = data.get('annotations', [])
-                    if any(self.annotation_matches_filter(ann, task_filter) for ann in annotations):
-                        found = True
-                        target = (sport, event, data_type, _id)
-                        break
+                if self.file_has_unreviewed(json_path, task_filter, review_store):
+                    return (sport, event, data_type, _id)
             except Exception:
                 # 忽略不可读文件
                 continue
+        return None
+
+    def find_next_unreviewed_file(self, task_filter=None):
+        """查找并跳转到下一个未审核文件（支持 clips 与 frames 自动回退）
+
+        - 优先使用当前选择的数据类型（`self.current_type` 或单选框）。
+        - 如果当前类型在某事件下没有文件，自动回退到另一类型。
+        - 载入目标文件时，先设置数据类型，再设置事件与ID，保证列表联动正常。
+        - 后台已预取的下一个目标直接使用，无需重新扫描。
+        """
+        if not self.event_combo['values']:
+            messagebox.showinfo("Info", "没有可用事件")
+            return
+
+        ordered_files = self.build_review_order()
+        if not ordered_files:
+            messagebox.showinfo("Info", "在输出目录未找到任何文件")
+            return
+
+        cur_tuple = self.current_file_tuple()
+        filter_key = frozenset(task_filter) if task_filter else None
+        target = None
+        if self.prefetched_next and self.prefetched_next[:2] == (cur_tuple, filter_key):
+            sport, event, data_type, _id = self.prefetched_next[2]
+            try:
+                if self.file_has_unreviewed(self.output_path / sport / event / data_type / f"{_id}.json", task_filter):
+                    target = self.prefetched_next[2]
+            except Exception:
+                target = None
+        self.prefetched_next = None
+        if target is None:
+            target = self.next_unreviewed_target(ordered_files, cur_tuple, task_filter)
 
-        if not found or not target:
+        if not target:
             messagebox.showinfo("Info", "没有下一个未审核文件")
             return
 
         # 静默保存当前数据（若当前选择完整）
         try:
             if all([self.current_sport, self.current_event, self.current_id, (self.current_type or self.type_var.get())]):
-                self.save_data()
+                self.save_data(silent=True)
         except Exception:
             pass
 
-        # 加载目标文件：先设置类型，再设置事件与ID
+        self.select_file(target)
+
+        def jump_to_first_unreviewed():
+            # 跳到第一个未审核标注
+            for idx, ann in enumerate(self.current_annotations):
+                if self.annotation_matches_filter(ann, task_filter):
+                    self.current_annotation_index = idx
+                    break
+            self.display_current_annotation()
+            # 审核者大概率会再次按U，提前在后台准备下一个文件
+            self.start_prefetch(task_filter)
+
+        self.load_data(on_loaded=jump_to_first_unreviewed)
+
+    def select_file(self, target):
+        """选中目标文件 (sport, event, data_type, id)：先设置类型，再设置事件与ID，保证列表联动正常"""
         sport, event, data_type, _id = target
         self.type_var.set(data_type)
         self.event_var.set(f"{sport}/{event}")
         self.on_event_selected()
         self.id_var.set(_id)
-        self.on_id_selected()
+        self.current_id = _id
+
+    def open_annotation(self, target, index=0, on_opened=None):
+        """打开目标文件并跳到第 index 个标注（文件已打开时不重新加载，沿用已打开的视频/图片）"""
+        if target == self.current_file_tuple() and self.current_annotations:
+            self.current_annotation_index = min(index, len(self.current_annotations) - 1)
+            self.display_current_annotation()
+            if on_opened:
+                on_opened()
+            return
+        self.select_file(target)
 
-        # 跳到第一个未审核标注
-        for idx, ann in enumerate(self.current_annotations):
-            if self.annotation_matches_filter(ann, task_filter):
-                self.current_annotation_index = idx
+        def jump_to_index():
+            if index < len(self.current_annotations):
+                self.current_annotation_index = index
+                self.display_current_annotation()
+            if on_opened:
+                on_opened()
+
+        self.load_data(on_loaded=jump_to_index)
+
+    def queue_position(self):
+        """当前标注在全局队列中的位置 ((sport, event, type, id), 索引)，未打开文件时为 None"""
+        if not all([self.current_sport, self.current_event, self.current_id]) or not self.current_annotations:
+            return None
+        return (self.current_file_tuple(), self.current_annotation_index)
+
+    def queue_item_valid(self, annotation):
+        """到达时再次确认标注仍未审核且符合任务过滤条件（索引可能落后于磁盘与内存）"""
+        if annotation.get('reviewed', False):
+            return False
+        for field in ('task_L1', 'task_L2'):
+            values = self.queue_filters.get(field)
+            if values and annotation.get(field) not in values:
+                return False
+        return True
+
+    def update_queue_status(self):
+        if self.review_queue is None:
+            self.queue_status_label.config(text="")
+            return
+        description = "; ".join(
+            f"{field}={','.join(sorted(values))}" for field, values in self.queue_filters.items() if values
+        ) or "all"
+        self.queue_status_label.config(text=f"Queue: {len(self.review_queue)} unreviewed ({description})")
+
+    def build_review_queue(self, on_ready=None):
+        """后台增量更新数据集索引，并按过滤条件生成全局未审核队列"""
+        # 先把当前文件的修改交给写入队列，索引读到的才是最新内容
+        if self.current_json_path in self.dirty_paths:
+            self.save_data(silent=True)
+        self.queue_generation += 1
+        generation = self.queue_generation
+        self.queue_status_label.config(text="Queue: building...")
+
+        def done(future):
+            if generation != self.queue_generation:
+                return
+            try:
+                self.review_queue = future.result()
+            except Exception as e:
+                self.queue_status_label.config(text="")
+                messagebox.showerror("Error", f"Failed to build review queue: {str(e)}")
+                return
+            self.update_queue_status()
+            if on_ready:
+                on_ready()
+
+        filters = {field: set(values) for field, values in self.queue_filters.items()}
+        self.run_in_background(self.load_review_queue, filters, on_done=done)
+
+    def load_review_queue(self, filters):
+        """后台线程：等待排队的写入落盘，更新索引后查询未审核标注（SQLite连接不跨线程，使用独立连接）"""
+        self.save_queue.flush()
+        index = DatasetIndex(self.index_path)
+        store = ReviewStateStore(self.review_store.db_path) if self.review_store else None
+        try:
+            index.build(self.output_path)
+            overrides = store.reviewed_flags() if store else None
+            return ReviewQueue(index.unreviewed(filters, overrides))
+        finally:
+            index.close()
+            if store:
+                store.close()
+
+    def step_review_queue(self, forward=True):
+        """Shift+U / Ctrl+U：跳到全局队列中的下一个/上一个未审核标注，可跨文件
+
+        队列按位置二分查找，同一文件内的跳转不重新加载视频或图片。
+        """
+        if self.review_queue is None:
+            self.build_review_queue(on_ready=lambda: self.step_review_queue(forward))
+            return
+        position = self.queue_position()
+        while True:
+            item = self.review_queue.next_after(position) if forward else self.review_queue.prev_before(position)
+            if item is None:
+                self.review_queue = None  # 下次按键时重新生成（可能有新的标注）
+                self.update_queue_status()
+                messagebox.showinfo("Info", "队列中没有未审核标注")
+                return
+            target, index = item
+            if target != self.current_file_tuple() or not self.current_annotations:
                 break
-        self.display_current_annotation()
+            # 当前文件内的条目直接用内存中的标注确认
+            if index < len(self.current_annotations) and self.queue_item_valid(self.current_annotations[index]):
+                break
+            self.review_queue.discard(item)
+            position = item
+        self.update_queue_status()
+        queue = self.review_queue
+
+        def arrived():
+            if self.review_queue is not queue:
+                # 加载期间队列已重建（新的过滤条件）或已清空，本次结果不再适用
+                return
+            if index >= len(self.current_annotations) or not self.queue_item_valid(self.current_annotations[index]):
+                # 索引已过期：丢弃该条目，继续找下一个
+                self.review_queue.discard(item)
+                self.step_review_queue(forward)
+                return
+            # 提前在后台加载队列中下一个文件
+            if forward:
+                neighbour = self.review_queue.next_after((target, float('inf')))
+            else:
+                neighbour = self.review_queue.prev_before((target, -1))
+            if neighbour is not None and neighbour[0] != target and neighbour[0] not in self.prefetch_cache:
+                self.start_prefetch(target=neighbour[0])
+
+        self.open_annotation(target, index, on_opened=arrived)
+
+    def open_queue_filter(self):
+        """选择全局审核队列的过滤条件（task_L1、task_L2、sport、event、类型），可选值来自数据集索引"""
+        if self.current_json_path in self.dirty_paths:
+            self.save_data(silent=True)
+        self.run_in_background(self.load_filter_values, on_done=self.show_queue_filter)
+
+    def load_filter_values(self):
+        """后台线程：更新索引并列出各过滤字段的取值"""
+        self.save_queue.flush()
+        index = DatasetIndex(self.index_path)
+        try:
+            index.build(self.output_path)
+            return index.distinct_values()
+        finally:
+            index.close()
+
+    def show_queue_filter(self, future):
+        try:
+            values = future.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to read dataset index: {str(e)}")
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Review Queue Filter")
+        body = ttk.Frame(window)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        listboxes = {}
+        for column, field in enumerate(QUEUE_FILTER_FIELDS):
+            ttk.Label(body, text=field, font=('Arial', 12, 'bold')).grid(row=0, column=column, padx=5, sticky=tk.W)
+            listbox = tk.Listbox(body, selectmode=tk.MULTIPLE, exportselection=False, height=15, width=28,
+                                 font=('Arial', 11))
+            listbox.grid(row=1, column=column, padx=5, sticky=tk.NSEW)
+            selected = self.queue_filters.get(field, set())
+            for i, value in enumerate(values[field]):
+                listbox.insert(tk.END, value)
+                if value in selected:
+                    listbox.selection_set(i)
+            listboxes[field] = listbox
+            body.columnconfigure(column, weight=1)
+        body.rowconfigure(1, weight=1)
+        ttk.Label(window, text="未选择任何值的列不作限制", font=('Arial', 11)).pack(pady=(0, 5))
+
+        def apply():
+            self.queue_filters = {
+                field: {listbox.get(i) for i in listbox.curselection()}
+                for field, listbox in listboxes.items() if listbox.curselection()
+            }
+            window.destroy()
+            self.review_queue = None
+            self.build_review_queue(on_ready=lambda: self.step_review_queue(forward=True))
+
+        def clear():
+            for listbox in listboxes.values():
+                listbox.selection_clear(0, tk.END)
+
+        buttons = ttk.Frame(window)
+        buttons.pack(pady=8)
+        tk.Button(buttons, text="Apply", command=apply, font=('Arial', 12, 'bold'),
+                  bg='#3F51B5', fg='white', width=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Clear", command=clear, font=('Arial', 12), width=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Cancel", command=window.destroy, font=('Arial', 12), width=10).pack(side=tk.LEFT, padx=5)
+
+    def refresh_index_file(self, json_path):
+        """后台线程：文件写入后更新其在数据集索引中的行（含全文索引），搜索无需等待下次整体更新"""
+        try:
+            index = DatasetIndex(self.index_path)
+            try:
+                index.refresh_file(self.output_path, self.journal_path_key(json_path))
+            finally:
+                index.close()
+        except Exception as e:  # 索引只是缓存，下次 build 时会按 mtime 重新读取
+            print(f"Failed to refresh dataset index for {json_path}: {e}")
+
+    def open_search(self):
+        """打开全文搜索窗口（已打开时置前），按问题/query/答案/bbox标签中的词查找全数据集的标注"""
+        if self.current_json_path in self.dirty_paths:
+            self.save_data(silent=True)
+        if self.search_window is not None and self.search_window.window.winfo_exists():
+            self.search_window.focus()
+            return
+        self.search_window = AnnotationSearch(self, self.index_path, self.output_path)
+
+    def open_gallery(self):
+        """打开当前事件的缩略图画廊（frames 中的 Objects_Spatial_Relationships 标注）"""
+        if not self.current_sport or not self.current_event:
+            messagebox.showwarning("Warning", "Please select event first")
+            return
+        # 先把当前文件的修改交给写入队列，画廊读取到的才是最新内容
+        if self.current_json_path in self.dirty_paths:
+            self.save_data(silent=True)
+
+        def overlay(json_path, annotations):
+            if self.review_store:
+                self.review_store.apply_to(self.journal_path_key(json_path), annotations)
+
+        items = collect_gallery_items(self.output_path, self.dataset_path, self.current_sport, self.current_event,
+                                      self.read_json_bytes, overlay=overlay)
+        if not items:
+            messagebox.showinfo("Info", "当前事件没有可在画廊中审核的frames标注")
+            return
+        ThumbnailGallery(self, f"{self.current_sport}/{self.current_event}", items, self.output_path / ".thumbnails")
+
+    def start_prefetch(self, task_filter=None, target=None):
+        """在后台查找当前文件之后的下一个未审核文件（或直接使用给定的 target），
+        并预先加载其JSON、媒体与首个Q窗口的帧"""
+        self.prefetch_generation += 1
+        generation = self.prefetch_generation
+        start = self.current_file_tuple()
+        # 队列预取的目标不能作为U键的"下一个未审核文件"
+        filter_key = 'queue' if target is not None else (frozenset(task_filter) if task_filter else None)
+        ordered_files = self.build_review_order() if target is None else []
+        self.run_in_background(
+            self.prefetch_next_file, ordered_files, start, task_filter,
+            list(self.mot_cache), self.canvas_size(), generation, target,
+            on_done=lambda future: self.store_prefetched(future, generation, start, filter_key),
+        )
+
+    def prefetch_next_file(self, ordered_files, start, task_filter, known_mot, canvas_size, generation, target=None):
+        """后台线程：返回 (目标, (LoadedFile, (大小, 修改时间)) 或 None)"""
+        def is_current():
+            return generation == self.prefetch_generation
+
+        if target is None:
+            # sqlite 连接不能跨线程使用，后台扫描使用独立连接
+            store = ReviewStateStore(self.review_store.db_path) if self.review_store else None
+            try:
+                target = self.next_unreviewed_target(ordered_files, start, task_filter, store)
+            finally:
+                if store:
+                    store.close()
+        if target is None or target == start or not is_current():
+            return target, None
+
+        sport, event, data_type, _id = target
+        json_path = self.output_path / sport / event / data_type / f"{_id}.json"
+        stat = json_path.stat()
+        old_json_path = self.old_output_path / sport / event / data_type / f"{_id}.json"
+        if old_json_path in self.old_cache:
+            old_json_path = None
+        result = load_annotation_file(
+            json_path, data_type, (self.dataset_path, sport, event, _id), self.read_json_bytes,
+            old_json_path, known_mot, should_continue=is_current, frame_budget=self.prefetch_frame_budget,
+            image_target_size=canvas_size, proxy_root=self.proxy_root,
+        )
+        return target, (result, (stat.st_size, stat.st_mtime_ns))
+
+    def store_prefetched(self, future, generation, start, filter_key):
+        """主线程：保存预取结果，最多保留 prefetch_limit 个文件"""
+        if future.cancelled():
+            return
+        try:
+            target, loaded = future.result()
+        except Exception:
+            # 预取失败不影响正常加载（LoadCancelled 同样忽略）
+            return
+        if generation != self.prefetch_generation:
+            if loaded:
+                loaded[0].release()
+            return
+        if target is None:
+            return
+        self.prefetched_next = (start, filter_key, target)
+        if loaded is None:
+            return
+        previous = self.prefetch_cache.pop(target, None)
+        if previous:
+            previous[0].release()
+        self.prefetch_cache[target] = loaded
+        while len(self.prefetch_cache) > self.prefetch_limit:
+            _target, (evicted, _stat) = self.prefetch_cache.popitem(last=False)
+            evicted.release()
+
+    def take_prefetched(self, target, json_path):
+        """取出预取结果；文件在预取后被修改（或有待写入的内容）时丢弃"""
+        entry = self.prefetch_cache.pop(target, None)
+        if entry is None:
+            return None
+        result, stat = entry
+        try:
+            current = json_path.stat()
+            unchanged = (current.st_size, current.st_mtime_ns) == stat
+        except OSError:
+            unchanged = False
+        if not unchanged or json_path in self.dirty_paths or self.save_queue.latest_payload(json_path) is not None:
+            result.release()
+            return None
+        return result
             
     def __del__(self):
         """析构函数"""
         if hasattr(self, 'video_cap') and self.video_cap:
             self.video_cap.release()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI Annotation Review System")
+    parser.add_argument(
+        "--review-store",
+        type=Path,
+        default=None,
+        help="Keep reviewed/retrack flags in this SQLite store instead of rewriting the JSON "
+             "(merge back with: python review_state.py export --store PATH)",
+    )
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    review_store = ReviewStateStore(args.review_store) if args.review_store else None
     root = tk.Tk()
-    app = AnnotationReviewer(root)
+    app = AnnotationReviewer(root, review_store=review_store)
     root.mainloop()
+    if review_store:
+        review_store.close()
 
 if __name__ == "__main__":
     main()
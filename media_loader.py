@@ -0,0 +1,303 @@
+"""Loading stages for the review UI that run on worker threads (no Tk calls in here)."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import cv2
+
+from annotation_utils import annotation_window_start, find_media_file, mot_file_of, parse_mot_file
+from proxy_clips import ProxyCapture, choose_proxy, list_proxies
+
+REDUCED_READ_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def debug_frame_path(annotations: List[Dict[str, Any]], index: int = 0) -> Optional[Path]:
+    """Fallback image location stored by the annotator in ``_debug.frame_path``."""
+    if not annotations or index >= len(annotations) or not isinstance(annotations[index], dict):
+        return None
+    debug = annotations[index].get("_debug")
+    debug_path_str = debug.get("frame_path") if isinstance(debug, dict) else None
+    if not debug_path_str or not isinstance(debug_path_str, str):
+        return None
+    debug_path = Path(debug_path_str).expanduser()
+    return debug_path if debug_path.is_file() else None
+
+
+def image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """``(width, height)`` from the image header, without decoding the pixels."""
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def reduced_read_flag(source_size: Optional[Tuple[int, int]], target_size: Optional[Tuple[int, int]]) -> Tuple[int, int]:
+    """Largest ``(factor, imread flag)`` whose reduced image still covers ``target_size`` when fitted."""
+    if not source_size or not target_size:
+        return 1, cv2.IMREAD_COLOR
+    ratio = min(target_size[0] / source_size[0], target_size[1] / source_size[1])
+    for factor, flag in REDUCED_READ_FLAGS:
+        if factor * ratio <= 1:
+            return factor, flag
+    return 1, cv2.IMREAD_COLOR
+
+
+def read_image(path: Path, target_size: Optional[Tuple[int, int]] = None) -> Tuple[Any, Optional[Tuple[int, int]]]:
+    """Decode ``path`` at the smallest JPEG scale that still fills ``target_size``.
+
+    Returns ``(image, (source_width, source_height))``; annotation
+    coordinates stay in source pixels, so callers scale them by
+    ``image.shape[1] / source_width`` when drawing.  Without ``target_size``
+    the image is decoded at full resolution.
+    """
+    source_size = image_size(path) if target_size else None
+    factor, flag = reduced_read_flag(source_size, target_size)
+    image = cv2.imread(str(path), flag)
+    if image is None and factor != 1:
+        image = cv2.imread(str(path))
+    if image is None:
+        return None, source_size
+    return image, source_size or (image.shape[1], image.shape[0])
+
+
+def decode_frame_image(
+    dataset_path: Path,
+    sport: str,
+    event: str,
+    media_id: str,
+    target_size: Optional[Tuple[int, int]] = None,
+) -> Tuple[Optional[Path], Any, Optional[Tuple[int, int]]]:
+    """Locate and decode the image of one frames task; ``(None, None, None)`` when it is missing."""
+    media_path = find_media_file(dataset_path, sport, event, "frames", media_id)
+    if media_path is None:
+        return None, None, None
+    image, source_size = read_image(media_path, target_size)
+    return media_path, image, source_size
+
+
+def load_mot_files(paths: Iterable[str], known: Iterable[str] = ()) -> Dict[str, Any]:
+    """Parse every MOT file not in ``known``; unreadable files map to ``{}``."""
+    parsed: Dict[str, Any] = {}
+    skip = set(known)
+    for mot_file in paths:
+        if mot_file in skip or mot_file in parsed:
+            continue
+        try:
+            parsed[mot_file] = parse_mot_file(Path(mot_file)) if Path(mot_file).exists() else {}
+        except Exception as exc:
+            print(f"Failed to read MOT file: {exc}")
+            parsed[mot_file] = {}
+    return parsed
+
+
+class LoadCancelled(Exception):
+    """Raised between loading stages once the UI no longer wants the result."""
+
+
+def _check(should_continue: Optional[Callable[[], bool]]) -> None:
+    if should_continue is not None and not should_continue():
+        raise LoadCancelled()
+
+
+class LoadedFile:
+    """Everything ``load_annotation_file`` prepared for one annotation file.
+
+    ``media_error`` is set when the annotations loaded but the video/image did
+    not; the UI shows the annotations anyway, as it always has.
+    """
+
+    def __init__(self, json_path: Path, data_type: str) -> None:
+        self.json_path = json_path
+        self.data_type = data_type
+        self.raw: bytes = b""
+        self.data: Dict[str, Any] = {}
+        self.media_path: Optional[Path] = None
+        self.media_error: Optional[str] = None
+        self.capture: Any = None
+        self.total_frames = 0
+        self.fps = 30.0
+        self.first_frame_index = 0
+        self.first_frame: Any = None
+        self.frames: Dict[int, Any] = {}  # decoded frames by index, starting at first_frame_index
+        self.next_frame_index: Optional[int] = None  # frame the capture returns on its next read()
+        self.proxies: List[Dict[str, Any]] = []  # valid proxy clips of this video (see proxy_clips)
+        self.image: Any = None
+        self.image_size: Optional[Tuple[int, int]] = None  # source (width, height); ``image`` may be reduced
+        self.mot: Dict[str, Any] = {}
+        self.old_data: Any = None
+        self.old_loaded = False
+
+    @property
+    def annotations(self) -> List[Dict[str, Any]]:
+        return self.data.get("annotations", [])
+
+    def release(self) -> None:
+        """Free the capture of a result that will not be used."""
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+def load_annotation_file(
+    json_path: Path,
+    data_type: str,
+    media_dir: Tuple[Path, str, str, str],
+    read_bytes: Callable[[Path], bytes],
+    old_json_path: Optional[Path] = None,
+    known_mot: Iterable[str] = (),
+    should_continue: Optional[Callable[[], bool]] = None,
+    frame_budget: int = 0,
+    image_future: Any = None,
+    image_target_size: Optional[Tuple[int, int]] = None,
+    proxy_root: Optional[Path] = None,
+) -> LoadedFile:
+    """Parse the JSON, locate and open the media, decode the first frame and parse MOT files.
+
+    ``media_dir`` is ``(dataset_path, sport, event, media_id)``.  JSON errors
+    propagate; media problems are reported through ``LoadedFile.media_error``.
+    ``should_continue`` is polled between stages; when it returns False the
+    load stops with :class:`LoadCancelled` and frees what it opened.
+    ``frame_budget`` (bytes) lets a clip decode further frames of the first
+    Q window after the first one, for prefetching.  For frames, ``image_future``
+    is a future of :func:`decode_frame_image` already submitted for this ID and
+    ``image_target_size`` the canvas size used to pick a reduced decode.  With
+    ``proxy_root`` a clip whose first annotation is covered by a proxy clip is
+    opened through :class:`proxy_clips.ProxyCapture`.
+    """
+    result = LoadedFile(json_path, data_type)
+    try:
+        _load_stages(result, media_dir, read_bytes, old_json_path, known_mot, should_continue, frame_budget, image_future,
+                     image_target_size, proxy_root)
+    except BaseException:
+        result.release()
+        raise
+    return result
+
+
+def _load_stages(
+    result: LoadedFile,
+    media_dir: Tuple[Path, str, str, str],
+    read_bytes: Callable[[Path], bytes],
+    old_json_path: Optional[Path],
+    known_mot: Iterable[str],
+    should_continue: Optional[Callable[[], bool]],
+    frame_budget: int,
+    image_future: Any,
+    image_target_size: Optional[Tuple[int, int]],
+    proxy_root: Optional[Path],
+) -> None:
+    json_path, data_type = result.json_path, result.data_type
+    _check(should_continue)
+    result.raw = read_bytes(json_path)
+    result.data = json.loads(result.raw.decode("utf-8"))
+    annotations = result.annotations
+    dataset_path, sport, event, media_id = media_dir
+
+    _check(should_continue)
+    media_path = find_media_file(dataset_path, sport, event, data_type, media_id)
+    if data_type == "clips":
+        if media_path is None:
+            result.media_error = f"Video file not found: {sport}/{event}/clips/{media_id}"
+        else:
+            first = annotations[0] if annotations else {}
+            q_window = first.get("Q_window_frame")
+            capture = None
+            if proxy_root is not None:
+                result.proxies = list_proxies(proxy_root, Path(sport) / event / data_type / f"{media_id}.json", media_path)
+                proxy = choose_proxy(result.proxies, first)
+                if proxy is not None:
+                    capture = ProxyCapture(proxy, media_path)
+                    if not capture.isOpened():  # 代理打不开时回退到原视频
+                        capture.release()
+                        capture = None
+            open_video(
+                result, media_path, annotation_window_start(first),
+                last_frame_index=int(q_window[1]) if q_window else None,
+                frame_budget=frame_budget,
+                capture=capture,
+            )
+        _check(should_continue)
+        mot_paths = [path for path in (mot_file_of(ann) for ann in annotations) if path]
+        result.mot = load_mot_files(mot_paths, known_mot)
+    else:
+        image = None
+        if image_future is not None:
+            try:
+                media_path, image, result.image_size = image_future.result()
+            except Exception:  # evicted from the cache or failed; decode here instead
+                image = None
+        if media_path is None:
+            media_path = debug_frame_path(annotations)
+        if media_path is None:
+            result.media_error = f"Image file not found: {sport}/{event}/frames/{media_id}"
+        else:
+            result.media_path = media_path
+            if image is None:
+                image, result.image_size = read_image(media_path, image_target_size)
+            result.image = image
+            if result.image is None:
+                result.media_error = f"Cannot load image: {media_path}"
+
+    _check(should_continue)
+    if old_json_path is not None:
+        result.old_loaded = True
+        try:
+            if old_json_path.exists():
+                with open(old_json_path, "r", encoding="utf-8") as handle:
+                    result.old_data = json.load(handle)
+        except Exception:
+            result.old_data = None
+
+
+def open_video(
+    result: LoadedFile,
+    video_path: Path,
+    first_frame_index: int,
+    last_frame_index: Optional[int] = None,
+    frame_budget: int = 0,
+    capture: Any = None,
+) -> None:
+    """Open ``video_path`` into ``result`` and decode ``first_frame_index`` for the first paint.
+
+    With a ``frame_budget`` the following frames up to ``last_frame_index``
+    are decoded too, as long as they fit in that many bytes.  ``capture``
+    replaces the plain ``cv2.VideoCapture`` (a proxy clip, for instance).
+    """
+    result.media_path = video_path
+    if capture is None:
+        capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        capture.release()
+        result.media_error = f"Cannot open video file: {video_path}"
+        return
+    result.capture = capture
+    result.total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    result.fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    if first_frame_index:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first_frame_index)
+    ret, frame = capture.read()
+    if not ret:
+        return
+    result.first_frame_index = first_frame_index
+    result.first_frame = frame
+    result.frames[first_frame_index] = frame
+    used = frame.nbytes
+    index = first_frame_index + 1
+    while used + frame.nbytes <= frame_budget and (last_frame_index is None or index <= last_frame_index):
+        ret, frame = capture.read()
+        if not ret:
+            result.next_frame_index = None
+            return
+        result.frames[index] = frame
+        used += frame.nbytes
+        index += 1
+    result.next_frame_index = index
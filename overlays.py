@@ -0,0 +1,100 @@
+"""Annotation overlays drawn on decoded frames, shared by the player, the gallery and batch renders.
+
+Every function draws in place on a BGR image.  Annotation coordinates are in
+source pixels; ``scale`` maps them onto a frame that was decoded or resized
+to a different resolution.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import cv2
+
+STATIC_BOX_COLOR = (0, 255, 255)
+TRACKED_BOX_COLOR = (255, 0, 0)
+MOT_BOX_COLOR = (255, 255, 0)
+
+
+def draw_single_bbox(frame: Any, box: Sequence[float], label: str, color: Tuple[int, int, int], scale: float = 1.0) -> None:
+    x1, y1, x2, y2 = (int(coord * scale) for coord in box)
+    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+    cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+
+def draw_static_boxes(frame: Any, annotation: Dict[str, Any], scale: float = 1.0) -> None:
+    """Draw ``bounding_box`` (single box or list of boxes) and ``first_bounding_box``."""
+    if "bounding_box" in annotation:
+        boxes = annotation["bounding_box"]
+        if (
+            isinstance(boxes, list)
+            and len(boxes) == 4
+            and all(isinstance(coord, (int, float)) for coord in boxes)
+        ):
+            draw_single_bbox(frame, boxes, "Object 1", STATIC_BOX_COLOR, scale)
+        else:
+            for i, box_info in enumerate(boxes):
+                if isinstance(box_info, dict) and "box" in box_info:
+                    label = box_info.get("label", f"Object {i+1}")
+                    draw_single_bbox(frame, box_info["box"], label, STATIC_BOX_COLOR, scale)
+                elif isinstance(box_info, list) and len(box_info) == 4:
+                    draw_single_bbox(frame, box_info, f"Object {i+1}", STATIC_BOX_COLOR, scale)
+    if "first_bounding_box" in annotation:
+        draw_single_bbox(frame, annotation["first_bounding_box"], "Tracked Object", TRACKED_BOX_COLOR, scale)
+
+
+def draw_mot_boxes(frame: Any, boxes: Iterable[Tuple[str, int, int, int, int]], scale: float = 1.0) -> None:
+    """Draw the MOT tracks of one frame, as parsed by ``annotation_utils.parse_mot_file``."""
+    for track_id, x1, y1, x2, y2 in boxes:
+        x1, y1, x2, y2 = (int(coord * scale) for coord in (x1, y1, x2, y2))
+        cv2.rectangle(frame, (x1, y1), (x2, y2), MOT_BOX_COLOR, 2)
+        cv2.putText(frame, f"ID:{track_id}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, MOT_BOX_COLOR, 2)
+
+
+def draw_window_marker(frame: Any, text: str, width: int, flash: bool = False) -> None:
+    """Green banner for BEGIN/POINT labels, red banner for END labels, in the top-left corner."""
+    if "BEGIN" in text or "POINT" in text:
+        fill, border, text_color = (0, 255, 0), (0, 200, 0), (0, 0, 0)
+    elif "END" in text:
+        fill, border, text_color = (0, 0, 255), (0, 0, 200), (255, 255, 255)
+    else:
+        return
+    cv2.rectangle(frame, (15, 15), (width, 120), fill, -1)
+    cv2.rectangle(frame, (10, 10), (width + 5, 125), border, 8)
+    cv2.putText(frame, text.replace("_", " "), (25, 75), cv2.FONT_HERSHEY_SIMPLEX, 2.2, text_color, 4)
+    if flash:
+        cv2.rectangle(frame, (12, 12), (width + 3, 123), (255, 255, 255), 3)
+
+
+def q_window_marker(annotation: Dict[str, Any], frame_index: int) -> Optional[str]:
+    """``"Q_BEGIN"``/``"Q_END"`` when ``frame_index`` is an edge of the question window."""
+    if "Q_window_frame" not in annotation:
+        return None
+    start, end = annotation["Q_window_frame"]
+    if frame_index == start:
+        return "Q_BEGIN"
+    if frame_index == end:
+        return "Q_END"
+    return None
+
+
+def draw_annotation(
+    frame: Any,
+    annotation: Dict[str, Any],
+    frame_index: int,
+    mot_boxes: Iterable[Tuple[str, int, int, int, int]] = (),
+    marker: Optional[str] = None,
+    scale: float = 1.0,
+) -> None:
+    """Everything the player draws on a clip frame: window marker, static boxes and MOT tracks.
+
+    ``marker`` overrides the Q-window marker (the player passes the label of
+    the W-key step being shown).
+    """
+    if marker:
+        draw_window_marker(frame, marker, 350 if "END" in marker else 400, flash=(frame_index // 2) % 2 == 0)
+    else:
+        q_marker = q_window_marker(annotation, frame_index)
+        if q_marker:
+            draw_window_marker(frame, q_marker, 320 if q_marker == "Q_END" else 350)
+    draw_static_boxes(frame, annotation, scale)
+    draw_mot_boxes(frame, mot_boxes, scale)
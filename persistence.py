@@ -0,0 +1,304 @@
+"""Persistence helpers for annotation JSON files: atomic and write-behind writes, edit journal."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import IO, Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+def serialize_json(data: Dict[str, Any]) -> bytes:
+    """Serialise annotation data exactly the way the review UI has always written it."""
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def content_digest(payload: bytes) -> str:
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def file_digest(path: Path) -> Optional[str]:
+    try:
+        with Path(path).open("rb") as handle:
+            return content_digest(handle.read())
+    except OSError:
+        return None
+
+
+def atomic_write_bytes(path: Path, payload: bytes) -> None:
+    """Write ``payload`` to a temp file next to ``path`` and rename it into place."""
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+        try:
+            os.chmod(tmp_name, os.stat(path).st_mode & 0o777)
+        except OSError:
+            pass
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindQueue:
+    """Background writer that coalesces pending payloads per file.
+
+    ``submit`` only records the newest payload for a path; a single worker
+    thread drains the queue with ``write_fn``.  Outcomes are collected for the
+    caller to pick up with ``drain_results`` (the Tk loop polls it), so write
+    failures surface without blocking either side.
+    """
+
+    def __init__(self, write_fn: Callable[[Path, bytes], None] = atomic_write_bytes) -> None:
+        self._write_fn = write_fn
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[Path, Tuple[bytes, str]]" = OrderedDict()
+        self._inflight: Optional[Tuple[Path, bytes, str]] = None
+        self._results: Deque[Tuple[Path, str, Optional[BaseException]]] = deque()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="annotation-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: Path, payload: bytes, digest: str) -> None:
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write queue is closed")
+            self._pending.pop(path, None)
+            self._pending[path] = (payload, digest)
+            self._cond.notify_all()
+
+    def latest_payload(self, path: Path) -> Optional[bytes]:
+        """Return the newest payload for ``path`` that may not be on disk yet."""
+        with self._cond:
+            if path in self._pending:
+                return self._pending[path][0]
+            if self._inflight is not None and self._inflight[0] == path:
+                return self._inflight[1]
+        return None
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending) + (1 if self._inflight is not None else 0)
+
+    def drain_results(self) -> List[Tuple[Path, str, Optional[BaseException]]]:
+        with self._cond:
+            results = list(self._results)
+            self._results.clear()
+        return results
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything submitted so far has been written."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and self._inflight is None, timeout=timeout
+            )
+
+    def close(self, timeout: Optional[float] = None) -> bool:
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        return flushed
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                path, (payload, digest) = self._pending.popitem(last=False)
+                self._inflight = (path, payload, digest)
+            error: Optional[BaseException] = None
+            try:
+                self._write_fn(path, payload)
+            except BaseException as exc:  # reported to the UI thread
+                error = exc
+            with self._cond:
+                self._inflight = None
+                self._results.append((path, digest, error))
+                self._cond.notify_all()
+
+
+class EditJournal:
+    """Append-only JSONL log of annotation mutations for one review session.
+
+    Records are relative to the output root and come in four kinds:
+    ``base``/``commit`` carry the digest a file had when it became dirty or
+    was handed to the writer, ``set``/``insert`` store one annotation
+    snapshot and ``delete`` removes one index.  ``replay_journal`` uses the digests to
+    decide which mutations are still missing from a file on disk.
+
+    The file stays exclusively locked while the session has it open, which
+    is how :func:`stale_journals` tells a live session from a crashed one.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = self.directory / f"session-{stamp}-{os.getpid()}.jsonl"
+        self.record_count = 0
+        self._handle: Optional[IO[str]] = None
+
+    def append(self, record: Dict[str, Any]) -> None:
+        if self._handle is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._handle = self.path.open("w", encoding="utf-8")
+            if not _try_lock(self._handle.fileno()):
+                self._handle.close()
+                self._handle = None
+                raise OSError(f"edit journal {self.path} is locked by another session")
+        self._handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._handle.flush()
+        self.record_count += 1
+
+    def checkpoint(self) -> None:
+        """Drop all records once every journaled edit is durable in the JSON files."""
+        if self._handle is not None and self.record_count:
+            self._handle.seek(0)
+            self._handle.truncate()
+            self._handle.flush()
+        self.record_count = 0
+
+    def close(self, remove: bool = True) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+        if remove:
+            try:
+                self.path.unlink()
+            except OSError:
+                pass
+
+
+def _try_lock(fd: int) -> bool:
+    """Take a non-blocking exclusive lock on ``fd``; the OS drops it when the process exits."""
+    try:
+        if sys.platform == "win32":
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _journal_in_use(path: Path) -> bool:
+    """True while another session holds the lock of the journal at ``path``."""
+    try:
+        fd = os.open(str(path), os.O_RDWR)
+    except OSError:
+        return True  # 无法打开（权限或已被删除）时不当作崩溃遗留
+    try:
+        return not _try_lock(fd)
+    finally:
+        os.close(fd)  # 关闭即释放探测时取得的锁
+
+
+def stale_journals(directory: Path, current: Optional[Path] = None) -> List[Path]:
+    """Return journals left behind by sessions that are no longer running (no longer locked)."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return []
+    stale: List[Path] = []
+    for path in sorted(directory.glob("session-*.jsonl")):
+        if current is not None and path == current:
+            continue
+        if _journal_in_use(path):
+            continue
+        stale.append(path)
+    return stale
+
+
+def read_journal(path: Path) -> List[Dict[str, Any]]:
+    """Read journal records, ignoring a torn last line from a crash."""
+    records: List[Dict[str, Any]] = []
+    with Path(path).open("r", encoding="utf-8") as handle:
+        for line in handle:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+def apply_journal_record(annotations: List[Dict[str, Any]], record: Dict[str, Any]) -> None:
+    op = record.get("op")
+    index = record.get("index")
+    if not isinstance(index, int) or index < 0:
+        return
+    if op == "set" and index < len(annotations):
+        annotations[index] = record.get("annotation")
+    elif op == "insert" and index <= len(annotations):
+        annotations.insert(index, record.get("annotation"))
+    elif op == "delete" and index < len(annotations):
+        annotations.pop(index)
+
+
+def replay_journal(
+    records: Iterable[Dict[str, Any]],
+    root: Path,
+) -> Tuple[List[Tuple[Path, bytes, str]], List[Path]]:
+    """Rebuild files whose journaled edits never reached disk.
+
+    Returns ``(writes, skipped)`` where ``writes`` holds ready-to-write
+    ``(path, payload, digest)`` tuples and ``skipped`` lists files whose
+    on-disk content matches no digest in the journal (changed elsewhere).
+    """
+    per_file: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    for record in records:
+        rel = record.get("path")
+        if isinstance(rel, str):
+            per_file.setdefault(rel, []).append(record)
+
+    writes: List[Tuple[Path, bytes, str]] = []
+    skipped: List[Path] = []
+    for rel, entries in per_file.items():
+        path = Path(root) / rel
+        disk_digest = file_digest(path)
+        start = None
+        for pos, entry in enumerate(entries):
+            if entry.get("op") in ("base", "commit") and entry.get("digest") == disk_digest:
+                start = pos + 1
+        if start is None:
+            skipped.append(path)
+            continue
+        mutations = [entry for entry in entries[start:] if entry.get("op") in ("set", "insert", "delete")]
+        if not mutations:
+            continue
+        try:
+            with path.open("rb") as handle:
+                data = json.loads(handle.read().decode("utf-8"))
+        except (OSError, ValueError):
+            skipped.append(path)
+            continue
+        annotations = data.get("annotations")
+        if not isinstance(annotations, list):
+            skipped.append(path)
+            continue
+        for entry in mutations:
+            apply_journal_record(annotations, entry)
+        payload = serialize_json(data)
+        writes.append((path, payload, content_digest(payload)))
+    return writes, skipped
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""Low-resolution proxy clips of annotation windows for instant playback.
+
+``python proxy_clips.py`` extracts the frame range of every clip annotation
+(its Q/A windows plus a margin) into a small MJPG ``.avi`` next to a JSON
+sidecar describing where the frames came from.  MJPG stores every frame as
+a keyframe, so seeking inside a proxy is free, and OpenCV writes it without
+ffmpeg.  The review UI plays through :class:`ProxyCapture`, which maps
+source frame numbers onto the proxy and falls back to the source video
+outside the proxied range.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+
+from annotation_utils import annotation_window_start, find_clip_files, find_media_file, load_annotation_list, window_frames
+from persistence import atomic_write_bytes, serialize_json
+
+SEEK_GAP = 300  # 相邻片段相距更远时向前seek，否则顺序grab
+PROXY_FOURCC = "MJPG"
+# ProxyCapture / choose_proxy 需要的sidecar字段
+SIDECAR_KEYS = ("start", "end", "fps", "source_frame_count", "source_width", "source_height")
+
+
+def annotation_frame_range(annotation: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """First and last key frame of an annotation (Q/A windows and its playback start)."""
+    frames = [int(frame) for frame, _label in window_frames(annotation)]
+    if "Q_window_frame" in annotation or "A_window_frame" in annotation:
+        frames.append(annotation_window_start(annotation))
+    if not frames:
+        return None
+    return min(frames), max(frames)
+
+
+def proxy_dir(proxy_root: Path, rel: Path) -> Path:
+    return Path(proxy_root) / rel.parent
+
+
+def list_proxies(proxy_root: Path, rel: Path, source_path: Path) -> List[Dict[str, Any]]:
+    """Sidecars of the proxies made from ``source_path`` that still match its size and mtime."""
+    directory = proxy_dir(proxy_root, rel)
+    if not directory.is_dir():
+        return []
+    try:
+        stat = Path(source_path).stat()
+    except OSError:
+        return []
+    proxies = []
+    for sidecar in sorted(directory.glob(f"{rel.stem}_*.json")):
+        try:
+            with sidecar.open("r", encoding="utf-8") as handle:
+                meta = json.load(handle)
+        except (OSError, ValueError):
+            continue
+        if not isinstance(meta, dict) or not all(
+            isinstance(meta.get(key), (int, float)) for key in SIDECAR_KEYS
+        ):
+            continue  # 写了一半或格式不对的sidecar
+        proxy_path = sidecar.with_suffix(".avi")
+        if (
+            meta.get("source_size_bytes") == stat.st_size
+            and meta.get("source_mtime_ns") == stat.st_mtime_ns
+            and proxy_path.exists()
+        ):
+            meta["proxy_path"] = str(proxy_path)
+            proxies.append(meta)
+    return proxies
+
+
+def choose_proxy(proxies: List[Dict[str, Any]], annotation: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Smallest proxy covering the annotation's frame range."""
+    frame_range = annotation_frame_range(annotation)
+    if frame_range is None:
+        return None
+    covering = [meta for meta in proxies if meta["start"] <= frame_range[0] and frame_range[1] <= meta["end"]]
+    return min(covering, key=lambda meta: meta["end"] - meta["start"], default=None)
+
+
+class ProxyCapture:
+    """The subset of ``cv2.VideoCapture`` the player uses, served from a proxy clip.
+
+    Positions, frame counts and fps are those of the source video.  Frames
+    inside the proxied range are decoded from the proxy and resized back to
+    the source resolution, so overlays, MOT boxes and bbox edits keep working
+    in source coordinates; frames outside it are read from the source video,
+    which is only opened when needed.
+    """
+
+    def __init__(self, meta: Dict[str, Any], source_path: Path, source_capture: Any = None) -> None:
+        self.meta = meta
+        self.proxy_path = meta["proxy_path"]
+        self.start = int(meta["start"])
+        self.end = int(meta["end"])
+        self.source_size = (int(meta["source_width"]), int(meta["source_height"]))
+        self.source_path = Path(source_path)
+        self.proxy = cv2.VideoCapture(self.proxy_path)
+        self.source = source_capture
+        self.source_pos: Optional[int] = None
+        self.pos = self.start
+        self.proxy_pos: Optional[int] = 0
+
+    def isOpened(self) -> bool:
+        return self.proxy.isOpened()
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.meta["source_frame_count"])
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.meta["fps"])
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.pos)
+        return 0.0
+
+    def set(self, prop: int, value: float) -> bool:
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self.pos = int(value)
+        return True
+
+    def read(self) -> Tuple[bool, Any]:
+        if self.start <= self.pos <= self.end:
+            offset = self.pos - self.start
+            if self.proxy_pos != offset:
+                self.proxy.set(cv2.CAP_PROP_POS_FRAMES, offset)
+            ret, frame = self.proxy.read()
+            if ret:
+                self.proxy_pos = offset + 1
+                self.pos += 1
+                if (frame.shape[1], frame.shape[0]) != self.source_size:
+                    frame = cv2.resize(frame, self.source_size, interpolation=cv2.INTER_LINEAR)
+                return True, frame
+            self.proxy_pos = None
+        source = self.source_capture()
+        if source is None:
+            return False, None
+        if self.source_pos != self.pos:
+            source.set(cv2.CAP_PROP_POS_FRAMES, self.pos)
+        ret, frame = source.read()
+        if not ret:
+            self.source_pos = None
+            return False, None
+        self.pos += 1
+        self.source_pos = self.pos
+        return True, frame
+
+    def source_capture(self) -> Any:
+        if self.source is None:
+            capture = cv2.VideoCapture(str(self.source_path))
+            if not capture.isOpened():
+                capture.release()
+                return None
+            self.source = capture
+            self.source_pos = 0
+        return self.source
+
+    def detach_source(self) -> Any:
+        """Hand the opened source capture (if any) to another ProxyCapture."""
+        source, self.source = self.source, None
+        return source
+
+    def release(self) -> None:
+        self.proxy.release()
+        if self.source is not None:
+            self.source.release()
+            self.source = None
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Build low-resolution proxy clips of annotation windows")
+    parser.add_argument("--output-root", default=Path("../output"), type=Path, help="Root of the annotation output")
+    parser.add_argument("--dataset-root", default=Path("../Dataset"), type=Path, help="Root of the source videos")
+    parser.add_argument(
+        "--proxy-root",
+        default=None,
+        type=Path,
+        help="Where to write the proxies (default: <output-root>/.proxies, where the review UI looks)",
+    )
+    parser.add_argument("--margin", default=30, type=int, help="Frames kept before and after each window")
+    parser.add_argument("--max-height", default=360, type=int, help="Proxy height in pixels")
+    parser.add_argument("--jobs", default=os.cpu_count() or 1, type=int, help="Clips processed in parallel")
+    parser.add_argument("--force", action="store_true", help="Rebuild proxies that are still valid")
+    return parser.parse_args()
+
+
+def build_clip_proxies(
+    json_path: Path,
+    output_root: Path,
+    dataset_root: Path,
+    proxy_root: Path,
+    margin: int = 30,
+    max_height: int = 360,
+    force: bool = False,
+) -> Tuple[str, int, List[str]]:
+    """Write the missing proxies of one clip in a single forward pass over the source.
+
+    Returns ``(relative json path, proxies written, errors)``.
+    """
+    rel = json_path.relative_to(output_root)
+    sport, event = rel.parts[0], rel.parts[1]
+    try:
+        annotations = load_annotation_list(json_path)
+    except (OSError, ValueError) as exc:
+        return rel.as_posix(), 0, [f"{rel}: {exc}"]
+    source_path = find_media_file(dataset_root, sport, event, "clips", json_path.stem)
+    if source_path is None:
+        return rel.as_posix(), 0, [f"{rel}: video not found"]
+
+    capture = cv2.VideoCapture(str(source_path))
+    if not capture.isOpened():
+        capture.release()
+        return rel.as_posix(), 0, [f"{rel}: cannot open {source_path}"]
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    scale = min(1.0, max_height / height) if height else 1.0
+    size = (max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2))
+
+    existing = [] if force else list_proxies(proxy_root, rel, source_path)
+    ranges = set()
+    errors: List[str] = []
+    for idx, ann in enumerate(annotations):
+        if not isinstance(ann, dict):
+            errors.append(f"{rel} #{idx + 1}: annotation is not an object")
+            continue
+        try:
+            frame_range = annotation_frame_range(ann)
+        except (TypeError, ValueError) as exc:  # 窗口格式错误只跳过该标注
+            errors.append(f"{rel} #{idx + 1}: bad window ({exc})")
+            continue
+        if frame_range is None or (not force and choose_proxy(existing, ann)):
+            continue
+        ranges.add((max(0, frame_range[0] - margin), min(total - 1, frame_range[1] + margin)))
+    ranges = sorted(rng for rng in ranges if rng[0] <= rng[1])
+    if not ranges:
+        capture.release()
+        return rel.as_posix(), 0, errors
+
+    directory = proxy_dir(proxy_root, rel)
+    directory.mkdir(parents=True, exist_ok=True)
+    stat = source_path.stat()
+    writers: Dict[Tuple[int, int], Any] = {}
+    written = 0
+    try:
+        position = 0
+        pending = list(ranges)
+        while pending or writers:
+            # 没有正在写入的片段时，直接跳到下一个片段的起点
+            if not writers and pending and pending[0][0] - position > SEEK_GAP:
+                capture.set(cv2.CAP_PROP_POS_FRAMES, pending[0][0])
+                position = pending[0][0]
+            while pending and pending[0][0] <= position:
+                start, end = pending.pop(0)
+                tmp_path = directory / f".{rel.stem}_{start}-{end}.tmp.avi"
+                writers[(start, end)] = (cv2.VideoWriter(str(tmp_path), cv2.VideoWriter_fourcc(*PROXY_FOURCC), fps, size), tmp_path)
+            if not writers:
+                if not capture.grab():
+                    break
+                position += 1
+                continue
+            ret, frame = capture.read()
+            if not ret:
+                break
+            small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA) if size != (width, height) else frame
+            for (start, end), (writer, tmp_path) in list(writers.items()):
+                writer.write(small)
+                if position >= end:
+                    writer.release()
+                    del writers[(start, end)]
+                    name = f"{rel.stem}_{start}-{end}"
+                    os.replace(tmp_path, directory / f"{name}.avi")
+                    meta = {
+                        "source": str(source_path),
+                        "source_size_bytes": stat.st_size,
+                        "source_mtime_ns": stat.st_mtime_ns,
+                        "source_frame_count": total,
+                        "source_width": width,
+                        "source_height": height,
+                        "fps": fps,
+                        "start": start,
+                        "end": end,
+                        "proxy_width": size[0],
+                        "proxy_height": size[1],
+                    }
+                    atomic_write_bytes(directory / f"{name}.json", serialize_json(meta))
+                    written += 1
+            position += 1
+    finally:
+        capture.release()
+        for (start, end), (writer, tmp_path) in writers.items():
+            writer.release()
+            errors.append(f"{rel}: source ended before frame {end}, proxy {start}-{end} discarded")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+    return rel.as_posix(), written, errors
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    proxy_root = args.proxy_root or args.output_root / ".proxies"
+    clip_files = find_clip_files(args.output_root)
+    total_written = 0
+    all_errors: List[str] = []
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = {
+            pool.submit(
+                build_clip_proxies, path, args.output_root, args.dataset_root, proxy_root,
+                args.margin, args.max_height, args.force,
+            ): path
+            for path in clip_files
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                rel, written, errors = future.result()
+            except Exception as exc:  # 单个文件出错不影响其余文件
+                rel, written, errors = futures[future].relative_to(args.output_root).as_posix(), 0, []
+                errors.append(f"{rel}: {exc}")
+            total_written += written
+            all_errors.extend(errors)
+            print(f"[{done}/{len(futures)}] {rel}: {written} proxies")
+    print(f"Done. Wrote {total_written} proxy clips for {len(clip_files)} clips into {proxy_root}.")
+    for error in all_errors:
+        print(f" ! {error}")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Sidecar SQLite store for review state (reviewed / retrack flags) kept outside the annotation JSON."""
+from __future__ import annotations
+
+import argparse
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from persistence import atomic_write_bytes, serialize_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS review_state (
+    path TEXT NOT NULL,
+    ann_key TEXT NOT NULL,
+    reviewed INTEGER,
+    retrack INTEGER,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (path, ann_key)
+);
+CREATE TABLE IF NOT EXISTS file_summary (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    annotations TEXT NOT NULL
+);
+"""
+
+
+def annotation_key(annotation: Dict[str, Any], index: int) -> str:
+    """Stable key of an annotation inside its file: annotation_id when present, else its index."""
+    ann_id = annotation.get("annotation_id")
+    return f"id:{ann_id}" if ann_id is not None else f"idx:{index}"
+
+
+class ReviewStateStore:
+    """Per-annotation review flags keyed by (relative json path, annotation key).
+
+    Flags are ``None`` when the store has no opinion, in which case the value
+    in the JSON file applies.  ``file_summary`` caches the (key, task_L2,
+    reviewed) triples of each file keyed by size/mtime so review navigation
+    can skip parsing files that did not change.
+    """
+
+    def __init__(self, db_path: Path) -> None:
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def states_for(self, path: str) -> Dict[str, Dict[str, Any]]:
+        rows = self.conn.execute(
+            "SELECT ann_key, reviewed, retrack, updated_at FROM review_state WHERE path = ?",
+            (path,),
+        ).fetchall()
+        return {
+            key: {"reviewed": reviewed, "retrack": retrack, "updated_at": updated_at}
+            for key, reviewed, retrack, updated_at in rows
+        }
+
+    def get(self, path: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self.conn.execute(
+            "SELECT reviewed, retrack, updated_at FROM review_state WHERE path = ? AND ann_key = ?",
+            (path, key),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"reviewed": row[0], "retrack": row[1], "updated_at": row[2]}
+
+    def set_state(
+        self,
+        path: str,
+        key: str,
+        reviewed: Optional[bool] = None,
+        retrack: Optional[bool] = None,
+    ) -> None:
+        """Upsert one annotation; ``None`` leaves the stored flag untouched."""
+        self.conn.execute(
+            """
+            INSERT INTO review_state (path, ann_key, reviewed, retrack, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(path, ann_key) DO UPDATE SET
+                reviewed = COALESCE(excluded.reviewed, reviewed),
+                retrack = COALESCE(excluded.retrack, retrack),
+                updated_at = excluded.updated_at
+            """,
+            (
+                path,
+                key,
+                None if reviewed is None else int(reviewed),
+                None if retrack is None else int(retrack),
+                time.time(),
+            ),
+        )
+        self.conn.commit()
+
+    def rekey_file_states(self, path: str, before: List[Dict[str, Any]], after: List[Dict[str, Any]]) -> None:
+        """Move the rows of one file along with its annotations after an in-memory edit.
+
+        ``before`` and ``after`` are the annotation lists around a delete,
+        restore, replace (T) or undo/redo step; annotations are followed by
+        object identity, and an object replaced in place hands its row to
+        its replacement.  ``idx:`` keys shift with their annotation, rows of
+        deleted annotations are dropped, and a stored flag that the edit
+        changed is updated.  Rows keep their ``updated_at`` unless their
+        flags change, and annotations without a row stay without one (the
+        JSON still decides for them).  When several annotations share a key,
+        the first one keeps the row.
+        """
+        states = self.states_for(path)
+        if not states:
+            return
+        old_keys = {id(ann): annotation_key(ann, idx) for idx, ann in enumerate(before)}
+        after_ids = {id(ann) for ann in after}
+        own_keys = set(old_keys.values()) & set(states)
+        rows: Dict[str, Dict[str, Any]] = {}
+        changed_keys = set()
+        now = time.time()
+        for idx, ann in enumerate(after):
+            source = old_keys.get(id(ann))
+            if source is None and idx < len(before) and id(before[idx]) not in after_ids:
+                source = annotation_key(before[idx], idx)  # 原位替换（T 或撤销替换）
+            if source not in own_keys:
+                continue
+            key = annotation_key(ann, idx)
+            if key in rows:
+                continue
+            state = dict(states[source])
+            for field in ("reviewed", "retrack"):
+                value = bool(ann.get(field, False))
+                if state[field] is not None and bool(state[field]) != value:
+                    state[field] = int(value)
+                    state["updated_at"] = now
+                    changed_keys.add(key)
+            if key != source:
+                changed_keys.add(key)
+            rows[key] = state
+        for key in own_keys - set(rows):
+            self.conn.execute("DELETE FROM review_state WHERE path = ? AND ann_key = ?", (path, key))
+        self.conn.executemany(
+            """
+            INSERT OR REPLACE INTO review_state (path, ann_key, reviewed, retrack, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            [
+                (path, key, rows[key]["reviewed"], rows[key]["retrack"], rows[key]["updated_at"])
+                for key in changed_keys
+            ],
+        )
+        self.conn.commit()
+
+    def apply_to(self, path: str, annotations: List[Dict[str, Any]]) -> int:
+        """Overlay stored flags onto freshly loaded annotations; return how many changed."""
+        states = self.states_for(path)
+        if not states:
+            return 0
+        changed = 0
+        for idx, ann in enumerate(annotations):
+            state = states.get(annotation_key(ann, idx))
+            if not state:
+                continue
+            for field in ("reviewed", "retrack"):
+                if state[field] is not None and ann.get(field, False) != bool(state[field]):
+                    ann[field] = bool(state[field])
+                    changed += 1
+        return changed
+
+    def file_summary(self, path: str, stat_size: int, stat_mtime_ns: int) -> Optional[List[Tuple[str, Any, bool]]]:
+        row = self.conn.execute(
+            "SELECT mtime_ns, size, annotations FROM file_summary WHERE path = ?", (path,)
+        ).fetchone()
+        if row is None or row[0] != stat_mtime_ns or row[1] != stat_size:
+            return None
+        return [tuple(item) for item in json.loads(row[2])]
+
+    def update_file_summary(
+        self,
+        path: str,
+        stat_size: int,
+        stat_mtime_ns: int,
+        annotations: Iterable[Dict[str, Any]],
+    ) -> List[Tuple[str, Any, bool]]:
+        summary = [
+            (annotation_key(ann, idx), ann.get("task_L2"), bool(ann.get("reviewed", False)))
+            for idx, ann in enumerate(annotations)
+        ]
+        self.conn.execute(
+            "INSERT OR REPLACE INTO file_summary (path, mtime_ns, size, annotations) VALUES (?, ?, ?, ?)",
+            (path, stat_mtime_ns, stat_size, json.dumps(summary, ensure_ascii=False)),
+        )
+        self.conn.commit()
+        return summary
+
+    def reviewed_flags(self) -> Dict[Tuple[str, str], bool]:
+        """Every stored reviewed flag keyed by (path, annotation key)."""
+        return {
+            (path, key): bool(reviewed)
+            for path, key, reviewed in self.conn.execute(
+                "SELECT path, ann_key, reviewed FROM review_state WHERE reviewed IS NOT NULL"
+            )
+        }
+
+    def pending_paths(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT path FROM review_state ORDER BY path")]
+
+    def export(self, output_root: Path, paths: Optional[Iterable[str]] = None) -> Tuple[int, int, List[str]]:
+        """Merge stored flags into the JSON files and drop the exported rows.
+
+        Returns ``(files_written, annotations_changed, errors)``.
+        """
+        files_written = 0
+        changed_total = 0
+        errors: List[str] = []
+        for rel in list(paths) if paths is not None else self.pending_paths():
+            json_path = Path(output_root) / rel
+            try:
+                with json_path.open("r", encoding="utf-8") as handle:
+                    data = json.load(handle)
+                annotations = data.get("annotations")
+                if not isinstance(annotations, list):
+                    raise ValueError("missing annotations list")
+                changed = self.apply_to(rel, annotations)
+                if changed:
+                    atomic_write_bytes(json_path, serialize_json(data))
+                    files_written += 1
+                    changed_total += changed
+            except Exception as exc:
+                errors.append(f"{rel}: {exc}")
+                continue
+            self.conn.execute("DELETE FROM review_state WHERE path = ?", (rel,))
+            self.conn.execute("DELETE FROM file_summary WHERE path = ?", (rel,))
+            self.conn.commit()
+        return files_written, changed_total, errors
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Manage the sidecar review-state store")
+    parser.add_argument("command", choices=("export", "status"), help="export: merge flags into JSON files")
+    parser.add_argument("--store", required=True, type=Path, help="Path of the SQLite review-state store")
+    parser.add_argument("--output-root", default=Path("../output"), type=Path, help="Root of the annotation output")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = ReviewStateStore(args.store)
+    try:
+        if args.command == "status":
+            pending = store.pending_paths()
+            print(f"{len(pending)} files have review state not yet exported.")
+            for rel in pending:
+                print(f" - {rel}")
+        else:
+            written, changed, errors = store.export(args.output_root)
+            print(f"Done. Exported {changed} flags into {written} files.")
+            for error in errors:
+                print(f" ! {error}")
+    finally:
+        store.close()
@@ -3,10 +3,18 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
+import sys
+import time
+from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Tuple
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from persistence import atomic_write_bytes, file_digest
 
 TASK_FIELD_RULES: Dict[str, Tuple[str, ...]] = {
     "ScoreboardMultiple": ("question", "answer"),
@@ -14,6 +22,16 @@ TASK_FIELD_RULES: Dict[str, Tuple[str, ...]] = {
     "Continuous_Actions_Caption": ("question",),
 }
 
+# Bump when the matching/transfer rules change so old manifests stop short-circuiting files.
+MANIFEST_VERSION = 1
+OLD_INDEX_VERSION = 1
+SHARD_REPORT_VERSION = 1
+
+# Set per process by ``set_global_index`` (pool initializer) when --global-index is used.
+_GLOBAL_INDEX: Optional[Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]]] = None
+_INDEX_CONTEXT: Optional[str] = None
+_MISSING = object()
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Sync annotations across sports")
@@ -34,18 +52,112 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Only report changes without writing files",
     )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        type=int,
+        help="Number of worker processes (the summary is still printed in walk order)",
+    )
+    parser.add_argument(
+        "--manifest",
+        default=None,
+        type=Path,
+        help="Manifest of file states from the last run (default: <new-root>/.sync_manifest.json, "
+        "or .sync_manifest.IofN.json per shard); "
+        "dry runs read it but never write it",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Ignore the manifest and re-compare every file pair",
+    )
+    parser.add_argument(
+        "--global-index",
+        action="store_true",
+        help="Also match annotations against every file under --old-root (for renumbered or moved clips)",
+    )
+    parser.add_argument(
+        "--index-cache",
+        default=None,
+        type=Path,
+        help="Cache of the per-file old-root index (default: <new-root>/.sync_old_index.json); "
+        "dry runs read it but never write it.  With --shard each shard writes .sync_old_index.IofN.json "
+        "and only reads this file",
+    )
+    parser.add_argument(
+        "--shard",
+        default=None,
+        type=parse_shard,
+        help="Only process shard I of N (\"I/N\", 0-based), partitioned by a hash of the relative path; "
+        "run the other shards on other machines and combine them with 'merge'",
+    )
+    parser.add_argument(
+        "--shard-report",
+        default=None,
+        type=Path,
+        help="Machine-readable JSON summary of this run (default with --shard: <new-root>/.sync_report.IofN.json)",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        type=Path,
+        help="Stream one JSON line per file (annotations, changed fields, seconds) as results come in",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        default=10.0,
+        type=float,
+        help="Seconds between progress lines on stderr (files/s, annotations/s, ETA); 0 disables them",
+    )
     return parser.parse_args()
 
 
+def parse_merge_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="sync_output.py merge",
+        description="Combine the --shard-report files of a sharded run into the summary of a single run",
+    )
+    parser.add_argument("reports", nargs="+", type=Path, help="Shard reports, one per shard")
+    return parser.parse_args(argv)
+
+
+def parse_shard(text: str) -> Tuple[int, int]:
+    """``"I/N"`` -> ``(I, N)`` with ``0 <= I < N``."""
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, N), got {text!r}")
+    return index, count
+
+
+def shard_of(rel_path: str, count: int) -> int:
+    """Stable shard of a posix relative path: the same on every machine and every run."""
+    digest = hashlib.blake2b(rel_path.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def select_shard(paths: List[Path], root: Path, shard: Optional[Tuple[int, int]]) -> List[Tuple[int, Path]]:
+    """``(walk position, path)`` of the files of ``shard`` (all files when ``shard`` is None)."""
+    if shard is None:
+        return list(enumerate(paths))
+    index, count = shard
+    return [
+        (order, path) for order, path in enumerate(paths)
+        if shard_of(path.relative_to(root).as_posix(), count) == index
+    ]
+
+
 def load_json(path: Path) -> Dict[str, Any]:
     with path.open("r", encoding="utf-8") as handle:
         return json.load(handle)
 
 
 def dump_json(path: Path, data: Dict[str, Any]) -> None:
-    with path.open("w", encoding="utf-8") as handle:
-        json.dump(data, handle, ensure_ascii=True, indent=2)
-        handle.write("\n")
+    """Write ``data`` atomically, in the format this script has always written."""
+    payload = json.dumps(data, ensure_ascii=True, indent=2) + "\n"
+    atomic_write_bytes(path, payload.encode("utf-8"))
 
 
 def normalize_text(value: Any) -> str:
@@ -85,11 +197,34 @@ def build_annotation_index(annotations: Iterable[Dict[str, Any]]) -> Dict[Tuple[
     return index
 
 
+def copy_json(value: Any) -> Any:
+    """Structural copy of parsed JSON: dicts and lists are rebuilt, scalars are shared."""
+    if isinstance(value, dict):
+        return {key: copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_json(item) for item in value]
+    return value
+
+
+def changed_fields(current: Dict[str, Any], match: Dict[str, Any]) -> List[str]:
+    """Fields that differ between ``current`` and ``match`` once transferred (``reviewed`` reset)."""
+    fields = [key for key, value in match.items() if key != "reviewed" and current.get(key, _MISSING) != value]
+    fields.extend(key for key in current if key not in match and key != "reviewed")
+    if current.get("reviewed", _MISSING) is not False:
+        fields.append("reviewed")
+    return fields
+
+
 def process_annotations(
     new_annotations: List[Dict[str, Any]],
     index: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]],
+    field_counts: Optional[Dict[str, int]] = None,
 ) -> int:
-    """Apply updates in-place and return number of modified annotations."""
+    """Apply updates in-place and return number of modified annotations.
+
+    Annotations are only copied when a field actually differs; ``field_counts``
+    (when given) counts the annotations each field changed in.
+    """
     modified = 0
     for idx, ann in enumerate(new_annotations):
         task = ann.get("task_L2")
@@ -100,66 +235,486 @@ def process_annotations(
         match = index.get((task, key))
         if not match:
             continue
-        updated = json.loads(json.dumps(match))
+        diff = changed_fields(ann, match)
+        if not diff:
+            continue
+        updated = copy_json(match)
         updated["reviewed"] = False
-        if updated != ann:
-            new_annotations[idx] = updated
-            modified += 1
+        new_annotations[idx] = updated
+        modified += 1
+        if field_counts is not None:
+            for field in diff:
+                field_counts[field] = field_counts.get(field, 0) + 1
     return modified
 
 
+def set_global_index(
+    index: Optional[Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]]],
+    context: Optional[str],
+) -> None:
+    global _GLOBAL_INDEX, _INDEX_CONTEXT
+    _GLOBAL_INDEX = index
+    _INDEX_CONTEXT = context
+
+
+def index_old_file(path: Path) -> List[List[Any]]:
+    """``[[task, key, annotation], ...]`` of one old file, as ``build_annotation_index`` keys it."""
+    try:
+        annotations = load_json(path).get("annotations")
+    except Exception:
+        return []
+    if not isinstance(annotations, list):
+        return []
+    return [[task, list(key), ann] for (task, key), ann in build_annotation_index(annotations).items()]
+
+
+def build_global_index(
+    old_root: Path,
+    cache_path: Path,
+    jobs: int = 1,
+    write_cache: bool = True,
+    seed_path: Optional[Path] = None,
+) -> Tuple[Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]], str, int]:
+    """Index every annotation under ``old_root`` by (task, key).
+
+    Per-file entries are cached in ``cache_path`` keyed by size/mtime, so only
+    changed old files are parsed again (in parallel); ``write_cache=False``
+    (dry runs) only reads the cache.  ``seed_path`` is read, never written,
+    when ``cache_path`` does not exist yet (a shard starting from the
+    unsharded cache).  A key found in several files with
+    different annotations is ambiguous and left out of the index, since a
+    question-only key would otherwise copy an unrelated clip's windows and
+    boxes.  Returns the index, a fingerprint of the old tree used to
+    invalidate manifest entries, and the number of ambiguous keys dropped.
+    """
+    cache = {}
+    for path in (cache_path, seed_path):
+        if path is None or not Path(path).exists():
+            continue
+        try:
+            with Path(path).open("r", encoding="utf-8") as handle:
+                cache = json.load(handle)
+        except (OSError, ValueError):
+            cache = {}
+        if cache.get("version") != OLD_INDEX_VERSION:
+            cache = {}
+        break
+    cached_files = cache.get("files", {})
+
+    files = sorted(collect_files(old_root), key=lambda path: path.relative_to(old_root).as_posix())
+    states: Dict[str, List[int]] = {}
+    entries: Dict[str, List[List[Any]]] = {}
+    to_build: List[Path] = []
+    for path in files:
+        rel = path.relative_to(old_root).as_posix()
+        stat = path.stat()
+        states[rel] = [stat.st_size, stat.st_mtime_ns]
+        cached = cached_files.get(rel)
+        if cached and cached.get("state") == states[rel]:
+            entries[rel] = cached["entries"]
+        else:
+            to_build.append(path)
+
+    if jobs > 1 and len(to_build) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            built = list(pool.map(index_old_file, to_build, chunksize=max(1, len(to_build) // (jobs * 8))))
+    else:
+        built = [index_old_file(path) for path in to_build]
+    for path, file_entries in zip(to_build, built):
+        entries[path.relative_to(old_root).as_posix()] = file_entries
+
+    if write_cache and (to_build or len(cached_files) != len(states)):
+        cache = {
+            "version": OLD_INDEX_VERSION,
+            "files": {rel: {"state": states[rel], "entries": entries[rel]} for rel in states},
+        }
+        atomic_write_bytes(Path(cache_path), json.dumps(cache, ensure_ascii=False).encode("utf-8"))
+
+    index: Dict[Tuple[str, Tuple[str, ...]], Dict[str, Any]] = {}
+    ambiguous = set()
+    for rel in states:
+        for task, key, ann in entries[rel]:
+            index_key = (task, tuple(key))
+            if index_key in ambiguous:
+                continue
+            existing = index.setdefault(index_key, ann)
+            if existing is not ann and existing != ann:
+                ambiguous.add(index_key)
+                del index[index_key]
+    fingerprint = hashlib.blake2b(
+        json.dumps(sorted(states.items())).encode("utf-8"), digest_size=16
+    ).hexdigest()
+    return index, fingerprint, len(ambiguous)
+
+
+def file_state(path: Path, previous: Optional[List[Any]] = None) -> Optional[List[Any]]:
+    """``[size, mtime_ns, digest]`` of ``path``; the digest is reused when size and mtime match ``previous``."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime_ns:
+        return [stat.st_size, stat.st_mtime_ns, previous[2]]
+    return [stat.st_size, stat.st_mtime_ns, file_digest(path)]
+
+
+def same_content(state: Optional[List[Any]], previous: Optional[List[Any]]) -> bool:
+    return bool(state and previous and state[2] is not None and state[2] == previous[2])
+
+
 def process_file(
     new_path: Path,
     new_root: Path,
     old_root: Path,
     dry_run: bool,
-) -> Tuple[int, Path | None]:
-    """Return (num_annotations_modified, Path when file modified)."""
+    previous: Optional[Dict[str, Any]] = None,
+) -> Tuple[int, Path | None, Dict[str, Any] | None, Dict[str, int]]:
+    """Return (num_annotations_modified, Path when file modified, manifest entry, changed field counts).
+
+    ``previous`` is the manifest entry of the last run.  When it recorded no
+    pending changes and neither file's content changed since, the pair is
+    skipped without parsing either file.
+
+    With a global index (``set_global_index``) keys missing from the old file
+    at the same path are looked up across the whole old root, and new files
+    without a counterpart are processed too.
+    """
     rel_path = new_path.relative_to(new_root)
     old_path = old_root / rel_path
-    if not old_path.exists():
-        return (0, None)
+    old_exists = old_path.exists()
+    if not old_exists and _GLOBAL_INDEX is None:
+        return (0, None, None, {})
+
+    previous = previous or {}
+    entry = {
+        "new": file_state(new_path, previous.get("new")),
+        "old": file_state(old_path, previous.get("old")) if old_exists else None,
+        "context": _INDEX_CONTEXT,
+        "outcome": 0,
+    }
+    if (
+        previous.get("outcome") == 0
+        and previous.get("context") == _INDEX_CONTEXT
+        and same_content(entry["new"], previous.get("new"))
+        and (same_content(entry["old"], previous.get("old")) or (entry["old"] is None and previous.get("old") is None))
+    ):
+        return (0, None, entry, {})
 
     try:
         new_data = load_json(new_path)
-        old_data = load_json(old_path)
+        old_data = load_json(old_path) if old_exists else {"annotations": []}
     except Exception:
-        return (0, None)
+        return (0, None, None, {})
 
     annotations = new_data.get("annotations")
     old_annotations = old_data.get("annotations")
     if not isinstance(annotations, list) or not isinstance(old_annotations, list):
-        return (0, None)
+        return (0, None, None, {})
 
     index = build_annotation_index(old_annotations)
-    changed = process_annotations(annotations, index)
+    if _GLOBAL_INDEX is not None:
+        # 同路径旧文件优先，其余键在整个旧数据集中查找
+        index = ChainMap(index, _GLOBAL_INDEX)
+    field_counts: Dict[str, int] = {}
+    changed = process_annotations(annotations, index, field_counts)
 
     if changed and not dry_run:
         dump_json(new_path, new_data)
+        entry["new"] = file_state(new_path)
+    # outcome = changes still pending in the new file (a dry run leaves them in place)
+    entry["outcome"] = changed if dry_run else 0
 
-    return (changed, new_path if changed else None)
+    return (changed, new_path if changed else None, entry, field_counts)
 
 
-if __name__ == "__main__":
+def process_job(
+    new_path: Path,
+    previous: Optional[Dict[str, Any]],
+    new_root: Path,
+    old_root: Path,
+    dry_run: bool,
+) -> Tuple[int, Path | None, Dict[str, Any] | None, Dict[str, int], float]:
+    """``process_file`` with the manifest entry as second positional argument, for the process pool.
+
+    The time spent on the file (in the worker) is appended to the result.
+    """
+    started = time.perf_counter()
+    result = process_file(new_path, new_root, old_root, dry_run, previous)
+    return result + (time.perf_counter() - started,)
+
+
+def default_manifest_path(new_root: Path, shard: Optional[Tuple[int, int]] = None) -> Path:
+    """One manifest per shard, so shards running on different machines never write the same file."""
+    tag = f".{shard[0]}of{shard[1]}" if shard else ""
+    return Path(new_root) / f".sync_manifest{tag}.json"
+
+
+def default_index_cache_path(new_root: Path, shard: Optional[Tuple[int, int]] = None) -> Path:
+    """One old-root index cache per shard, for the same reason as the manifest."""
+    tag = f".{shard[0]}of{shard[1]}" if shard else ""
+    return Path(new_root) / f".sync_old_index{tag}.json"
+
+
+def load_manifest(path: Path) -> Dict[str, Dict[str, Any]]:
+    """Entries keyed by posix relative path; empty when missing, unreadable or from another version."""
+    try:
+        with Path(path).open("r", encoding="utf-8") as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    entries = manifest.get("files")
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_manifest(path: Path, entries: Dict[str, Dict[str, Any]]) -> None:
+    payload = json.dumps({"version": MANIFEST_VERSION, "files": entries}, ensure_ascii=False, sort_keys=True)
+    atomic_write_bytes(Path(path), payload.encode("utf-8"))
+
+
+def collect_files(new_root: Path) -> List[Path]:
+    """All JSON files under ``new_root`` in ``os.walk`` order, skipping dot files and directories."""
+    paths: List[Path] = []
+    for root, dirs, files in os.walk(new_root):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        for filename in files:
+            if filename.endswith(".json") and not filename.startswith("."):
+                paths.append(Path(root) / filename)
+    return paths
+
+
+def write_shard_report(
+    path: Path,
+    shard: Tuple[int, int],
+    dry_run: bool,
+    total_ann: int,
+    matched: List[Tuple[int, str, Dict[str, int]]],
+) -> None:
+    report = {
+        "version": SHARD_REPORT_VERSION,
+        "shard": list(shard),
+        "dry_run": dry_run,
+        "annotations": total_ann,
+        "files": [
+            {"order": order, "path": rel, "fields": field_counts}
+            for order, rel, field_counts in matched
+        ],
+    }
+    atomic_write_bytes(Path(path), (json.dumps(report, ensure_ascii=False, indent=2) + "\n").encode("utf-8"))
+
+
+def merge_shard_reports(paths: List[Path]) -> Tuple[bool, int, List[Tuple[int, str, Dict[str, int]]]]:
+    """Combine shard reports into ``(dry_run, annotations, matched files in walk order)``.
+
+    Raises ``ValueError`` unless the reports cover every shard of one run exactly once.
+    """
+    reports = []
+    for path in paths:
+        with Path(path).open("r", encoding="utf-8") as handle:
+            report = json.load(handle)
+        if report.get("version") != SHARD_REPORT_VERSION:
+            raise ValueError(f"{path}: unsupported report version {report.get('version')!r}")
+        reports.append(report)
+    counts = {report["shard"][1] for report in reports}
+    modes = {report["dry_run"] for report in reports}
+    if len(counts) != 1 or len(modes) != 1:
+        raise ValueError("reports come from runs with different shard counts or dry-run settings")
+    count = counts.pop()
+    seen = sorted(report["shard"][0] for report in reports)
+    if seen != list(range(count)):
+        raise ValueError(f"expected shards 0..{count - 1} once each, got {seen}")
+    matched = sorted(
+        (entry["order"], entry["path"], entry["fields"]) for report in reports for entry in report["files"]
+    )
+    return modes.pop(), sum(report["annotations"] for report in reports), matched
+
+
+def print_summary(total_ann: int, matched: List[Tuple[int, str, Dict[str, int]]], dry_run: bool) -> None:
+    suffix = " (dry-run, no files written)" if dry_run else ""
+    print(f"Done. Updated {total_ann} annotations across {len(matched)} files{suffix}.")
+    if matched:
+        print("Matched files:")
+        for _order, rel, field_counts in matched:
+            fields = ", ".join(f"{field} x{count}" for field, count in sorted(field_counts.items()))
+            print(f" - {rel}: {fields}")
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class RunReporter:
+    """JSONL report stream and periodic progress lines of one run.
+
+    The report starts with a ``start`` record, gets a ``file`` record per
+    processed file as its result arrives and ends with a ``summary`` record,
+    so runs can be followed live (``tail -f``) and compared afterwards.
+    """
+
+    def __init__(self, total: int, report_path: Optional[Path] = None, interval: float = 10.0,
+                 run_info: Optional[Dict[str, Any]] = None) -> None:
+        self.total = total
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_progress = self.started
+        self.files = 0
+        self.annotations = 0
+        self.stream: Optional[IO[str]] = None
+        if report_path is not None:
+            self.stream = Path(report_path).open("w", encoding="utf-8")
+            self.write({"type": "start", "time": time.time(), "files": total, **(run_info or {})})
+
+    def write(self, record: Dict[str, Any]) -> None:
+        if self.stream is not None:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.stream.flush()
+
+    def file_done(self, order: int, rel: str, annotations: int, field_counts: Dict[str, int], written: bool,
+                  seconds: float) -> None:
+        self.files += 1
+        self.annotations += annotations
+        self.write({
+            "type": "file",
+            "order": order,
+            "path": rel,
+            "annotations": annotations,
+            "fields": field_counts,
+            "written": written,
+            "seconds": round(seconds, 6),
+        })
+        now = time.monotonic()
+        if self.interval > 0 and now - self.last_progress >= self.interval:
+            self.last_progress = now
+            print(self.progress_line(now), file=sys.stderr, flush=True)
+
+    def rates(self, now: float) -> Tuple[float, float, float]:
+        elapsed = max(now - self.started, 1e-9)
+        return elapsed, self.files / elapsed, self.annotations / elapsed
+
+    def progress_line(self, now: float) -> str:
+        _elapsed, files_rate, ann_rate = self.rates(now)
+        eta = (self.total - self.files) / files_rate if files_rate else 0.0
+        return (
+            f"[{self.files}/{self.total}] {files_rate:.1f} files/s, {ann_rate:.1f} annotations/s, "
+            f"ETA {format_duration(eta)}"
+        )
+
+    def close(self, matched_files: int) -> None:
+        elapsed, files_rate, ann_rate = self.rates(time.monotonic())
+        self.write({
+            "type": "summary",
+            "files": self.files,
+            "matched_files": matched_files,
+            "annotations": self.annotations,
+            "seconds": round(elapsed, 3),
+            "files_per_second": round(files_rate, 3),
+            "annotations_per_second": round(ann_rate, 3),
+        })
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+def run_files(
+    selected: List[Tuple[int, Path]],
+    new_root: Path,
+    old_root: Path,
+    dry_run: bool,
+    jobs: int = 1,
+    manifest: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Iterator[Tuple[int, Path, Tuple[int, Path | None, Dict[str, Any] | None, Dict[str, int], float]]]:
+    """Yield ``(walk position, path, process_file result)`` as each file finishes.
+
+    With ``jobs > 1`` results arrive in completion order, so one slow file
+    does not hold back the rest; callers sort by walk position for output
+    that must match a serial run.
+    """
+    worker = partial(process_job, new_root=new_root, old_root=old_root, dry_run=dry_run)
+    manifest = manifest or {}
+
+    def previous(path: Path) -> Optional[Dict[str, Any]]:
+        return manifest.get(path.relative_to(new_root).as_posix())
+
+    if jobs <= 1 or len(selected) < 2:
+        for order, path in selected:
+            yield order, path, worker(path, previous(path))
+        return
+    # 全局索引每个进程只传一次
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=set_global_index, initargs=(_GLOBAL_INDEX, _INDEX_CONTEXT)
+    ) as pool:
+        futures = {pool.submit(worker, path, previous(path)): (order, path) for order, path in selected}
+        for future in as_completed(futures):
+            order, path = futures[future]
+            yield order, path, future.result()
+
+
+def main() -> None:
     args = parse_args()
     total_ann = 0
-    matched_files: List[Path] = []
-    for root, _dirs, files in os.walk(args.new_root):
-        for filename in files:
-            if not filename.endswith(".json"):
-                continue
-            new_file_path = Path(root) / filename
-            ann_count, file_path = process_file(
-                new_file_path, args.new_root, args.old_root, args.dry_run
-            )
+    matched_files: List[Tuple[int, str, Dict[str, int]]] = []
+    manifest_path = args.manifest or default_manifest_path(args.new_root, args.shard)
+    manifest = {} if args.full else load_manifest(manifest_path)
+    new_manifest: Dict[str, Dict[str, Any]] = {}
+    if args.global_index:
+        if args.shard:
+            # 各分片只写自己的缓存；共享缓存（或 --index-cache）只读，用作首次运行的起点
+            index_cache = default_index_cache_path(args.new_root, args.shard)
+            seed_cache = args.index_cache or default_index_cache_path(args.new_root)
+        else:
+            index_cache = args.index_cache or default_index_cache_path(args.new_root)
+            seed_cache = None
+        global_index, fingerprint, ambiguous = build_global_index(
+            args.old_root, index_cache, args.jobs, write_cache=not args.dry_run, seed_path=seed_cache
+        )
+        set_global_index(global_index, fingerprint)
+        print(f"Global index: {len(global_index)} annotation keys from {args.old_root}")
+        if ambiguous:
+            print(f"Global index: skipped {ambiguous} keys shared by different annotations in several old files")
+    selected = select_shard(collect_files(args.new_root), args.new_root, args.shard)
+    if args.shard:
+        print(f"Shard {args.shard[0]}/{args.shard[1]}: {len(selected)} files")
+    reporter = RunReporter(
+        len(selected), args.report, args.progress_interval,
+        {"new_root": str(args.new_root), "old_root": str(args.old_root), "dry_run": args.dry_run,
+         "jobs": args.jobs, "shard": list(args.shard) if args.shard else None},
+    )
+    results = run_files(selected, args.new_root, args.old_root, args.dry_run, args.jobs, manifest)
+    try:
+        for order, path, (ann_count, file_path, entry, field_counts, seconds) in results:
+            rel = path.relative_to(args.new_root).as_posix()
             total_ann += ann_count
             if file_path:
-                matched_files.append(file_path)
-    suffix = " (dry-run, no files written)" if args.dry_run else ""
-    total_files = len(matched_files)
-    print(f"Done. Updated {total_ann} annotations across {total_files} files{suffix}.")
-    if matched_files:
-        print("Matched files:")
-        for path in matched_files:
-            rel = path.relative_to(args.new_root)
-            print(f" - {rel}")
+                matched_files.append((order, rel, field_counts))
+            if entry is not None:
+                new_manifest[rel] = entry
+            reporter.file_done(order, rel, ann_count, field_counts, bool(file_path) and not args.dry_run, seconds)
+    finally:
+        reporter.close(len(matched_files))
+    matched_files.sort()
+    if not args.dry_run:
+        save_manifest(manifest_path, new_manifest)
+    report_path = args.shard_report
+    if report_path is None and args.shard:
+        report_path = Path(args.new_root) / f".sync_report.{args.shard[0]}of{args.shard[1]}.json"
+    if report_path is not None:
+        write_shard_report(report_path, args.shard or (0, 1), args.dry_run, total_ann, matched_files)
+    print_summary(total_ann, matched_files, args.dry_run)
+
+
+def merge_main(argv: List[str]) -> None:
+    args = parse_merge_args(argv)
+    try:
+        dry_run, total_ann, matched = merge_shard_reports(args.reports)
+    except (OSError, ValueError, KeyError) as exc:
+        raise SystemExit(f"merge: {exc}")
+    print_summary(total_ann, matched, dry_run)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["merge"]:
+        merge_main(sys.argv[2:])
+    else:
+        main()
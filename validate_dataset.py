@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Headless validation of every annotation under the output root, without starting Tk.
+
+Checks, per ``{sport}/{event}/{clips|frames}/{id}.json``:
+
+- the video or image exists (``Dataset`` layout, or ``_debug.frame_path`` for frames);
+- bounding boxes are four numbers inside the video/image resolution;
+- ``Q_window_frame``/``A_window_frame`` are well formed (``"start-end"``
+  strings, ``start <= end``) and inside the real frame count;
+- MOT files referenced by ``tracking_bboxes`` exist.
+
+Files are checked in parallel worker processes.  Media metadata (frame
+count and resolution) is cached on disk keyed by size and mtime, so repeated
+runs never reopen unchanged videos.  ``--shard I/N`` uses the same stable
+partition as ``sync_output.py``; ``merge`` combines the shard reports.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+
+from annotation_utils import annotation_boxes, find_annotation_files, is_box, mot_file_of, parse_window
+from media_loader import debug_frame_path, find_media_file, image_size
+from persistence import atomic_write_bytes
+from sync_output import parse_shard, select_shard
+
+METADATA_CACHE_VERSION = 1
+ERROR_REPORT_VERSION = 1
+
+# (relative json path, annotation index or -1 for the file, check, message)
+Error = Tuple[str, int, str, str]
+
+# Set per worker process by ``set_metadata_cache`` (pool initializer).
+_METADATA_CACHE: Dict[str, Dict[str, Any]] = {}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Validate every annotation of the output tree")
+    parser.add_argument("--output-root", default=Path("../output"), type=Path, help="Root of the annotation output")
+    parser.add_argument("--dataset-root", default=Path("../Dataset"), type=Path, help="Root of the source media")
+    parser.add_argument("--jobs", default=os.cpu_count() or 1, type=int, help="Files checked in parallel")
+    parser.add_argument(
+        "--metadata-cache",
+        default=None,
+        type=Path,
+        help="Cache of media frame counts and resolutions (default: <output-root>/.media_metadata.json).  "
+        "With --shard each shard writes .media_metadata.IofN.json and only reads this file",
+    )
+    parser.add_argument(
+        "--shard",
+        default=None,
+        type=parse_shard,
+        help="Only check shard I of N (\"I/N\", 0-based), partitioned like sync_output.py --shard",
+    )
+    parser.add_argument(
+        "--errors-json",
+        default=None,
+        type=Path,
+        help="Also write the errors as JSON (default with --shard: <output-root>/.validate_report.IofN.json)",
+    )
+    return parser.parse_args()
+
+
+def parse_merge_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="validate_dataset.py merge",
+        description="Combine the --errors-json files of a sharded run into one sorted report",
+    )
+    parser.add_argument("reports", nargs="+", type=Path, help="Shard reports, one per shard")
+    return parser.parse_args(argv)
+
+
+def set_metadata_cache(cache: Dict[str, Dict[str, Any]]) -> None:
+    global _METADATA_CACHE
+    _METADATA_CACHE = cache
+
+
+def load_metadata_cache(path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        with Path(path).open("r", encoding="utf-8") as handle:
+            cache = json.load(handle)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != METADATA_CACHE_VERSION:
+        return {}
+    return cache.get("media", {})
+
+
+def default_metadata_cache_path(output_root: Path, shard: Optional[Tuple[int, int]] = None) -> Path:
+    """One metadata cache per shard, so shards on different machines never write the same file."""
+    tag = f".{shard[0]}of{shard[1]}" if shard else ""
+    return Path(output_root) / f".media_metadata{tag}.json"
+
+
+def save_metadata_cache(path: Path, media: Dict[str, Dict[str, Any]]) -> None:
+    payload = json.dumps({"version": METADATA_CACHE_VERSION, "media": media}, ensure_ascii=False)
+    atomic_write_bytes(Path(path), payload.encode("utf-8"))
+
+
+def media_metadata(media_path: Path, data_type: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """``({"width", "height", "frames"}, from_cache)``; frames is None for images.
+
+    Returns ``(None, False)`` when the media cannot be opened.
+    """
+    stat = media_path.stat()
+    cached = _METADATA_CACHE.get(str(media_path))
+    if cached and cached.get("size") == stat.st_size and cached.get("mtime_ns") == stat.st_mtime_ns:
+        return cached, True
+    if data_type == "clips":
+        capture = cv2.VideoCapture(str(media_path))
+        try:
+            if not capture.isOpened():
+                return None, False
+            width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            frames: Optional[int] = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        finally:
+            capture.release()
+    else:
+        size = image_size(media_path)
+        if size is None:
+            return None, False
+        (width, height), frames = size, None
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "width": width, "height": height, "frames": frames}, False
+
+
+def check_box(label: str, box: Any, meta: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not is_box(box):
+        return f"{label} is not [x1, y1, x2, y2]: {box!r}"
+    x1, y1, x2, y2 = box
+    if x1 > x2 or y1 > y2:
+        return f"{label} has inverted corners: {box!r}"
+    if meta and (x1 < 0 or y1 < 0 or x2 > meta["width"] or y2 > meta["height"]):
+        return f"{label} {box!r} outside {meta['width']}x{meta['height']}"
+    return None
+
+
+def check_windows(annotation: Dict[str, Any], frame_count: Optional[int]) -> List[Tuple[str, str]]:
+    """``(check, message)`` for malformed or out-of-range Q/A windows."""
+    problems: List[Tuple[str, str]] = []
+    windows: List[Tuple[str, int, int]] = []
+    if "Q_window_frame" in annotation:
+        q_window = annotation["Q_window_frame"]
+        if (
+            isinstance(q_window, list)
+            and len(q_window) == 2
+            and all(isinstance(frame, int) and not isinstance(frame, bool) for frame in q_window)
+        ):
+            windows.append(("Q_window_frame", q_window[0], q_window[1]))
+        else:
+            problems.append(("window_format", f"Q_window_frame is not [start, end]: {q_window!r}"))
+    if "A_window_frame" in annotation:
+        a_windows = annotation["A_window_frame"]
+        if not isinstance(a_windows, list):
+            problems.append(("window_format", f"A_window_frame is not a list: {a_windows!r}"))
+            a_windows = []
+        for i, window in enumerate(a_windows):
+            try:
+                parsed = parse_window(window)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                problems.append(("window_format", f"A_window_frame[{i}] is not \"start-end\" or a frame: {window!r}"))
+                continue
+            windows.append((f"A_window_frame[{i}]", parsed[0], parsed[1]))
+    for label, start, end in windows:
+        if start > end:
+            problems.append(("window_format", f"{label} starts after it ends: {start}-{end}"))
+        elif start < 0:
+            problems.append(("window_range", f"{label} starts before frame 0: {start}-{end}"))
+        elif frame_count and end >= frame_count:
+            problems.append(("window_range", f"{label} ends at {end}, video has {frame_count} frames"))
+    return problems
+
+
+def validate_file(
+    json_path: Path,
+    output_root: Path,
+    dataset_root: Path,
+) -> Tuple[str, List[Error], Optional[Tuple[str, Dict[str, Any]]]]:
+    """Check one annotation file; returns ``(relative path, errors, new metadata cache entry)``."""
+    rel_path = json_path.relative_to(output_root)
+    rel = rel_path.as_posix()
+    sport, event, data_type = rel_path.parts[0], rel_path.parts[1], rel_path.parts[2]
+    try:
+        with json_path.open("r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        annotations = data.get("annotations") if isinstance(data, dict) else None
+    except (OSError, ValueError) as exc:
+        return rel, [(rel, -1, "json", str(exc))], None
+    if not isinstance(annotations, list):
+        return rel, [(rel, -1, "json", "no \"annotations\" list")], None
+
+    errors: List[Error] = []
+    media_path = find_media_file(dataset_root, sport, event, data_type, json_path.stem)
+    if media_path is None and data_type == "frames":
+        media_path = debug_frame_path(annotations)
+    meta, cache_entry = None, None
+    if media_path is None:
+        errors.append((rel, -1, "media_missing", f"no media for {sport}/{event}/{data_type}/{json_path.stem}"))
+    else:
+        meta, cached = media_metadata(media_path, data_type)
+        if meta is None:
+            errors.append((rel, -1, "media_unreadable", f"cannot open {media_path}"))
+        elif not cached:
+            cache_entry = (str(media_path), meta)
+
+    frame_count = meta.get("frames") if meta else None
+    for idx, ann in enumerate(annotations):
+        if not isinstance(ann, dict):
+            errors.append((rel, idx, "json", "annotation is not an object"))
+            continue
+        for label, box in annotation_boxes(ann):
+            problem = check_box(label, box, meta)
+            if problem:
+                errors.append((rel, idx, "bbox", problem))
+        if data_type == "clips":
+            for check, message in check_windows(ann, frame_count):
+                errors.append((rel, idx, check, message))
+        mot_file = mot_file_of(ann)
+        if mot_file and not Path(mot_file).exists():
+            errors.append((rel, idx, "mot_missing", f"MOT file not found: {mot_file}"))
+    return rel, errors, cache_entry
+
+
+def write_error_report(path: Path, shard: Tuple[int, int], files: int, errors: List[Error]) -> None:
+    report = {
+        "version": ERROR_REPORT_VERSION,
+        "shard": list(shard),
+        "files": files,
+        "errors": [list(error) for error in errors],
+    }
+    atomic_write_bytes(Path(path), (json.dumps(report, ensure_ascii=False, indent=2) + "\n").encode("utf-8"))
+
+
+def merge_error_reports(paths: List[Path]) -> Tuple[int, List[Error]]:
+    """``(files checked, errors)`` of a complete set of shard reports; ``ValueError`` otherwise."""
+    reports = []
+    for path in paths:
+        with Path(path).open("r", encoding="utf-8") as handle:
+            report = json.load(handle)
+        if report.get("version") != ERROR_REPORT_VERSION:
+            raise ValueError(f"{path}: unsupported report version {report.get('version')!r}")
+        reports.append(report)
+    counts = {report["shard"][1] for report in reports}
+    if len(counts) != 1:
+        raise ValueError("reports come from runs with different shard counts")
+    count = counts.pop()
+    seen = sorted(report["shard"][0] for report in reports)
+    if seen != list(range(count)):
+        raise ValueError(f"expected shards 0..{count - 1} once each, got {seen}")
+    errors = [tuple(error) for report in reports for error in report["errors"]]
+    return sum(report["files"] for report in reports), errors
+
+
+def print_report(files: int, errors: List[Error]) -> None:
+    """Errors sorted by file, annotation and check, then a count per check."""
+    by_check: Dict[str, int] = {}
+    for rel, idx, check, message in sorted(errors):
+        where = rel if idx < 0 else f"{rel} #{idx + 1}"
+        print(f"{where} [{check}] {message}")
+        by_check[check] = by_check.get(check, 0) + 1
+    print(f"Done. Checked {files} files: {len(errors)} errors.")
+    for check, count in sorted(by_check.items()):
+        print(f" - {check}: {count}")
+
+
+def main() -> int:
+    args = parse_args()
+    if args.shard:
+        # 各分片只写自己的缓存；共享缓存（或 --metadata-cache）只读，用作首次运行的起点
+        cache_path = default_metadata_cache_path(args.output_root, args.shard)
+        seed_path = args.metadata_cache or default_metadata_cache_path(args.output_root)
+        cache = load_metadata_cache(cache_path) if cache_path.exists() else load_metadata_cache(seed_path)
+    else:
+        cache_path = args.metadata_cache or default_metadata_cache_path(args.output_root)
+        cache = load_metadata_cache(cache_path)
+    selected = select_shard(find_annotation_files(args.output_root), args.output_root, args.shard)
+    paths = [path for _order, path in selected]
+
+    errors: List[Error] = []
+    new_entries = 0
+    jobs = max(1, args.jobs)
+    # 缓存每个进程只传一次
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_metadata_cache, initargs=(cache,)) as pool:
+        futures = {pool.submit(validate_file, path, args.output_root, args.dataset_root): path for path in paths}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                rel, file_errors, cache_entry = future.result()
+            except Exception as exc:  # 单个文件出错记为该文件的错误，不中断整个校验
+                rel = futures[future].relative_to(args.output_root).as_posix()
+                file_errors, cache_entry = [(rel, -1, "json", str(exc))], None
+            errors.extend(file_errors)
+            if cache_entry is not None:
+                cache[cache_entry[0]] = cache_entry[1]
+                new_entries += 1
+            if done % 500 == 0 or done == len(futures):
+                print(f"[{done}/{len(futures)}] {len(errors)} errors so far", file=sys.stderr, flush=True)
+    if new_entries:
+        save_metadata_cache(cache_path, cache)
+
+    report_path = args.errors_json
+    if report_path is None and args.shard:
+        report_path = args.output_root / f".validate_report.{args.shard[0]}of{args.shard[1]}.json"
+    if report_path is not None:
+        write_error_report(report_path, args.shard or (0, 1), len(paths), sorted(errors))
+    print_report(len(paths), errors)
+    return 1 if errors else 0
+
+
+def merge_main(argv: List[str]) -> int:
+    args = parse_merge_args(argv)
+    try:
+        files, errors = merge_error_reports(args.reports)
+    except (OSError, ValueError, KeyError) as exc:
+        raise SystemExit(f"merge: {exc}")
+    print_report(files, errors)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["merge"]:
+        sys.exit(merge_main(sys.argv[2:]))
+    sys.exit(main())